@@ -0,0 +1,79 @@
+"""
+JSON 序列化工具模块
+优先使用 orjson（C 扩展，序列化/解析更快），未安装时回退到标准库 json
+输出语义与 json.dumps(..., ensure_ascii=False) 保持一致
+"""
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # ijson 为可选依赖（仅用于流式读取大文件中的单个元素）
+    ijson = None
+
+# 超过该大小的 JSON 在工作线程中解析/序列化，避免阻塞事件循环
+JSON_OFFLOAD_THRESHOLD = 16 * 1024
+JSON_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="json")
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """序列化为 UTF-8 字节串（indent=True 时使用 2 空格缩进）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """序列化为字符串（等价于 json.dumps(obj, ensure_ascii=False)）"""
+    if orjson is not None:
+        return dumps_bytes(obj, indent=indent).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """解析 JSON 字符串或字节串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+async def loads_async(data: Union[str, bytes, bytearray]) -> Any:
+    """解析 JSON；大于阈值时放到 JSON_POOL 中执行"""
+    if len(data) <= JSON_OFFLOAD_THRESHOLD:
+        return loads(data)
+    return await asyncio.get_running_loop().run_in_executor(JSON_POOL, loads, data)
+
+
+async def dumps_bytes_async(obj: Any, indent: bool = False, size_hint: int = 0) -> bytes:
+    """序列化为字节串；size_hint（预估大小）大于阈值时放到 JSON_POOL 中执行"""
+    if size_hint <= JSON_OFFLOAD_THRESHOLD:
+        return dumps_bytes(obj, indent=indent)
+    return await asyncio.get_running_loop().run_in_executor(JSON_POOL, dumps_bytes, obj, indent)
+
+
+def load_array_item(fp: BinaryIO, key: str, index: int) -> Optional[Any]:
+    """
+    读取 JSON 文件中 obj[key][index] 元素（fp 需以二进制模式打开）
+
+    安装 ijson 时流式解析，读到目标元素即停止，内存只保留单个元素；
+    否则回退为整份解析。
+    """
+    if index < 0:
+        return None
+    if ijson is not None:
+        for i, item in enumerate(ijson.items(fp, f"{key}.item")):
+            if i == index:
+                return item
+        return None
+    items = loads(fp.read()).get(key, [])
+    return items[index] if index < len(items) else None
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
@@ -220,6 +221,24 @@ class BatchTask(SQLModel, table=True):
     publish_date: Optional[str] = Field(default=None, max_length=20)
 
 
+class SegmentHistory(SQLModel, table=True):
+    """段视频归档历史表（每次重新生成前归档一行，替代 BatchTask.segment_history JSON 列）"""
+    __tablename__ = "segment_history"
+    __table_args__ = (Index("ix_segment_history_lookup", "project_id", "segment_index", "archived_at"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: str = Field(max_length=50)  # 关联 BatchTask.project_id
+    segment_index: int
+
+    video_url: Optional[str] = Field(default=None)
+    first_frame_url: Optional[str] = Field(default=None)
+    last_frame_url: Optional[str] = Field(default=None)
+    local_video_path: Optional[str] = Field(default=None)
+
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+    reason: str = Field(default="regenerate", max_length=20)  # regenerate, edit, delete
+
+
 # ============================================================================
 # Epic 1: 工作流引擎数据模型 (BE-1.1)
 # ============================================================================
@@ -3,26 +3,48 @@
 提供飞书多维表格集成的批量视频生成功能
 """
 import os
+import re
 import json
+import html
+import time
+import errno
+import string
 import asyncio
 import uuid
 import logging
+import traceback
+from collections import Counter, defaultdict
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Set, Tuple
+from contextlib import asynccontextmanager
+from urllib.parse import unquote, parse_qs
+import aiofiles
+import httpx
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 
 from sqlmodel import Session, select
 
-from paretoai.services.feishu_bitable import FeishuBitableService, parse_feishu_record_to_task
+from paretoai.services.feishu_bitable import (
+    FeishuBitableService,
+    parse_feishu_records_to_tasks,
+    feishu_date_now_ms,
+    awrite_project_meta,
+)
 from paretoai.services.storyboard_service import get_storyboard_service
 from paretoai.services.video_segment_service import get_video_segment_service
 from paretoai.services.api_job_store import get_api_job_store
 from paretoai.services.feishu_drive_service import FeishuDriveService
 from paretoai.services.feishu_user_oauth_store import get_feishu_user_oauth_store
+from paretoai.services.project_lock_service import get_project_lock_service
+from paretoai.services.project_path_service import get_project_path_service
+from paretoai.services.task_status_service import get_task_status_service
+from paretoai.services.archive_service import get_archive_service
 from paretoai.models import BatchTask
-from paretoai.db import engine
+from paretoai.db import engine, session_scope
+from paretoai import jsonutil
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +53,26 @@ router = APIRouter(prefix="/api/batch", tags=["batch"])
 # 存储服务实例（简化实现，生产环境应该用 Redis 或数据库）
 _feishu_services: dict = {}
 
+# 后台任务强引用：事件循环只持有任务的弱引用，不保存会导致任务在执行中被回收
+_background_tasks: Set[asyncio.Task] = set()
+
 # 连接状态持久化文件路径
 FEISHU_CONNECTION_STATE_FILE = Path("./data/feishu_connections.json")
 
+# 上传文件分块写盘大小（1 MiB）
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# 调试开关：批量保存提示词后回读磁盘文件校验（默认关闭）
+BATCH_SAVE_VERIFY_ON_DISK = os.getenv("BATCH_SAVE_VERIFY_ON_DISK", "false").lower() == "true"
+
+# 同步到云空间时同时处理的最大项目数
+DRIVE_SYNC_CONCURRENCY = 8
+
+# 进行中的任务状态（分镜生成 / 分段生成 / 合并）
+IN_PROGRESS_STATUSES = frozenset(
+    {f"generating_segment_{i}" for i in range(32)} | {"storyboard_generating", "merging"}
+)
+
 
 # ========== 请求模型 ==========
 
@@ -129,6 +168,188 @@ class SyncToDriveRequest(BaseModel):
 
 # ========== 辅助函数 ==========
 
+def _spawn_background(coro) -> asyncio.Task:
+    """创建后台任务：保留强引用直到结束，未处理的异常记录到日志"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"后台任务异常: {task.exception()!r}", exc_info=task.exception())
+
+
+def _list_file_names(directory: Path) -> set:
+    """一次 scandir 列出目录下的文件名（目录不存在时返回空集合）"""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+# 硬链接不可用时回退到 rename 的错误码（跨设备 / 文件系统不支持硬链接）
+_LINK_FALLBACK_ERRNOS = frozenset({errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK})
+
+
+def _backup_file(src: Path, dst: Path) -> None:
+    """
+    将文件移动到备份位置
+
+    先建立硬链接再删除原文件：零拷贝，且任何时刻文件至少存在于一处；
+    跨设备或文件系统不支持硬链接时回退到 os.replace
+    """
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in _LINK_FALLBACK_ERRNOS:
+            raise
+        os.replace(src, dst)
+        return
+    os.unlink(src)
+
+
+@asynccontextmanager
+async def _hold_project_lock(project_id: str, operation: str, resources: List[Optional[str]]):
+    """持有项目（段）锁直到退出上下文；获取失败时返回 409"""
+    lock_service = get_project_lock_service()
+    success, error_msg = await lock_service.try_lock_many(project_id, resources, operation=operation)
+    if not success:
+        raise HTTPException(status_code=409, detail=error_msg)
+    try:
+        yield lock_service
+    finally:
+        await lock_service.release_locks(project_id, resources)
+
+
+async def _read_storyboard_file(path: Path) -> Tuple[dict, int]:
+    """异步读取本地 storyboard.json，返回 (数据, 文件字节数)；大文件在 JSON 线程池中解析"""
+    async with aiofiles.open(path, "rb") as f:
+        raw = await f.read()
+    return await jsonutil.loads_async(raw), len(raw)
+
+
+async def _write_storyboard_file(path: Path, data: dict, fsync: bool = True, size_hint: int = 0) -> None:
+    """
+    异步原子写入本地 storyboard.json：先写同目录临时文件再 os.replace，崩溃或并发读取时不会看到写了一半的文件
+
+    fsync=True 时替换前强制刷新到磁盘；size_hint 为预估大小，超过阈值时在线程池中序列化
+    """
+    content = await jsonutil.dumps_bytes_async(data, indent=True, size_hint=size_hint)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(content)
+            if fsync:
+                await f.flush()
+                await asyncio.to_thread(os.fsync, f.fileno())
+        await asyncio.to_thread(os.replace, tmp_path, path)
+    except BaseException:
+        # 失败或被取消时清理临时文件，原 storyboard.json 保持不变
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def _coerce_int(value, default: int = 7) -> int:
+    """将飞书字段值（int / 数字字符串 / 空值）转换为整数，无法转换时返回默认值"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _scan_archive_dir(archive_dir: Path) -> Optional[List[dict]]:
+    """
+    扫描归档目录结构（archive/segment_N/{timestamp}/files），目录不存在时返回 None
+
+    使用 os.scandir：DirEntry 自带文件类型信息，is_dir()/is_file() 通常无需额外 stat
+    """
+    try:
+        with os.scandir(archive_dir) as it:
+            segment_entries = sorted(
+                (e for e in it if e.name.startswith("segment_") and e.is_dir()),
+                key=lambda e: e.name
+            )
+    except FileNotFoundError:
+        return None
+
+    archives = []
+    for segment_entry in segment_entries:
+        with os.scandir(segment_entry.path) as it:
+            timestamp_entries = sorted(
+                (e for e in it if e.is_dir()),
+                key=lambda e: e.name,
+                reverse=True
+            )
+        segment_archives = []
+        for timestamp_entry in timestamp_entries:
+            with os.scandir(timestamp_entry.path) as it:
+                files = [e.name for e in it if e.is_file()]
+            segment_archives.append({
+                "timestamp": timestamp_entry.name,
+                "files": files
+            })
+        archives.append({
+            "segment": segment_entry.name,
+            "versions": segment_archives
+        })
+    return archives
+
+
+def _load_storyboard(storyboard_path: Path) -> dict:
+    """读取本地 storyboard.json"""
+    if not storyboard_path.exists():
+        raise Exception(f"storyboard.json 不存在: {storyboard_path}")
+
+    with open(storyboard_path, "rb") as f:
+        return jsonutil.loads(f.read())
+
+
+def _apply_prompt_edit(storyboard_data: dict, item: BatchSavePromptsItem) -> str:
+    """将提示词编辑应用到内存中 storyboard 的指定段，返回重新构建的 prompt"""
+    storyboards = storyboard_data.setdefault("storyboards", [])
+
+    # 验证 segment_index
+    if item.segment_index < 0 or item.segment_index >= len(storyboards):
+        raise Exception(f"无效的分段索引 (segment_index={item.segment_index}, 总段数={len(storyboards)})")
+
+    # 更新指定段的字段
+    segment = storyboards[item.segment_index]
+    segment["crucial"] = item.crucial
+    segment["action"] = item.action
+    segment["sound"] = item.sound
+    segment["negative_constraint"] = item.negative_constraint
+
+    # 更新中文字段（如果提供）
+    if item.crucial_zh:
+        segment["crucial_zh"] = item.crucial_zh
+    if item.action_zh:
+        segment["action_zh"] = item.action_zh
+    if item.sound_zh:
+        segment["sound_zh"] = item.sound_zh
+    if item.negative_constraint_zh:
+        segment["negative_constraint_zh"] = item.negative_constraint_zh
+
+    # 重新构建 prompt
+    new_prompt = _construct_full_prompt(segment)
+    segment["prompt"] = new_prompt
+    return new_prompt
+
+
+def _verify_saved_prompt(storyboard_path: Path, segment_index: int, expected_prompt: str) -> None:
+    """回读磁盘上的 storyboard.json，校验指定段的 prompt（调试用）"""
+    with open(storyboard_path, "rb") as f:
+        verify_segment = jsonutil.load_array_item(f, "storyboards", segment_index) or {}
+    if verify_segment.get("prompt") != expected_prompt:
+        raise Exception("保存验证失败：磁盘上的 prompt 与预期不符")
+
+
 def _load_feishu_connections():
     """从文件加载飞书连接状态"""
     global _feishu_services
@@ -197,7 +418,7 @@ async def _restore_feishu_connections():
                     tenant_access_token = await service._get_tenant_access_token()
                     # 更新服务实例的token
                     service._tenant_access_token = tenant_access_token
-                    service._token_expires_at = datetime.now().timestamp() + 7200
+                    service._token_expires_at = time.monotonic() + 7200
                     # 关键修复：直接更新 saved_connections，这样后续保存才会生效
                     saved_connections[table_id]["tenant_access_token"] = tenant_access_token
                     logger.info(f"✅ 成功刷新 token: table_id={table_id}, token={tenant_access_token[:30]}...")
@@ -220,6 +441,7 @@ async def _restore_feishu_connections():
                 logger.warning(f"✅ 成功恢复飞书连接: table_id={table_id}")
             except Exception as e:
                 logger.warning(f"⚠️ 连接已失效，跳过恢复: table_id={table_id}, error={e}")
+                await service.aclose()
         except Exception as e:
             logger.error(f"恢复连接失败: table_id={table_id}, error={e}")
 
@@ -250,14 +472,9 @@ def get_app_token(table_id: str) -> str:
 async def _auto_update_generated_videos(service: FeishuBitableService, app_token: str, table_id: str):
     """连接成功后自动更新已生成的视频信息（V2 结构：从数据库获取项目列表）"""
     try:
-        import traceback
         logger.warning("开始自动更新已生成的视频信息...")  # 使用 WARNING 级别确保输出
         logger.warning(f"调用栈:\n{''.join(traceback.format_stack()[-5:-1])}")  # 打印调用栈
         # 从数据库获取所有项目（V2 结构）
-        from paretoai.services.project_path_service import get_project_path_service
-        from sqlmodel import select
-        from paretoai.models import BatchTask
-        from paretoai.db import engine
 
         path_service = get_project_path_service()
 
@@ -454,7 +671,6 @@ async def _auto_update_generated_videos(service: FeishuBitableService, app_token
                 
                 # 同步 updated_at 到飞书（日期字段用毫秒时间戳）
                 if "updated_at" in field_name_map or "updated_at" in existing_fields:
-                    from paretoai.services.feishu_bitable import feishu_date_now_ms
                     final_update_fields["updated_at"] = feishu_date_now_ms()
                 
                 # 只更新存在的字段
@@ -530,7 +746,11 @@ async def connect_feishu(req: ConnectFeishuRequest):
 
         # 验证连接：通过获取记录列表来验证（get_table_info endpoint 不存在）
         # 获取记录数来验证连接和权限
-        records = await service.list_records(app_token, table_id, page_size=1)
+        try:
+            records = await service.list_records(app_token, table_id, page_size=1)
+        except Exception:
+            await service.aclose()
+            raise
         record_count = records.get("total", 0)
         
         # 尝试获取表格名称（如果 records 中有 table 信息）
@@ -538,7 +758,10 @@ async def connect_feishu(req: ConnectFeishuRequest):
         # 由于无法直接获取表格信息，我们使用 app_token 作为标识
         # 或者可以从第一条记录中推断（如果有的话）
 
-        # 存储服务实例
+        # 存储服务实例（替换旧连接时关闭其 HTTP 会话）
+        previous = _feishu_services.get(req.table_id)
+        if previous and previous["service"] is not service:
+            await previous["service"].aclose()
         _feishu_services[req.table_id] = {
             "service": service,
             "app_token": app_token,
@@ -586,8 +809,6 @@ async def _ensure_opening_image_downloaded(
         return None
 
     # 使用 ProjectPathService 获取项目路径（V2 结构）
-    from paretoai.services.project_path_service import get_project_path_service
-    import os
     path_service = get_project_path_service()
     project_storage_path = path_service.get_project_storage_path(project_id)
 
@@ -611,7 +832,6 @@ async def _ensure_opening_image_downloaded(
     # 需要下载：提取原始飞书 URL（如果 opening_image_url 是代理路径）
     original_url = opening_image_url
     if opening_image_url.startswith("/proxy/image?url="):
-        from urllib.parse import unquote, parse_qs
         parsed = parse_qs(opening_image_url.split("?")[1])
         original_url = unquote(parsed.get("url", [""])[0])
 
@@ -619,7 +839,6 @@ async def _ensure_opening_image_downloaded(
     try:
         if "open.feishu.cn/open-apis/drive/v1/medias" in original_url:
             # 飞书附件，使用 download_attachment
-            import re
             match = re.search(r'/medias/([^/]+)/', original_url)
             if match:
                 file_token = match.group(1)
@@ -634,7 +853,6 @@ async def _ensure_opening_image_downloaded(
                 logger.warning(f"无法从飞书 URL 中提取 file_token: {original_url[:100]}")
         else:
             # 普通 HTTP URL，直接下载
-            import httpx
             async with httpx.AsyncClient(timeout=30) as client:
                 response = await client.get(original_url)
                 response.raise_for_status()
@@ -694,8 +912,6 @@ async def get_tasks_local(table_id: str):
     这是前端日常刷新使用的接口，不调用飞书API
     """
     try:
-        import os
-        from pathlib import Path
         
         # 从数据库查询所有任务
         with Session(engine) as session:
@@ -809,7 +1025,7 @@ async def get_tasks(table_id: str):
         records = await service.get_all_records(app_token, actual_table_id)
 
         # 转换为任务格式
-        tasks = [parse_feishu_record_to_task(r) for r in records]
+        tasks = await asyncio.to_thread(parse_feishu_records_to_tasks, records)
         
         # 在后台异步下载 opening_image（不阻塞返回）
         async def download_opening_images():
@@ -827,7 +1043,6 @@ async def get_tasks(table_id: str):
             
             # 并发下载（限制并发数避免过载）
             if download_tasks:
-                import asyncio
                 semaphore = asyncio.Semaphore(5)  # 最多5个并发下载
                 async def download_with_limit(task):
                     async with semaphore:
@@ -836,7 +1051,7 @@ async def get_tasks(table_id: str):
                 await asyncio.gather(*[download_with_limit(t) for t in download_tasks], return_exceptions=True)
         
         # 异步执行下载（不等待完成，立即返回任务列表）
-        asyncio.create_task(download_opening_images())
+        _spawn_background(download_opening_images())
         
         # 过滤：只返回有首帧图片的任务（避免显示空任务）
         tasks = [t for t in tasks if t.get("openingImageUrl")]
@@ -933,7 +1148,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
 
                     # 生成 project_id（如果已有则复用，否则生成新的）
                     # 【根因修复】优先从数据库查找是否已有项目与此飞书记录关联
-                    from paretoai.services.task_status_service import get_task_status_service
                     task_service = get_task_status_service()
                     
                     existing_project_id = None
@@ -977,7 +1191,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                         logger.info(f"生成新 project_id: {project_id}")
 
                     # 使用 ProjectPathService 创建项目目录并注册到数据库（V2 结构）
-                    from paretoai.services.project_path_service import get_project_path_service
                     path_service = get_project_path_service()
 
                     # 获取 template_id
@@ -997,7 +1210,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
 
                     # 【双重保障】对于已存在的项目，确保飞书关联信息是最新的
                     try:
-                        from paretoai.services.task_status_service import get_task_status_service
                         task_service = get_task_status_service()
                         task_service.ensure_feishu_association(
                             project_id=project_id,
@@ -1035,7 +1247,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                         try:
                             if "open.feishu.cn/open-apis/drive/v1/medias" in opening_image:
                                 # 飞书附件，使用 download_attachment
-                                import re
                                 match = re.search(r'/medias/([^/]+)/', opening_image)
                                 if match:
                                     file_token = match.group(1)
@@ -1049,7 +1260,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                                     raise ValueError("无法从飞书 URL 中提取 file_token")
                             else:
                                 # 普通 HTTP URL，直接下载
-                                import httpx
                                 async with httpx.AsyncClient(timeout=30) as client:
                                     response = await client.get(opening_image)
                                     response.raise_for_status()
@@ -1067,11 +1277,7 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                     # 调用分镜生成服务
                     scene_desc = fields.get("scene_description", "宠物吃播")
                     # 确保 segment_count 是整数
-                    segment_count = fields.get("segment_count", 7)
-                    if isinstance(segment_count, str):
-                        segment_count = int(segment_count) if segment_count.isdigit() else 7
-                    elif not isinstance(segment_count, int):
-                        segment_count = 7
+                    segment_count = _coerce_int(fields.get("segment_count"))
                     # 限制范围在 3-8
                     segment_count = max(3, min(8, segment_count))
 
@@ -1102,7 +1308,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                         }
 
                     # 【V2 核心修复】优先写入数据库（数据库是唯一事实来源）
-                    from paretoai.services.task_status_service import get_task_status_service
                     task_service = get_task_status_service()
                     
                     # 保存分镜到数据库和本地文件
@@ -1136,8 +1341,7 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                         logger.info(f"✅ 分镜脚本已保存到本地: {storyboard_file}")
                         
                         # 更新本地 meta.json：状态、错误信息、更新时间
-                        from paretoai.services.feishu_bitable import write_project_meta
-                        write_project_meta(
+                        await awrite_project_meta(
                             project_id=project_id,
                             status="storyboard_ready",
                             error_message="",  # 清空错误信息
@@ -1150,7 +1354,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                     
                     # 回写到飞书（次要操作：通知，失败不阻断）
                     try:
-                        from paretoai.services.feishu_bitable import feishu_date_now_ms
                         update_fields = {
                             "project_id": project_id,
                             "storyboard_json": json.dumps(storyboard),
@@ -1186,7 +1389,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                     # 【V2 核心修复】优先更新数据库状态
                     if 'project_id' in locals() and project_id:
                         try:
-                            from paretoai.services.task_status_service import get_task_status_service
                             task_service = get_task_status_service()
                             task_service.update_task_status(
                                 project_id=project_id,
@@ -1198,8 +1400,7 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                     
                     # 更新本地 meta.json：记录失败状态和错误信息
                     try:
-                        from paretoai.services.feishu_bitable import write_project_meta
-                        write_project_meta(
+                        await awrite_project_meta(
                             project_id=project_id if 'project_id' in locals() else "",
                             status="failed",
                             error_message=error_msg,
@@ -1210,7 +1411,6 @@ async def generate_storyboards(req: GenerateStoryboardsRequest):
                     
                     # 回写到飞书（次要操作：通知）
                     try:
-                        from paretoai.services.feishu_bitable import feishu_date_now_ms
                         await service.update_record(
                             app_token,
                             actual_table_id,
@@ -1294,7 +1494,6 @@ async def generate_segments(req: GenerateSegmentsRequest):
                         return {"record_id": record_id, "success": False, "error": "缺少 project_id"}
 
                     # 【并发控制】获取项目锁，防止同一项目并发生成导致数据错乱
-                    from paretoai.services.project_lock_service import get_project_lock_service
                     lock_service = get_project_lock_service()
                     
                     # 尝试获取锁（非阻塞，超时 0 秒）
@@ -1313,8 +1512,6 @@ async def generate_segments(req: GenerateSegmentsRequest):
                         }
 
                     # 【V2 核心修复】从数据库/本地文件读取 storyboard_json（严格模式：不回退到飞书）
-                    from paretoai.services.task_status_service import get_task_status_service
-                    from paretoai.services.project_path_service import get_project_path_service
 
                     task_service = get_task_status_service()
                     path_service = get_project_path_service()
@@ -1353,7 +1550,6 @@ async def generate_segments(req: GenerateSegmentsRequest):
                     # 获取输入帧
                     if req.segment_index == 0:
                         # 优先从项目目录读取 opening_image（V2 结构：从数据库获取路径）
-                        from paretoai.services.project_path_service import get_project_path_service
                         path_service = get_project_path_service()
                         project_storage_path = path_service.get_project_storage_path(project_id)
 
@@ -1388,7 +1584,6 @@ async def generate_segments(req: GenerateSegmentsRequest):
                             try:
                                 if "open.feishu.cn/open-apis/drive/v1/medias" in opening_image:
                                     # 飞书附件，使用 download_attachment
-                                    import re
                                     match = re.search(r'/medias/([^/]+)/', opening_image)
                                     if match:
                                         file_token = match.group(1)
@@ -1402,7 +1597,6 @@ async def generate_segments(req: GenerateSegmentsRequest):
                                         raise ValueError("无法从飞书 URL 中提取 file_token")
                                 else:
                                     # 普通 HTTP URL，直接下载
-                                    import httpx
                                     async with httpx.AsyncClient(timeout=30) as client:
                                         response = await client.get(opening_image)
                                         response.raise_for_status()
@@ -1516,21 +1710,24 @@ async def generate_segments(req: GenerateSegmentsRequest):
                         }
 
                     # 判断是否所有段完成
-                    segment_count = task.total_segments if task and task.total_segments else fields.get("segment_count", 7)
-                    if isinstance(segment_count, str):
-                        segment_count = int(segment_count) if segment_count.isdigit() else 7
-                    elif not isinstance(segment_count, int):
-                        segment_count = 7
+                    segment_count = _coerce_int(task.total_segments if task and task.total_segments else fields.get("segment_count", 7))
                     all_complete = all(
                         segments_data.get(f"segment_{i}", {}).get("video_url")
                         for i in range(segment_count)
                     )
 
-                    logger.warning(f"=== 段{req.segment_index}视频生成成功 ===")
-                    logger.warning(f"video_url: {result.get('video_url', 'N/A')[:100]}...")
-                    logger.warning(f"last_frame_url: {result.get('last_frame_url', 'N/A')[:100]}...")
-                    logger.warning(f"segments_data 长度: {len(segments_data)}")
-                    logger.warning(f"segment_count: {segment_count}, all_complete: {all_complete}")
+                    # 诊断日志：合并为单条记录并延迟格式化，避免批量并发时逐行刷屏
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info(
+                            "=== 段%d视频生成成功 === video_url=%.100s, last_frame_url=%.100s, "
+                            "segments_data 长度=%d, segment_count=%s, all_complete=%s",
+                            req.segment_index,
+                            result.get("video_url") or "N/A",
+                            result.get("last_frame_url") or "N/A",
+                            len(segments_data),
+                            segment_count,
+                            all_complete,
+                        )
 
                     # 回写到飞书
                     # 获取表格的字段定义，确认实际字段名（与 _auto_update_generated_videos 使用相同的逻辑）
@@ -1541,8 +1738,8 @@ async def generate_segments(req: GenerateSegmentsRequest):
                         field_id_to_name = {f.get("field_id"): f.get("field_name") for f in table_fields if f.get("field_name") and f.get("field_id")}
                         # 获取附件类型的字段（关键修复！）
                         attachment_fields = service.get_attachment_fields(table_fields)
-                        logger.info(f"表格字段定义: {len(table_fields)} 个字段")
-                        logger.info(f"附件类型字段: {attachment_fields}")
+                        if logger.isEnabledFor(logging.INFO):
+                            logger.info("表格字段定义: %d 个字段, 附件类型字段: %s", len(table_fields), attachment_fields)
                     except Exception as e:
                         logger.warning(f"⚠️ 获取字段定义失败: {e}，将使用记录中的字段")
                         table_fields = []
@@ -1551,14 +1748,19 @@ async def generate_segments(req: GenerateSegmentsRequest):
 
                     # 获取记录的实际字段，只更新存在的字段（避免 FieldNameNotFound 错误）
                     existing_fields = set(fields.keys())
-                    logger.warning(f"=== 记录 {record_id} 字段检测 ===")
-                    logger.warning(f"存在的字段 ({len(existing_fields)}): {sorted(existing_fields)}")
-                    logger.warning(f"附件字段: {attachment_fields}")
-                    logger.warning(f"段索引: {req.segment_index}, 需要查找的字段: segment_{req.segment_index}_video_url")
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info(
+                            "=== 记录 %s 字段检测 === 存在的字段 (%d): %s, 附件字段: %s, 段索引: %d, 需要查找的字段: segment_%d_video_url",
+                            record_id,
+                            len(existing_fields),
+                            sorted(existing_fields),
+                            attachment_fields,
+                            req.segment_index,
+                            req.segment_index,
+                        )
 
                     # 准备附件上传（需要在检测字段类型之前）（V2 结构：从数据库获取路径）
                     attachment_updates = {}
-                    from paretoai.services.project_path_service import get_project_path_service
                     path_service = get_project_path_service()
                     project_storage_path = path_service.get_project_storage_path(project_id)
 
@@ -1611,13 +1813,11 @@ async def generate_segments(req: GenerateSegmentsRequest):
 
                     # 同步 updated_at 到飞书（日期字段用毫秒时间戳）
                     if "updated_at" in existing_fields or "updated_at" in field_name_map:
-                        from paretoai.services.feishu_bitable import feishu_date_now_ms
                         final_update_fields["updated_at"] = feishu_date_now_ms()
 
                     # 更新本地 meta.json：状态、错误信息、更新时间
                     try:
-                        from paretoai.services.feishu_bitable import write_project_meta
-                        write_project_meta(
+                        await awrite_project_meta(
                             project_id=project_id,
                             status=status_value,
                             error_message="",  # 清空错误信息
@@ -1710,28 +1910,33 @@ async def generate_segments(req: GenerateSegmentsRequest):
                         # 先处理附件上传（如果有）
                         if attachment_updates:
                             logger.warning(f"  - 开始上传 {len(attachment_updates)} 个附件")
-                            for field_name, file_info in attachment_updates.items():
-                                try:
-                                    local_path = file_info["local_path"]
-                                    file_name = file_info["file_name"]
-
-                                    # 关键修复：飞书 API 需要 field_id 而不是 field_name
-                                    field_id_for_upload = field_name_map.get(field_name, field_name)
-                                    logger.warning(f"  - 上传附件: {field_name} (field_id={field_id_for_upload})")
-
-                                    # 上传附件到飞书（使用 field_id）
-                                    upload_result = await service.upload_attachment_to_record(
-                                        app_token,
-                                        actual_table_id,
-                                        record_id,
-                                        field_id_for_upload,  # 使用 field_id 而不是 field_name
-                                        local_path,
-                                        file_name
-                                    )
-                                    logger.warning(f"  - ✅ 附件上传成功: {field_name} -> {upload_result.get('file_token')}")
-                                except Exception as upload_err:
-                                    logger.error(f"  - ❌ 附件上传失败: {field_name}, error={upload_err}")
+
+                            async def _upload(field_name: str, file_info: Dict):
+                                # 关键修复：飞书 API 需要 field_id 而不是 field_name
+                                field_id_for_upload = field_name_map.get(field_name, field_name)
+                                logger.warning(f"  - 上传附件: {field_name} (field_id={field_id_for_upload})")
+
+                                # 上传附件到飞书（使用 field_id）
+                                return await service.upload_attachment_to_record(
+                                    app_token,
+                                    actual_table_id,
+                                    record_id,
+                                    field_id_for_upload,  # 使用 field_id 而不是 field_name
+                                    file_info["local_path"],
+                                    file_info["file_name"]
+                                )
+
+                            # 各附件字段相互独立，并发上传
+                            upload_results = await asyncio.gather(
+                                *[_upload(fn, fi) for fn, fi in attachment_updates.items()],
+                                return_exceptions=True,
+                            )
+                            for field_name, upload_result in zip(attachment_updates.keys(), upload_results):
+                                if isinstance(upload_result, BaseException):
                                     # 附件上传失败不影响文本字段更新
+                                    logger.error(f"  - ❌ 附件上传失败: {field_name}, error={upload_result}")
+                                else:
+                                    logger.warning(f"  - ✅ 附件上传成功: {field_name} -> {upload_result.get('file_token')}")
 
                         # 再更新文本字段
                         if not final_update_fields:
@@ -1774,8 +1979,7 @@ async def generate_segments(req: GenerateSegmentsRequest):
                     
                     # 更新本地 meta.json：记录失败状态和错误信息
                     try:
-                        from paretoai.services.feishu_bitable import write_project_meta
-                        write_project_meta(
+                        await awrite_project_meta(
                             project_id=project_id if 'project_id' in locals() else "",
                             status="storyboard_ready",  # 与数据库保持一致
                             error_message=error_msg,
@@ -1785,7 +1989,6 @@ async def generate_segments(req: GenerateSegmentsRequest):
                         logger.warning(f"更新本地 meta.json 失败: {meta_error}")
                     # 记录错误到飞书（含 updated_at 同步）
                     try:
-                        from paretoai.services.feishu_bitable import feishu_date_now_ms
                         await service.update_record(
                             app_token,
                             actual_table_id,
@@ -1833,9 +2036,21 @@ async def merge_videos(req: MergeVideosRequest):
         failed_count = 0
         results = []
 
-        # 获取记录详情
-        records = await service.get_all_records(app_token, actual_table_id)
-        record_map = {r["record_id"]: r for r in records}
+        # 获取记录详情：少量记录时并发逐条获取，避免拉取整表；数量较多时一次拉取整表并建立索引
+        if len(req.record_ids) < 16:
+            fetched = await asyncio.gather(
+                *(service.get_record(app_token, actual_table_id, rid) for rid in req.record_ids),
+                return_exceptions=True,
+            )
+            record_map = {}
+            for rid, record in zip(req.record_ids, fetched):
+                if isinstance(record, Exception):
+                    logger.warning(f"获取记录失败 (record_id={rid}): {record}")
+                elif record:
+                    record_map[rid] = record
+        else:
+            records = await service.get_all_records(app_token, actual_table_id)
+            record_map = {r["record_id"]: r for r in records}
 
         for record_id in req.record_ids:
             try:
@@ -1847,11 +2062,7 @@ async def merge_videos(req: MergeVideosRequest):
 
                 fields = record.get("fields", {})
                 project_id = fields.get("project_id")
-                segment_count = fields.get("segment_count", 7)
-                if isinstance(segment_count, str):
-                    segment_count = int(segment_count) if segment_count.isdigit() else 7
-                elif not isinstance(segment_count, int):
-                    segment_count = 7
+                segment_count = _coerce_int(fields.get("segment_count"))
 
                 # 收集所有段的视频 URL
                 segment_urls = []
@@ -1883,8 +2094,7 @@ async def merge_videos(req: MergeVideosRequest):
 
                 # 更新本地 meta.json：状态、错误信息、更新时间
                 try:
-                    from paretoai.services.feishu_bitable import write_project_meta
-                    write_project_meta(
+                    await awrite_project_meta(
                         project_id=project_id,
                         status="completed",
                         error_message="",  # 清空错误信息
@@ -1895,7 +2105,6 @@ async def merge_videos(req: MergeVideosRequest):
                     logger.warning(f"更新本地 meta.json 失败: {meta_error}")
 
                 # 回写到飞书（含 updated_at 同步）
-                from paretoai.services.feishu_bitable import feishu_date_now_ms
                 await service.update_record(
                     app_token,
                     actual_table_id,
@@ -1914,8 +2123,7 @@ async def merge_videos(req: MergeVideosRequest):
                 failed_count += 1
                 # 更新本地 meta.json：记录失败状态和错误信息
                 try:
-                    from paretoai.services.feishu_bitable import write_project_meta
-                    write_project_meta(
+                    await awrite_project_meta(
                         project_id=project_id if 'project_id' in locals() else "",
                         status="failed",
                         error_message=str(e),
@@ -1925,7 +2133,6 @@ async def merge_videos(req: MergeVideosRequest):
                     logger.warning(f"更新本地 meta.json 失败: {meta_error}")
                 # 记录错误到飞书（含 updated_at 同步）
                 try:
-                    from paretoai.services.feishu_bitable import feishu_date_now_ms
                     await service.update_record(
                         app_token,
                         actual_table_id,
@@ -2006,20 +2213,20 @@ async def upload_image(
         # 保存文件
         project_id = uuid.uuid4().hex[:12]
         save_dir = f"data/uploads/batch/{project_id}"
-        os.makedirs(save_dir, exist_ok=True)
+        await asyncio.to_thread(os.makedirs, save_dir, exist_ok=True)
 
         ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
         save_path = f"{save_dir}/opening_image.{ext}"
 
-        with open(save_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # 分块流式写盘，峰值内存从文件大小降为单个分块大小
+        async with aiofiles.open(save_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
 
         # 生成可访问的 URL（这里简化处理，实际应该用云存储）
         image_url = f"/data/uploads/batch/{project_id}/opening_image.{ext}"
 
         # 更新飞书记录（含 updated_at 同步）
-        from paretoai.services.feishu_bitable import feishu_date_now_ms
         await service.update_record(
             app_token,
             actual_table_id,
@@ -2098,16 +2305,22 @@ async def get_progress(table_id: str):
         result = await get_tasks(table_id)
         tasks = result["tasks"]
 
-        total = len(tasks)
-        completed = sum(1 for t in tasks if t["status"] == "completed")
-        in_progress = sum(1 for t in tasks if "generating" in t["status"] or t["status"] == "merging")
-        failed = sum(1 for t in tasks if t["status"] in ["failed", "image_failed"])
+        # 单次遍历统计各类状态数量
+        counts = Counter()
+        for t in tasks:
+            status = t["status"]
+            if status == "completed":
+                counts["completed"] += 1
+            elif status in ("failed", "image_failed"):
+                counts["failed"] += 1
+            elif status in IN_PROGRESS_STATUSES:
+                counts["in_progress"] += 1
 
         return {
-            "total": total,
-            "completed": completed,
-            "in_progress": in_progress,
-            "failed": failed
+            "total": len(tasks),
+            "completed": counts["completed"],
+            "in_progress": counts["in_progress"],
+            "failed": counts["failed"]
         }
 
     except HTTPException:
@@ -2130,8 +2343,7 @@ async def cascade_redo(req: CascadeRedoRequest):
         actual_table_id = _feishu_services[req.table_id]["table_id"]
 
         # 获取记录详情
-        records = await service.get_all_records(app_token, actual_table_id)
-        record = next((r for r in records if r.get("record_id") == req.record_id), None)
+        record = await service.get_record(app_token, actual_table_id, req.record_id)
 
         if not record:
             raise HTTPException(status_code=404, detail="记录不存在")
@@ -2142,20 +2354,8 @@ async def cascade_redo(req: CascadeRedoRequest):
         if not project_id:
             raise HTTPException(status_code=400, detail="该记录没有关联的项目ID")
 
-        # 【并发控制】获取项目锁，防止并发操作导致数据错乱
-        from paretoai.services.project_lock_service import get_project_lock_service, ProjectLockError
-        lock_service = get_project_lock_service()
-        
-        success, error_msg = await lock_service.try_lock(project_id, operation="cascade_redo")
-        if not success:
-            raise HTTPException(status_code=409, detail=error_msg)
-
         # 获取分段数
-        segment_count = fields.get("segment_count", 7)
-        if isinstance(segment_count, str):
-            segment_count = int(segment_count) if segment_count.isdigit() else 7
-        elif not isinstance(segment_count, int):
-            segment_count = 7
+        segment_count = _coerce_int(fields.get("segment_count"))
 
         # 验证 from_segment_index
         if req.from_segment_index < 0 or req.from_segment_index >= segment_count:
@@ -2164,209 +2364,204 @@ async def cascade_redo(req: CascadeRedoRequest):
                 detail=f"无效的分段索引 (from_segment_index={req.from_segment_index}, 总段数={segment_count})"
             )
 
-        # 项目目录路径（V2 结构：从数据库获取路径）
-        from paretoai.services.project_path_service import get_project_path_service
-        path_service = get_project_path_service()
-        project_storage_path = path_service.get_project_storage_path(project_id)
+        # 【并发控制】级联重做会删除项目级 final.mp4 并重置飞书状态，需锁定整个项目，
+        # 与任意段上的编辑/生成互斥
+        async with _hold_project_lock(project_id, "cascade_redo", [None]):
+            # 项目目录路径（V2 结构：从数据库获取路径）
+            path_service = get_project_path_service()
+            project_storage_path = path_service.get_project_storage_path(project_id)
 
-        if not project_storage_path:
-            raise HTTPException(status_code=404, detail="项目不存在于数据库中")
-
-        project_dir = Path(project_storage_path)
-        segments_dir = project_dir / "segments"
-        frames_dir = project_dir / "frames"
-        history_dir = project_dir / "history"
-
-        # 创建 history 目录
-        history_dir.mkdir(parents=True, exist_ok=True)
-
-        cleared_segments = []
-        backup_paths = []
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # 备份并清除从 from_segment_index 开始的所有分段
-        for i in range(req.from_segment_index, segment_count):
-            # 备份视频文件
-            segment_video = segments_dir / f"segment_{i}_segment.mp4"
-            if segment_video.exists():
-                backup_name = f"segment_{i}_{timestamp}.mp4"
-                backup_path = history_dir / backup_name
-                try:
-                    import shutil
-                    shutil.move(str(segment_video), str(backup_path))
-                    backup_paths.append(str(backup_path.relative_to(project_storage_path)))
-                    logger.warning(f"✅ 已备份视频: {segment_video.name} -> {backup_name}")
-                except Exception as e:
-                    logger.warning(f"⚠️ 备份视频失败: {segment_video.name}, error={e}")
+            if not project_storage_path:
+                raise HTTPException(status_code=404, detail="项目不存在于数据库中")
 
-            # 备份首帧
-            first_frame = frames_dir / f"segment_{i}_first.jpg"
-            if first_frame.exists():
-                backup_name = f"segment_{i}_first_{timestamp}.jpg"
-                backup_path = history_dir / backup_name
-                try:
-                    import shutil
-                    shutil.move(str(first_frame), str(backup_path))
-                    logger.info(f"已备份首帧: {first_frame.name}")
-                except Exception as e:
-                    logger.warning(f"⚠️ 备份首帧失败: {first_frame.name}, error={e}")
+            project_dir = Path(project_storage_path)
+            segments_dir = project_dir / "segments"
+            frames_dir = project_dir / "frames"
+            history_dir = project_dir / "history"
+
+            # 创建 history 目录
+            await asyncio.to_thread(history_dir.mkdir, parents=True, exist_ok=True)
+
+            cleared_segments = []
+            backup_paths = []
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+            # 收集需要备份的文件：(源路径, 备份路径, 描述, 是否计入 backup_paths)
+            backup_moves = []
+            for i in range(req.from_segment_index, segment_count):
+                backup_moves.append((segments_dir / f"segment_{i}_segment.mp4", history_dir / f"segment_{i}_{timestamp}.mp4", "视频", True))
+                backup_moves.append((frames_dir / f"segment_{i}_first.jpg", history_dir / f"segment_{i}_first_{timestamp}.jpg", "首帧", False))
+                backup_moves.append((frames_dir / f"segment_{i}_last.jpg", history_dir / f"segment_{i}_last_{timestamp}.jpg", "尾帧", False))
+                cleared_segments.append(i)
+
+            # 备份并清除合并视频（如果有）
+            backup_moves.append((project_dir / "final.mp4", history_dir / f"final_{timestamp}.mp4", "合并视频", True))
+
+            # 每个目录只扫描一次，用内存集合判断文件是否存在（代替逐个 exists 探测）
+            scan_dirs = list({src.parent for src, _, _, _ in backup_moves})
+            dir_listings = await asyncio.gather(*[asyncio.to_thread(_list_file_names, d) for d in scan_dirs])
+            existing_names = dict(zip(scan_dirs, dir_listings))
+            backup_moves = [m for m in backup_moves if m[0].name in existing_names[m[0].parent]]
+
+            # 各文件互不依赖，一次性并发提交到线程池移动
+            move_results = await asyncio.gather(
+                *[asyncio.to_thread(_backup_file, src, dst) for src, dst, _, _ in backup_moves],
+                return_exceptions=True,
+            )
+            for (src, dst, label, track), move_error in zip(backup_moves, move_results):
+                if isinstance(move_error, BaseException):
+                    logger.warning(f"⚠️ 备份{label}失败: {src.name}, error={move_error}")
+                else:
+                    if track:
+                        backup_paths.append(str(dst.relative_to(project_storage_path)))
+                        logger.warning(f"✅ 已备份{label}: {src.name} -> {dst.name}")
+                    else:
+                        logger.info(f"已备份{label}: {src.name}")
 
-            # 备份尾帧
-            last_frame = frames_dir / f"segment_{i}_last.jpg"
-            if last_frame.exists():
-                backup_name = f"segment_{i}_last_{timestamp}.jpg"
-                backup_path = history_dir / backup_name
-                try:
-                    import shutil
-                    shutil.move(str(last_frame), str(backup_path))
-                    logger.info(f"已备份尾帧: {last_frame.name}")
-                except Exception as e:
-                    logger.warning(f"⚠️ 备份尾帧失败: {last_frame.name}, error={e}")
+            # 更新飞书记录：清空被重做分段的数据
+            update_fields = {}
 
-            cleared_segments.append(i)
+            # 注意：segments_json 字段在飞书表格中不存在，只存储在本地，不更新到飞书
+            # 如果表格中有此字段（历史遗留），才更新它
+            if "segments_json" in fields:
+                # 解析现有的 segments_json
+                segments_json = fields.get("segments_json", "{}")
+                if isinstance(segments_json, str):
+                    segments_data = jsonutil.loads(segments_json) if segments_json else {}
+                else:
+                    segments_data = segments_json if segments_json else {}
 
-        # 备份并清除合并视频（如果有）
-        final_video = project_dir / "final.mp4"
-        if final_video.exists():
-            backup_name = f"final_{timestamp}.mp4"
-            backup_path = history_dir / backup_name
-            try:
-                import shutil
-                shutil.move(str(final_video), str(backup_path))
-                backup_paths.append(str(backup_path.relative_to(project_storage_path)))
-                logger.warning(f"✅ 已备份合并视频: final.mp4 -> {backup_name}")
-            except Exception as e:
-                logger.warning(f"⚠️ 备份合并视频失败: error={e}")
-
-        # 更新飞书记录：清空被重做分段的数据
-        update_fields = {}
-
-        # 注意：segments_json 字段在飞书表格中不存在，只存储在本地，不更新到飞书
-        # 如果表格中有此字段（历史遗留），才更新它
-        if "segments_json" in fields:
-            # 解析现有的 segments_json
-            segments_json = fields.get("segments_json", "{}")
-            if isinstance(segments_json, str):
-                segments_data = json.loads(segments_json) if segments_json else {}
-            else:
-                segments_data = segments_json if segments_json else {}
+                # 清空从 from_segment_index 开始的分段数据
+                for i in cleared_segments:
+                    seg_key = f"segment_{i}"
+                    if seg_key in segments_data:
+                        del segments_data[seg_key]
 
-            # 清空从 from_segment_index 开始的分段数据
+                update_fields["segments_json"] = jsonutil.dumps(segments_data)
+
+            # 清空独立字段（如果存在）
             for i in cleared_segments:
-                seg_key = f"segment_{i}"
-                if seg_key in segments_data:
-                    del segments_data[seg_key]
-
-            update_fields["segments_json"] = json.dumps(segments_data, ensure_ascii=False)
-
-        # 清空独立字段（如果存在）
-        for i in cleared_segments:
-            # 清空视频 URL
-            video_field = f"segment_{i}_video_url"
-            if video_field in fields:
-                update_fields[video_field] = ""
-
-            # 清空尾帧 URL
-            frame_field = f"segment_{i}_last_frame_url"
-            if frame_field in fields:
-                update_fields[frame_field] = ""
-
-        # 清空合并视频 URL
-        if "final_video_url" in fields and fields.get("final_video_url"):
-            update_fields["final_video_url"] = ""
-
-        # 更新状态
-        # 【修复】级联重做后，状态应该是 storyboard_ready（等待用户推进）
-        # 而不是 generating_segment_X（表示正在生成）
-        update_fields["status"] = "storyboard_ready"
-
-        # 清除错误信息
-        update_fields["error_message"] = ""
-
-        # 同步 updated_at 到飞书
-        from paretoai.services.feishu_bitable import feishu_date_now_ms
-        update_fields["updated_at"] = feishu_date_now_ms()
-
-        # 如果需要重新生成分镜
-        if req.regenerate_storyboard:
-            # 清空分镜数据（让用户重新生成）
-            storyboard_json = fields.get("storyboard_json", "")
-            if storyboard_json:
-                try:
-                    if isinstance(storyboard_json, str):
-                        storyboards = json.loads(storyboard_json)
-                    else:
-                        storyboards = storyboard_json
-
-                    # 只清空从 from_segment_index 开始的分镜
-                    if isinstance(storyboards, list) and len(storyboards) > req.from_segment_index:
-                        # 保留前面的分镜，清空后面的
-                        storyboards = storyboards[:req.from_segment_index]
-                        update_fields["storyboard_json"] = json.dumps(storyboards, ensure_ascii=False)
-                        logger.warning(f"✅ 已清空从段{req.from_segment_index}开始的分镜")
-                except Exception as e:
-                    logger.warning(f"⚠️ 清空分镜失败: {e}")
+                # 清空视频 URL
+                video_field = f"segment_{i}_video_url"
+                if video_field in fields:
+                    update_fields[video_field] = ""
+
+                # 清空尾帧 URL
+                frame_field = f"segment_{i}_last_frame_url"
+                if frame_field in fields:
+                    update_fields[frame_field] = ""
+
+            # 清空合并视频 URL
+            if "final_video_url" in fields and fields.get("final_video_url"):
+                update_fields["final_video_url"] = ""
+
+            # 更新状态
+            # 【修复】级联重做后，状态应该是 storyboard_ready（等待用户推进）
+            # 而不是 generating_segment_X（表示正在生成）
+            update_fields["status"] = "storyboard_ready"
+
+            # 清除错误信息
+            update_fields["error_message"] = ""
+
+            # 同步 updated_at 到飞书
+            update_fields["updated_at"] = feishu_date_now_ms()
+
+            # 如果需要重新生成分镜
+            if req.regenerate_storyboard:
+                # 清空分镜数据（让用户重新生成）
+                storyboard_json = fields.get("storyboard_json", "")
+                if storyboard_json:
+                    try:
+                        if isinstance(storyboard_json, str):
+                            storyboards = jsonutil.loads(storyboard_json)
+                        else:
+                            storyboards = storyboard_json
+
+                        # 只清空从 from_segment_index 开始的分镜
+                        if isinstance(storyboards, list) and len(storyboards) > req.from_segment_index:
+                            # 保留前面的分镜，清空后面的
+                            storyboards = storyboards[:req.from_segment_index]
+                            update_fields["storyboard_json"] = jsonutil.dumps(storyboards)
+                            logger.warning(f"✅ 已清空从段{req.from_segment_index}开始的分镜")
+                    except Exception as e:
+                        logger.warning(f"⚠️ 清空分镜失败: {e}")
 
-        # 更新飞书记录
-        try:
-            await service.update_record(app_token, actual_table_id, req.record_id, update_fields)
-            logger.warning(f"✅ 已更新飞书记录: record_id={req.record_id}, 清空了分段 {cleared_segments}")
-        except Exception as e:
-            logger.error(f"❌ 更新飞书记录失败: {e}")
-            raise HTTPException(status_code=500, detail=f"更新飞书记录失败: {str(e)}")
+            # 更新飞书记录
+            try:
+                await service.update_record(app_token, actual_table_id, req.record_id, update_fields)
+                logger.warning(f"✅ 已更新飞书记录: record_id={req.record_id}, 清空了分段 {cleared_segments}")
+            except Exception as e:
+                logger.error(f"❌ 更新飞书记录失败: {e}")
+                raise HTTPException(status_code=500, detail=f"更新飞书记录失败: {str(e)}")
 
-        # 【并发控制】释放项目锁
-        await lock_service.release_lock(project_id)
-        
-        return {
-            "success": True,
-            "cleared_segments": cleared_segments,
-            "backup_paths": backup_paths,
-            "new_status": update_fields.get("status"),
-            "regenerate_storyboard": req.regenerate_storyboard
-        }
+            return {
+                "success": True,
+                "cleared_segments": cleared_segments,
+                "backup_paths": backup_paths,
+                "new_status": update_fields.get("status"),
+                "regenerate_storyboard": req.regenerate_storyboard
+            }
 
     except HTTPException:
-        # 释放锁（如果已获取）
-        if 'project_id' in locals() and project_id and 'lock_service' in locals():
-            await lock_service.release_lock(project_id)
         raise
     except Exception as e:
-        # 释放锁（如果已获取）
-        if 'project_id' in locals() and project_id and 'lock_service' in locals():
-            await lock_service.release_lock(project_id)
         logger.error(f"级联重做失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def _construct_full_prompt(segment: dict) -> str:
-    """构建完整的视频生成提示词（包含 Veo 模型一致性约束和负向约束）"""
-    crucial = segment.get('crucial', '')
-    action = segment.get('action', '')
-    sound = segment.get('sound', '')
-    negative_constraint = segment.get('negative_constraint', '')
-
-    # 添加 Veo 模型的一致性约束（专家建议，通用版本，不限定猫咪颜色）
-    veo_consistency_constraint = (
-        "STAY CONSISTENT: The warm, bright studio lighting must remain unchanging throughout the entire video, "
-        "do not shift to cold or dark tones. The pet's identity, fur color (as shown in the opening image), and facial structure "
-        "must be perfectly stable, with no morphing or darkening over time. High fidelity preservation of the initial state."
-    )
+# Veo 模型的一致性约束（专家建议，通用版本，不限定猫咪颜色）
+VEO_CONSISTENCY_CONSTRAINT = (
+    "STAY CONSISTENT: The warm, bright studio lighting must remain unchanging throughout the entire video, "
+    "do not shift to cold or dark tones. The pet's identity, fur color (as shown in the opening image), and facial structure "
+    "must be perfectly stable, with no morphing or darkening over time. High fidelity preservation of the initial state."
+)
 
-    # 构建基础 prompt
-    prompt_parts = [
-        f"[关键] {crucial}",
-        f"[动作] {action}",
-        f"[音效] {sound}",
-    ]
 
-    # 如果有负向约束，添加到 prompt 中
-    if negative_constraint:
-        prompt_parts.append(f"[禁止] {negative_constraint}")
+def _archive_segment_history_job(
+    job_id: str,
+    project_id: str,
+    segment_index: int,
+    project_storage_path: str,
+    segment_data: dict,
+) -> None:
+    """后台归档段的旧数据（文件已由调用方移动），完成后更新任务队列状态"""
+    job_store = get_api_job_store()
+    job_store.update_job(job_id, status="running")
+    try:
+        # 整个后台任务只获取一个数据库会话
+        with session_scope() as session:
+            success = get_archive_service().archive_and_prepare_for_regenerate(
+                project_id=project_id,
+                segment_index=segment_index,
+                project_storage_path=project_storage_path,
+                current_segment_data=segment_data,
+                move_files=False,
+                session=session,
+            )
+    except Exception as e:
+        logger.warning(f"⚠️ 归档失败（不影响生成）: {e}")
+        success = False
+    
+    if success:
+        logger.info(f"✅ 已归档段{segment_index}的旧数据")
+        job_store.update_job(job_id, status="succeeded", message=f"段{segment_index}旧数据已归档")
+    else:
+        job_store.update_job(job_id, status="failed", error=f"段{segment_index}旧数据归档失败")
 
-    prompt_parts.append(f"[一致性约束] {veo_consistency_constraint}")
 
-    return "\n".join(prompt_parts)
+def _construct_full_prompt(segment: dict) -> str:
+    """构建完整的视频生成提示词（包含 Veo 模型一致性约束和负向约束）"""
+    negative_constraint = segment.get('negative_constraint', '')
+    # 如果有负向约束，添加到 prompt 中
+    negative_part = f"[禁止] {negative_constraint}\n" if negative_constraint else ""
+
+    return (
+        f"[关键] {segment.get('crucial', '')}\n"
+        f"[动作] {segment.get('action', '')}\n"
+        f"[音效] {segment.get('sound', '')}\n"
+        f"{negative_part}"
+        f"[一致性约束] {VEO_CONSISTENCY_CONSTRAINT}"
+    )
 
 
 @router.post("/edit-and-regenerate")
@@ -2377,12 +2572,12 @@ async def edit_and_regenerate(req: EditAndRegenerateRequest):
     1. 读取本地 storyboard.json（数据源）
     2. 更新指定段的字段
     3. 重新构建 prompt
-    4. 保存到本地文件（数据源）
-    5. 验证保存成功
-    6. 调用 LLM/视频 API 重新生成视频
+    4. 保存到数据库
+    5. 调用 LLM/视频 API 重新生成视频
+    6. 将所有变更一次性写回本地 storyboard.json（成功/失败各一次）
     7. 回写飞书（可选，不阻断流程）
     """
-    print(f"[edit-and-regenerate] 收到请求: project_id={req.project_id}, record_id={req.record_id}, segment_index={req.segment_index}", flush=True)
+    logger.info("[edit-and-regenerate] 收到请求: project_id=%s, record_id=%s, segment_index=%s", req.project_id, req.record_id, req.segment_index)
     
     # 【任务队列】创建任务记录
     job_store = get_api_job_store()
@@ -2397,368 +2592,352 @@ async def edit_and_regenerate(req: EditAndRegenerateRequest):
     job_store.update_job(job.id, status="running")
     
     try:
-        # 【并发控制】获取项目锁，防止并发操作导致数据错乱
-        from paretoai.services.project_lock_service import get_project_lock_service, ProjectLockError
-        lock_service = get_project_lock_service()
-        
-        success, error_msg = await lock_service.try_lock(req.project_id, operation="edit_regenerate")
-        if not success:
-            raise HTTPException(status_code=409, detail=error_msg)
-        
-        # 1. 读取本地 storyboard.json（V2 结构：从数据库获取路径）
-        from paretoai.services.project_path_service import get_project_path_service
-        path_service = get_project_path_service()
-        project_storage_path = path_service.get_project_storage_path(req.project_id)
+        # 【并发控制】只锁定当前编辑的段，其他段的编辑/生成可并行进行
+        async with _hold_project_lock(req.project_id, "edit_regenerate", [f"segment_{req.segment_index}"]) as lock_service:
+            # 1. 读取本地 storyboard.json（V2 结构：从数据库获取路径）
+            path_service = get_project_path_service()
+            project_storage_path = path_service.get_project_storage_path(req.project_id)
 
-        if not project_storage_path:
-            await lock_service.release_lock(req.project_id)
-            raise HTTPException(status_code=404, detail=f"项目 {req.project_id} 不存在于数据库中")
+            if not project_storage_path:
+                raise HTTPException(status_code=404, detail=f"项目 {req.project_id} 不存在于数据库中")
 
-        project_dir = Path(project_storage_path)
-        storyboard_path = project_dir / "storyboard.json"
+            project_dir = Path(project_storage_path)
+            storyboard_path = project_dir / "storyboard.json"
 
-        if not storyboard_path.exists():
-            raise HTTPException(status_code=404, detail=f"storyboard.json 不存在: {storyboard_path}")
-        
-        # 读取 storyboard 数据
-        with open(storyboard_path, "r", encoding="utf-8") as f:
-            storyboard_data = json.load(f)
-        
-        storyboards = storyboard_data.get("storyboards", [])
-        
-        # 验证 segment_index
-        if req.segment_index < 0 or req.segment_index >= len(storyboards):
-            raise HTTPException(
-                status_code=400,
-                detail=f"无效的分段索引 (segment_index={req.segment_index}, 总段数={len(storyboards)})"
-            )
+            if not await asyncio.to_thread(storyboard_path.exists):
+                raise HTTPException(status_code=404, detail=f"storyboard.json 不存在: {storyboard_path}")
         
-        # 2. 更新指定段的字段
-        segment = storyboards[req.segment_index]
-        segment["crucial"] = req.crucial
-        segment["action"] = req.action
-        segment["sound"] = req.sound
-        segment["negative_constraint"] = req.negative_constraint
+            # 读-改-写 storyboard 期间持有项目数据锁，避免与其他段的并行编辑相互覆盖
+            async with lock_service.get_data_lock(req.project_id):
+                # 读取 storyboard 数据
+                storyboard_data, storyboard_size = await _read_storyboard_file(storyboard_path)
         
-        # 更新中文字段（如果提供）
-        if req.crucial_zh:
-            segment["crucial_zh"] = req.crucial_zh
-        if req.action_zh:
-            segment["action_zh"] = req.action_zh
-        if req.sound_zh:
-            segment["sound_zh"] = req.sound_zh
-        if req.negative_constraint_zh:
-            segment["negative_constraint_zh"] = req.negative_constraint_zh
+                storyboards = storyboard_data.get("storyboards", [])
         
-        # 3. 重新构建 prompt
-        new_prompt = _construct_full_prompt(segment)
-        segment["prompt"] = new_prompt
+                # 验证 segment_index
+                if req.segment_index < 0 or req.segment_index >= len(storyboards):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"无效的分段索引 (segment_index={req.segment_index}, 总段数={len(storyboards)})"
+                    )
         
-        # 4. 【V2 核心修复】优先保存到数据库（数据库是唯一事实来源）
-        from paretoai.services.task_status_service import get_task_status_service
-        task_service = get_task_status_service()
+                # 2. 更新指定段的字段
+                segment = storyboards[req.segment_index]
+                segment["crucial"] = req.crucial
+                segment["action"] = req.action
+                segment["sound"] = req.sound
+                segment["negative_constraint"] = req.negative_constraint
         
-        storyboard_data["storyboards"] = storyboards
-        storyboard_data["timestamp"] = datetime.now().isoformat()
+                # 更新中文字段（如果提供）
+                if req.crucial_zh:
+                    segment["crucial_zh"] = req.crucial_zh
+                if req.action_zh:
+                    segment["action_zh"] = req.action_zh
+                if req.sound_zh:
+                    segment["sound_zh"] = req.sound_zh
+                if req.negative_constraint_zh:
+                    segment["negative_constraint_zh"] = req.negative_constraint_zh
         
-        # 保存到数据库
-        db_save_success = task_service.save_storyboard(
-            project_id=req.project_id,
-            storyboards=storyboards,
-            storage_path=project_storage_path,
-            status="editing"  # 标记为编辑中状态
-        )
+                # 3. 重新构建 prompt
+                new_prompt = _construct_full_prompt(segment)
+                segment["prompt"] = new_prompt
         
-        if db_save_success:
-            logger.info(f"✅ 分镜已保存到数据库: project_id={req.project_id}")
-        else:
-            logger.warning(f"⚠️ 分镜保存到数据库失败")
+                # 4. 【V2 核心修复】优先保存到数据库（数据库是唯一事实来源）
+                task_service = get_task_status_service()
         
-        # 同时保存到本地文件（作为缓存/备份）
-        # 确保目录存在
-        project_dir.mkdir(parents=True, exist_ok=True)
+                storyboard_data["storyboards"] = storyboards
+                storyboard_data["timestamp"] = datetime.now().isoformat()
         
-        # 写入文件并强制刷新
-        with open(storyboard_path, "w", encoding="utf-8") as f:
-            json.dump(storyboard_data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())  # 强制刷新到磁盘
+                # 保存到数据库（本地 storyboard.json 在下面锁内单独写入，此处不传 storage_path）
+                db_save_success = task_service.save_storyboard(
+                    project_id=req.project_id,
+                    storyboards=storyboards,
+                    status="editing"  # 标记为编辑中状态
+                )
         
-        # 5. 验证保存成功
-        with open(storyboard_path, "r", encoding="utf-8") as f:
-            verify_data = json.load(f)
-        verify_segment = verify_data.get("storyboards", [])[req.segment_index]
-        if verify_segment.get("prompt") != new_prompt:
-            logger.error(f"⚠️ 验证失败：保存的 prompt 与预期不符")
-            raise HTTPException(status_code=500, detail="保存验证失败")
+                if db_save_success:
+                    logger.info(f"✅ 分镜已保存到数据库: project_id={req.project_id}")
+                else:
+                    logger.warning(f"⚠️ 分镜保存到数据库失败")
+
+                # 释放数据锁前把新 prompt 写回本地文件：其他段的并行编辑会读取该文件并整份保存到数据库，
+                # 若等到生成结束才写，它们会用本段的旧 prompt 覆盖数据库
+                try:
+                    await _write_storyboard_file(storyboard_path, storyboard_data, size_hint=storyboard_size)
+                except Exception as file_err:
+                    logger.warning(f"⚠️ [edit-and-regenerate] 写入本地 storyboard.json 失败: {file_err}")
         
-        logger.warning(f"✅ 已更新段{req.segment_index}的提示词并保存到本地和数据库: {storyboard_path}")
-        print(f"[edit-and-regenerate] ✅ 步骤1-5完成，prompt 已保存。即将调用视频生成服务（LLM/API）重新生成段{req.segment_index}...", flush=True)
+            logger.warning(f"✅ 已更新段{req.segment_index}的提示词并保存到数据库")
+            logger.debug("[edit-and-regenerate] 步骤1-4完成，prompt 已保存，即将重新生成段%s", req.segment_index)
         
-        # 6. 调用视频生成服务（重新生成视频）
-        try:
-            video_service = get_video_segment_service()
-            if not video_service:
-                print("[edit-and-regenerate] ❌ 视频服务不可用 (get_video_segment_service 返回 None)", flush=True)
-                raise HTTPException(status_code=500, detail="视频服务不可用")
-            mock_mode = getattr(video_service, "mock_mode", None)
-            has_key = bool(getattr(video_service, "api_key", None))
-            logger.warning(f"[edit-and-regenerate] 视频服务: mock_mode={mock_mode}, api_key={'***' if has_key else 'NOT SET'}")
-            print(f"[edit-and-regenerate] 视频服务: mock_mode={mock_mode}, has_api_key={has_key}", flush=True)
+            # 6. 调用视频生成服务（重新生成视频）
+            storyboards_json = None
+            try:
+                video_service = get_video_segment_service()
+                if not video_service:
+                    logger.error("[edit-and-regenerate] ❌ 视频服务不可用 (get_video_segment_service 返回 None)")
+                    raise HTTPException(status_code=500, detail="视频服务不可用")
+                mock_mode = getattr(video_service, "mock_mode", None)
+                has_key = bool(getattr(video_service, "api_key", None))
+                logger.warning(f"[edit-and-regenerate] 视频服务: mock_mode={mock_mode}, api_key={'***' if has_key else 'NOT SET'}")
             
-            # 获取输入帧
-            first_frame_url = None
-            previous_last_frame = None
+                # 获取输入帧
+                first_frame_url = None
+                previous_last_frame = None
             
-            if req.segment_index == 0:
-                # 段0：使用 opening_image
-                first_frame_url = storyboard_data.get("opening_image_url")
-                if not first_frame_url:
-                    # 尝试从项目目录读取（V2 结构，使用统一的 URL 生成方法）
-                    opening_image_path = project_dir / "opening_image.jpg"
-                    if opening_image_path.exists():
-                        first_frame_url = path_service.get_file_url(req.project_id, "opening_image.jpg")
-                    else:
-                        raise HTTPException(status_code=400, detail="缺少首帧图片")
-            else:
-                # 其他段：使用上一段的尾帧
-                prev_segment = storyboards[req.segment_index - 1]
-                previous_last_frame = prev_segment.get("last_frame_url")
+                if req.segment_index == 0:
+                    # 段0：使用 opening_image
+                    first_frame_url = storyboard_data.get("opening_image_url")
+                    if not first_frame_url:
+                        # 尝试从项目目录读取（V2 结构，使用统一的 URL 生成方法）
+                        opening_image_path = project_dir / "opening_image.jpg"
+                        if await asyncio.to_thread(opening_image_path.exists):
+                            first_frame_url = path_service.get_file_url(req.project_id, "opening_image.jpg")
+                        else:
+                            raise HTTPException(status_code=400, detail="缺少首帧图片")
+                else:
+                    # 其他段：使用上一段的尾帧
+                    prev_segment = storyboards[req.segment_index - 1]
+                    previous_last_frame = prev_segment.get("last_frame_url")
                 
-                # 如果从 storyboard 找不到，尝试从本地项目目录读取（V2 结构，使用统一的 URL 生成方法）
-                if not previous_last_frame:
-                    prev_segment_index = req.segment_index - 1
-                    frames_dir = project_dir / "frames"
-                    last_frame_file = frames_dir / f"segment_{prev_segment_index}_last.jpg"
-                    if last_frame_file.exists():
-                        previous_last_frame = path_service.get_segment_frame_url(
-                            req.project_id, prev_segment_index, "last"
-                        )
+                    # 如果从 storyboard 找不到，尝试从本地项目目录读取（V2 结构，使用统一的 URL 生成方法）
+                    if not previous_last_frame:
+                        prev_segment_index = req.segment_index - 1
+                        frames_dir = project_dir / "frames"
+                        last_frame_file = frames_dir / f"segment_{prev_segment_index}_last.jpg"
+                        if await asyncio.to_thread(last_frame_file.exists):
+                            previous_last_frame = path_service.get_segment_frame_url(
+                                req.project_id, prev_segment_index, "last"
+                            )
                 
-                if not previous_last_frame:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"缺少上一段尾帧 (段{req.segment_index - 1})，请确保上一段已成功生成"
-                    )
+                    if not previous_last_frame:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"缺少上一段尾帧 (段{req.segment_index - 1})，请确保上一段已成功生成"
+                        )
             
-            # 【归档旧数据】重新生成前先归档旧视频和帧
-            try:
-                from paretoai.services.archive_service import get_archive_service
+                # 【归档旧数据】重新生成前先把旧视频和帧移到 archive（必须先于生成完成，避免与新文件冲突）
                 archive_service = get_archive_service()
-                
-                # 获取项目存储路径
-                from paretoai.services.project_path_service import get_project_path_service
-                path_service = get_project_path_service()
-                project_storage_path = path_service.get_project_storage_path(req.project_id)
-                
-                if project_storage_path:
-                    archive_service.archive_and_prepare_for_regenerate(
-                        project_id=req.project_id,
-                        segment_index=req.segment_index,
-                        project_storage_path=project_storage_path,
-                        current_segment_data=segment
-                    )
-                    logger.info(f"✅ 已归档段{req.segment_index}的旧数据")
-                else:
-                    logger.warning(f"⚠️ 无法获取项目存储路径，跳过归档")
-            except Exception as archive_error:
-                logger.warning(f"⚠️ 归档失败（不影响生成）: {archive_error}")
-            
-            # 【状态更新】生成开始前设置 generating_segment_X 状态
-            try:
-                from paretoai.services.task_status_service import get_task_status_service
-                task_service = get_task_status_service()
-                generating_status = f"generating_segment_{req.segment_index}"
-                task_service.update_task_status(
+                await asyncio.to_thread(
+                    archive_service.move_local_files_to_archive,
+                    req.project_id,
+                    req.segment_index,
+                    project_storage_path,
+                )
+                # 快照旧段数据，生成完成后 segment 会被更新
+                old_segment_data = dict(segment)
+
+                # 归档历史记录不影响本次生成结果，作为独立任务在后台执行（可通过任务队列查询进度）
+                # 不使用 BackgroundTasks：生成失败返回错误响应时其不会执行，而旧文件此时已移入 archive
+                archive_job = job_store.create_job(
+                    table_id=req.table_id,
+                    kind="archive_segment",
+                    record_id=req.record_id,
                     project_id=req.project_id,
-                    status=generating_status,
-                    progress=f"{req.segment_index}/7段生成中"
+                    segment_index=req.segment_index,
+                    message=f"正在归档段{req.segment_index}的旧数据..."
                 )
-                logger.info(f"✅ 状态已更新为: {generating_status}")
-            except Exception as status_error:
-                logger.warning(f"更新状态失败（不影响生成）: {status_error}")
-
-            # 调用视频生成服务（真正请求 LLM/视频 API）
-            logger.warning(f"🎬 [edit-and-regenerate] 开始调用 LLM/视频 API 重新生成段{req.segment_index}...")
-            print(f"[edit-and-regenerate] 🎬 调用 generate_video_segment: segment={req.segment_index}, first_frame={bool(first_frame_url)}, prev_last_frame={bool(previous_last_frame)}, prompt 前120字={repr(new_prompt[:120])}...", flush=True)
-            result = await video_service.generate_video_segment(
-                segment_index=req.segment_index,
-                prompt=new_prompt,  # 使用新构建的 prompt
-                first_frame_url=first_frame_url,
-                previous_last_frame=previous_last_frame,
-                duration_sec=segment.get("durationSec", segment.get("duration_sec", 8)),
-                project_id=req.project_id,
-                segment_type=segment.get("segment_type")
-            )
+                # 复用入口处已获取的项目存储路径（不存在时已提前返回 404）
+                _spawn_background(asyncio.to_thread(
+                    _archive_segment_history_job,
+                    archive_job.id,
+                    req.project_id,
+                    req.segment_index,
+                    project_storage_path,
+                    old_segment_data,
+                ))
+
+                # 【状态更新】生成开始前设置 generating_segment_X 状态
+                def _mark_generating():
+                    try:
+                        generating_status = f"generating_segment_{req.segment_index}"
+                        task_service.update_task_status(
+                            project_id=req.project_id,
+                            status=generating_status,
+                            progress=f"{req.segment_index}/7段生成中"
+                        )
+                        logger.info(f"✅ 状态已更新为: {generating_status}")
+                    except Exception as status_error:
+                        logger.warning(f"更新状态失败（不影响生成）: {status_error}")
+
+                # 状态更新不依赖视频结果，与视频生成并行执行
+                background_updates = asyncio.ensure_future(asyncio.to_thread(_mark_generating))
+
+                # 调用视频生成服务（真正请求 LLM/视频 API）
+                logger.warning(f"🎬 [edit-and-regenerate] 开始调用 LLM/视频 API 重新生成段{req.segment_index}...")
+                logger.debug("[edit-and-regenerate] 调用 generate_video_segment: segment=%s, first_frame=%s, prev_last_frame=%s, prompt=%.120r", req.segment_index, bool(first_frame_url), bool(previous_last_frame), new_prompt)
+                try:
+                    result = await video_service.generate_video_segment(
+                        segment_index=req.segment_index,
+                        prompt=new_prompt,  # 使用新构建的 prompt
+                        first_frame_url=first_frame_url,
+                        previous_last_frame=previous_last_frame,
+                        duration_sec=segment.get("durationSec", segment.get("duration_sec", 8)),
+                        project_id=req.project_id,
+                        segment_type=segment.get("segment_type")
+                    )
+                finally:
+                    # 结果写库前确保 generating 状态已落库，避免覆盖顺序错乱
+                    await background_updates
             
-            video_url = result.get("video_url", "")
-            first_frame_url_result = result.get("first_frame_url", "")
-            last_frame_url_result = result.get("last_frame_url", "")
+                video_url = result.get("video_url", "")
+                first_frame_url_result = result.get("first_frame_url", "")
+                last_frame_url_result = result.get("last_frame_url", "")
             
-            logger.warning(f"✅ [edit-and-regenerate] 段{req.segment_index}视频重新生成成功: {video_url[:100] if video_url else 'N/A'}...")
-            print(f"[edit-and-regenerate] ✅ 视频生成成功 video_url={video_url[:80] if video_url else 'N/A'}...", flush=True)
+                logger.warning(f"✅ [edit-and-regenerate] 段{req.segment_index}视频重新生成成功: {video_url[:100] if video_url else 'N/A'}...")
             
-            # ========================================================================
-            # 【架构原则】数据库是唯一事实来源，必须第一时间更新
-            # 写入顺序：1. 数据库 → 2. 本地文件（备份）→ 3. 飞书（同步）
-            # ========================================================================
+                # ========================================================================
+                # 【架构原则】数据库是唯一事实来源，必须第一时间更新
+                # 写入顺序：1. 数据库 → 2. 本地文件（备份）→ 3. 飞书（同步）
+                # ========================================================================
             
-            # 【第一落点】更新数据库 segment_urls
-            try:
-                task_service.update_segment_result(
-                    project_id=req.project_id,
-                    segment_index=req.segment_index,
-                    video_url=video_url,
-                    first_frame_url=first_frame_url_result,
-                    last_frame_url=last_frame_url_result,
-                    status="completed"
-                )
-                logger.warning(f"✅ [edit-and-regenerate] 【第一落点】已更新数据库 segment_urls")
-            except Exception as seg_err:
-                logger.error(f"❌ [edit-and-regenerate] 更新数据库失败: {seg_err}")
-                # 数据库更新失败是严重错误，抛出异常
-                raise HTTPException(status_code=500, detail=f"数据库更新失败: {str(seg_err)}")
+                # 【第一落点】更新数据库 segment_urls
+                try:
+                    task_service.update_segment_result(
+                        project_id=req.project_id,
+                        segment_index=req.segment_index,
+                        video_url=video_url,
+                        first_frame_url=first_frame_url_result,
+                        last_frame_url=last_frame_url_result,
+                        status="completed"
+                    )
+                    logger.warning(f"✅ [edit-and-regenerate] 【第一落点】已更新数据库 segment_urls")
+                except Exception as seg_err:
+                    logger.error(f"❌ [edit-and-regenerate] 更新数据库失败: {seg_err}")
+                    # 数据库更新失败是严重错误，抛出异常
+                    raise HTTPException(status_code=500, detail=f"数据库更新失败: {str(seg_err)}")
             
-            # 【第二步】更新本地 storyboard.json（作为备份）
-            try:
+                # 【第二步】在内存中记录生成结果，本地 storyboard.json 由 finally 统一写入
                 segment["video_url"] = video_url
                 segment["first_frame_url"] = first_frame_url_result
                 segment["last_frame_url"] = last_frame_url_result
                 segment["status"] = "completed"
-                
-                storyboard_data["storyboards"] = storyboards
-                storyboard_data["timestamp"] = datetime.now().isoformat()
-                
-                with open(storyboard_path, "w", encoding="utf-8") as f:
-                    json.dump(storyboard_data, f, ensure_ascii=False, indent=2)
-                    f.flush()
-                    os.fsync(f.fileno())
-                logger.info(f"✅ [edit-and-regenerate] 【备份】已更新本地 storyboard.json")
-            except Exception as file_err:
-                logger.warning(f"⚠️ [edit-and-regenerate] 更新本地文件失败（不影响流程）: {file_err}")
             
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"❌ [edit-and-regenerate] 重新生成视频失败: {e}", exc_info=True)
-            print(f"[edit-and-regenerate] ❌ 视频生成异常: {type(e).__name__}: {e}", flush=True)
-            # 标记状态为失败并回写 storyboard，再向上抛出
-            segment["status"] = "failed"
-            storyboard_data["storyboards"] = storyboards
-            with open(storyboard_path, "w", encoding="utf-8") as f:
-                json.dump(storyboard_data, f, ensure_ascii=False, indent=2)
-            raise HTTPException(status_code=500, detail=f"视频生成失败: {str(e)}")
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"❌ [edit-and-regenerate] 重新生成视频失败: {e}", exc_info=True)
+                # 标记状态为失败（由 finally 回写 storyboard），再向上抛出
+                segment["status"] = "failed"
+                raise HTTPException(status_code=500, detail=f"视频生成失败: {str(e)}")
+            finally:
+                # 【备份】生成结果/失败状态落盘（prompt 已在编辑时写入）
+                # 其他段可能在生成期间已更新文件，只合并本段，保留其余段的最新内容
+                try:
+                    async with lock_service.get_data_lock(req.project_id):
+                        try:
+                            latest_data, storyboard_size = await _read_storyboard_file(storyboard_path)
+                            latest_storyboards = latest_data.get("storyboards", [])
+                            if req.segment_index < len(latest_storyboards):
+                                latest_storyboards[req.segment_index] = segment
+                                storyboard_data, storyboards = latest_data, latest_storyboards
+                        except Exception as read_err:
+                            logger.warning(f"⚠️ [edit-and-regenerate] 读取最新 storyboard.json 失败，使用内存数据: {read_err}")
+                        storyboard_data["storyboards"] = storyboards
+                        storyboard_data["timestamp"] = datetime.now().isoformat()
+                        await _write_storyboard_file(storyboard_path, storyboard_data, size_hint=storyboard_size)
+                        # 分镜最终内容已确定，只序列化一次，供后续飞书回写复用
+                        storyboards_json = jsonutil.dumps(storyboards)
+                    logger.info(f"✅ [edit-and-regenerate] 【备份】已更新本地 storyboard.json: {storyboard_path}")
+                except Exception as file_err:
+                    logger.warning(f"⚠️ [edit-and-regenerate] 更新本地文件失败（不影响流程）: {file_err}")
         
-        # 7. 回写飞书（可选，不阻断流程）
-        try:
-            service = get_feishu_service(req.table_id)
-            app_token = get_app_token(req.table_id)
-            actual_table_id = _feishu_services[req.table_id]["table_id"]
+            # 7. 回写飞书（可选，不阻断流程）
+            try:
+                service = get_feishu_service(req.table_id)
+                app_token = get_app_token(req.table_id)
+                actual_table_id = _feishu_services[req.table_id]["table_id"]
             
-            # 获取记录详情以更新字段
-            records = await service.get_all_records(app_token, actual_table_id)
-            record = next((r for r in records if r.get("record_id") == req.record_id), None)
-            if record:
-                fields = record.get("fields", {})
+                # 获取记录详情以更新字段
+                record = await service.get_record(app_token, actual_table_id, req.record_id)
+                if record:
+                    fields = record.get("fields", {})
                 
-                # 更新 segments_json
-                segments_json = fields.get("segments_json", "{}")
-                if isinstance(segments_json, str):
-                    segments_data = json.loads(segments_json) if segments_json else {}
-                else:
-                    segments_data = segments_json if segments_json else {}
+                    # 更新 segments_json
+                    segments_json = fields.get("segments_json", "{}")
+                    if isinstance(segments_json, str):
+                        segments_data = jsonutil.loads(segments_json) if segments_json else {}
+                    else:
+                        segments_data = segments_json if segments_json else {}
                 
-                segments_data[f"segment_{req.segment_index}"] = {
-                    "video_url": segment.get("video_url", ""),
-                    "last_frame_url": segment.get("last_frame_url", ""),
-                    "status": segment.get("status", "completed")
-                }
+                    segments_data[f"segment_{req.segment_index}"] = {
+                        "video_url": segment.get("video_url", ""),
+                        "last_frame_url": segment.get("last_frame_url", ""),
+                        "status": segment.get("status", "completed")
+                    }
                 
-                # 获取表格字段定义
-                try:
-                    table_fields = await service.get_table_fields(app_token, actual_table_id)
-                    field_name_map = {f.get("field_name"): f.get("field_id") for f in table_fields if f.get("field_name")}
-                    existing_fields = set(fields.keys())
-                except Exception:
-                    field_name_map = {}
-                    existing_fields = set(fields.keys())
+                    # 获取表格字段定义
+                    try:
+                        table_fields = await service.get_table_fields(app_token, actual_table_id)
+                        field_name_map = {f.get("field_name"): f.get("field_id") for f in table_fields if f.get("field_name")}
+                        existing_fields = set(fields.keys())
+                    except Exception:
+                        field_name_map = {}
+                        existing_fields = set(fields.keys())
                 
-                # 构建更新字段
-                # 注意：segments_json 字段在飞书表格中不存在，只存储在本地，不更新到飞书
-                from paretoai.services.feishu_bitable import feishu_date_now_ms
-                update_fields = {
-                    "storyboard_json": json.dumps(storyboards, ensure_ascii=False),
-                    # segments_json 字段在飞书表格中不存在，不更新到飞书
-                    "updated_at": feishu_date_now_ms(),
-                }
+                    # 构建更新字段
+                    # 注意：segments_json 字段在飞书表格中不存在，只存储在本地，不更新到飞书
+                    update_fields = {
+                        "storyboard_json": storyboards_json if storyboards_json is not None else jsonutil.dumps(storyboards),
+                        # segments_json 字段在飞书表格中不存在，不更新到飞书
+                        "updated_at": feishu_date_now_ms(),
+                    }
                 
-                # 更新独立字段（如果存在）
-                # 注意：segment_N_last_frame_url 只存储在本地 storyboard.json，不更新到飞书表格
-                segment_index_str = str(req.segment_index)
-                video_field = f"segment_{segment_index_str}_video_url"
+                    # 更新独立字段（如果存在）
+                    # 注意：segment_N_last_frame_url 只存储在本地 storyboard.json，不更新到飞书表格
+                    segment_index_str = str(req.segment_index)
+                    video_field = f"segment_{segment_index_str}_video_url"
                 
-                if video_field in existing_fields or video_field in field_name_map:
-                    update_fields[video_field] = segment.get("video_url", "")
-                # last_frame_url 只存储在本地，不更新到飞书表格
+                    if video_field in existing_fields or video_field in field_name_map:
+                        update_fields[video_field] = segment.get("video_url", "")
+                    # last_frame_url 只存储在本地，不更新到飞书表格
                 
-                # 更新状态
-                if "status" in existing_fields or "status" in field_name_map:
-                    # 检查是否所有段都完成
-                    segment_count = fields.get("segment_count", 7)
-                    if isinstance(segment_count, str):
-                        segment_count = int(segment_count) if segment_count.isdigit() else 7
-                    elif not isinstance(segment_count, int):
-                        segment_count = 7
+                    # 更新状态
+                    if "status" in existing_fields or "status" in field_name_map:
+                        # 检查是否所有段都完成
+                        segment_count = _coerce_int(fields.get("segment_count"))
                     
-                    all_complete = all(
-                        segments_data.get(f"segment_{i}", {}).get("status") == "completed" or
-                        segments_data.get(f"segment_{i}", {}).get("video_url")
-                        for i in range(segment_count)
-                    )
-                    # 【修复】段生成完成后，状态应该是 storyboard_ready（等待用户推进）
-                    update_fields["status"] = "all_segments_ready" if all_complete else "storyboard_ready"
+                        all_complete = True
+                        for i in range(segment_count):
+                            seg = segments_data.get(f"segment_{i}")
+                            if not seg or (seg.get("status") != "completed" and not seg.get("video_url")):
+                                all_complete = False
+                                break
+                        # 【修复】段生成完成后，状态应该是 storyboard_ready（等待用户推进）
+                        update_fields["status"] = "all_segments_ready" if all_complete else "storyboard_ready"
                 
-                await service.update_record(
-                    app_token,
-                    actual_table_id,
-                    req.record_id,
-                    update_fields
-                )
-                logger.warning(f"✅ 已回写飞书记录: record_id={req.record_id}")
-        except Exception as e:
-            logger.warning(f"⚠️ 回写飞书失败（不影响流程）: {e}")
-        
-        print(f"[edit-and-regenerate] ✅ 全流程完成：已保存 prompt、已调用 LLM 重新生成视频、已回写。video_url={segment.get('video_url', '')[:80] or 'N/A'}...", flush=True)
+                    await service.update_record(
+                        app_token,
+                        actual_table_id,
+                        req.record_id,
+                        update_fields
+                    )
+                    logger.warning(f"✅ 已回写飞书记录: record_id={req.record_id}")
+            except Exception as e:
+                logger.warning(f"⚠️ 回写飞书失败（不影响流程）: {e}")
         
-        # 【并发控制】释放项目锁
-        await lock_service.release_lock(req.project_id)
+            logger.info("[edit-and-regenerate] ✅ 全流程完成 record_id=%s video_url=%.80s", req.record_id, segment.get("video_url") or "N/A")
         
-        # 【任务队列】更新为成功
-        job_store.update_job(job.id, status="succeeded", message=f"段{req.segment_index}重新生成完成")
+            # 【任务队列】更新为成功
+            job_store.update_job(job.id, status="succeeded", message=f"段{req.segment_index}重新生成完成")
         
-        return {
-            "success": True,
-            "message": "提示词已更新并重新生成视频",
-            "prompt_sent": new_prompt,  # 返回实际发送给模型的 prompt，用于前端展示与排障
-            "segment_index": req.segment_index,
-            "video_url": segment.get("video_url"),
-            "first_frame_url": segment.get("first_frame_url"),
-            "last_frame_url": segment.get("last_frame_url")
-        }
+            return {
+                "success": True,
+                "message": "提示词已更新并重新生成视频",
+                "prompt_sent": new_prompt,  # 返回实际发送给模型的 prompt，用于前端展示与排障
+                "segment_index": req.segment_index,
+                "video_url": segment.get("video_url"),
+                "first_frame_url": segment.get("first_frame_url"),
+                "last_frame_url": segment.get("last_frame_url")
+            }
     
     except HTTPException as http_ex:
         # 【任务队列】更新为失败
         job_store.update_job(job.id, status="failed", error=str(http_ex.detail))
-        # 释放锁（如果已获取）
-        if 'lock_service' in locals():
-            await lock_service.release_lock(req.project_id)
         raise
     except Exception as e:
         # 【任务队列】更新为失败
         job_store.update_job(job.id, status="failed", error=str(e))
-        # 释放锁（如果已获取）
-        if 'lock_service' in locals():
-            await lock_service.release_lock(req.project_id)
         logger.error(f"编辑提示词失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2772,124 +2951,133 @@ async def batch_save_prompts(req: BatchSavePromptsRequest):
     2. 更新指定段的字段
     3. 重新构建 prompt
     4. 保存到本地文件（数据源）
-    5. 验证保存成功
+    5. 验证保存成功（BATCH_SAVE_VERIFY_ON_DISK=true 时回读磁盘校验）
     6. 可选：回写飞书（不阻断流程）
 
     返回成功和失败的数量
     """
+    if not req.items:
+        return {"success_count": 0, "failed_count": 0, "results": []}
+
     logger.info(f"[batch-save-prompts] 收到请求: {len(req.items)} 个项目")
 
-    success_count = 0
-    failed_count = 0
-    results = []
+    # 飞书连接信息为请求级不变量，只取一次（未连接时仅保存本地，不回写飞书）
+    conn_info = _feishu_services.get(req.table_id)
 
-    from paretoai.services.project_path_service import get_project_path_service
     path_service = get_project_path_service()
+    lock_service = get_project_lock_service()
+    # record_id -> 该记录最新的 storyboards（本地全部保存后一次性批量回写飞书）
+    pending_writebacks: Dict[str, list] = {}
+    results: List[Optional[dict]] = [None] * len(req.items)
+
+    def _item_result(item: BatchSavePromptsItem, error: Optional[str] = None) -> dict:
+        result = {
+            "success": error is None,
+            "record_id": item.record_id,
+            "project_id": item.project_id,
+            "segment_index": item.segment_index
+        }
+        if error is not None:
+            logger.error(f"❌ 保存提示词失败 (record_id={item.record_id}, project_id={item.project_id}, segment_index={item.segment_index}): {error}")
+            result["error"] = error
+        return result
 
-    for item in req.items:
+    async def _process_project(project_id: str, indexed_items: List[Tuple[int, BatchSavePromptsItem]]) -> None:
+        """同一项目的所有编辑只读写一次 storyboard.json"""
         try:
             # 1. 读取本地 storyboard.json（V2 结构：从数据库获取路径）
-            project_storage_path = path_service.get_project_storage_path(item.project_id)
+            project_storage_path = project_paths.get(project_id)
 
             if not project_storage_path:
-                raise Exception(f"项目 {item.project_id} 不存在于数据库中")
+                raise Exception(f"项目 {project_id} 不存在于数据库中")
+
+            storyboard_path = Path(project_storage_path) / "storyboard.json"
+
+            # 同一项目的 storyboard.json 可能被其他请求同时修改，读-改-写需串行
+            async with lock_service.get_data_lock(project_id):
+                # 读写与 JSON 解析/序列化均在线程池中执行，不阻塞事件循环
+                storyboard_data = await asyncio.to_thread(_load_storyboard, storyboard_path)
+
+                # 2-3. 依次应用该项目的所有编辑（单项失败不影响其他段）
+                applied: List[Tuple[int, BatchSavePromptsItem, str]] = []
+                for idx, item in indexed_items:
+                    try:
+                        applied.append((idx, item, _apply_prompt_edit(storyboard_data, item)))
+                    except Exception as e:
+                        results[idx] = _item_result(item, str(e))
+
+                if not applied:
+                    return
+
+                # 4. 保存到本地文件（数据源）
+                storyboard_data["timestamp"] = datetime.now().isoformat()
+                await _write_storyboard_file(storyboard_path, storyboard_data, fsync=False)
+
+                # 5. 调试用：回读磁盘文件校验（只解析目标段）
+                if BATCH_SAVE_VERIFY_ON_DISK:
+                    for _, item, new_prompt in applied:
+                        await asyncio.to_thread(
+                            _verify_saved_prompt, storyboard_path, item.segment_index, new_prompt
+                        )
+
+                for idx, item, _ in applied:
+                    pending_writebacks[item.record_id] = storyboard_data["storyboards"]
+                    results[idx] = _item_result(item)
+
+            logger.info(f"✅ 已更新 {len(applied)} 个段的提示词并保存到本地: {storyboard_path}")
 
-            project_dir = Path(project_storage_path)
-            storyboard_path = project_dir / "storyboard.json"
-            
-            if not storyboard_path.exists():
-                raise Exception(f"storyboard.json 不存在: {storyboard_path}")
-            
-            # 读取 storyboard 数据
-            with open(storyboard_path, "r", encoding="utf-8") as f:
-                storyboard_data = json.load(f)
-            
-            storyboards = storyboard_data.get("storyboards", [])
-            
-            # 验证 segment_index
-            if item.segment_index < 0 or item.segment_index >= len(storyboards):
-                raise Exception(f"无效的分段索引 (segment_index={item.segment_index}, 总段数={len(storyboards)})")
-            
-            # 2. 更新指定段的字段
-            segment = storyboards[item.segment_index]
-            segment["crucial"] = item.crucial
-            segment["action"] = item.action
-            segment["sound"] = item.sound
-            segment["negative_constraint"] = item.negative_constraint
-            
-            # 更新中文字段（如果提供）
-            if item.crucial_zh:
-                segment["crucial_zh"] = item.crucial_zh
-            if item.action_zh:
-                segment["action_zh"] = item.action_zh
-            if item.sound_zh:
-                segment["sound_zh"] = item.sound_zh
-            if item.negative_constraint_zh:
-                segment["negative_constraint_zh"] = item.negative_constraint_zh
-            
-            # 3. 重新构建 prompt
-            new_prompt = _construct_full_prompt(segment)
-            segment["prompt"] = new_prompt
-            
-            # 4. 保存到本地文件（数据源）
-            storyboard_data["storyboards"] = storyboards
-            storyboard_data["timestamp"] = datetime.now().isoformat()
-            
-            # 确保目录存在
-            project_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 写入文件并强制刷新
-            with open(storyboard_path, "w", encoding="utf-8") as f:
-                json.dump(storyboard_data, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())  # 强制刷新到磁盘
-            
-            # 5. 验证保存成功
-            with open(storyboard_path, "r", encoding="utf-8") as f:
-                verify_data = json.load(f)
-            verify_segment = verify_data.get("storyboards", [])[item.segment_index]
-            if verify_segment.get("prompt") != new_prompt:
-                raise Exception("保存验证失败：保存的 prompt 与预期不符")
-            
-            logger.info(f"✅ 已更新段{item.segment_index}的提示词并保存到本地: {storyboard_path}")
-            
-            # 6. 可选：回写飞书（不阻断流程）
-            try:
-                service = get_feishu_service(req.table_id)
-                app_token = get_app_token(req.table_id)
-                actual_table_id = _feishu_services[req.table_id]["table_id"]
-                
-                # 更新飞书表格的 storyboard_json（可选，不阻断流程）
-                await service.update_record(
-                    app_token,
-                    actual_table_id,
-                    item.record_id,
-                    {"storyboard_json": json.dumps(storyboards, ensure_ascii=False)}
-                )
-                logger.debug(f"✅ 已回写飞书: record_id={item.record_id}")
-            except Exception as e:
-                logger.warning(f"⚠️ 回写飞书失败（不影响流程）: {e}")
-            
-            success_count += 1
-            results.append({
-                "success": True,
-                "record_id": item.record_id,
-                "project_id": item.project_id,
-                "segment_index": item.segment_index
-            })
-        
         except Exception as e:
-            failed_count += 1
-            error_msg = str(e)
-            logger.error(f"❌ 保存提示词失败 (record_id={item.record_id}, project_id={item.project_id}, segment_index={item.segment_index}): {error_msg}")
-            results.append({
-                "success": False,
-                "record_id": item.record_id,
-                "project_id": item.project_id,
-                "segment_index": item.segment_index,
-                "error": error_msg
-            })
-    
+            for idx, item in indexed_items:
+                if results[idx] is None:
+                    results[idx] = _item_result(item, str(e))
+
+    # 一次查询获取所有项目路径
+    project_paths = path_service.get_project_storage_paths([item.project_id for item in req.items])
+
+    # 按项目分组：每个项目只读写一次 storyboard.json
+    by_project: Dict[str, List[Tuple[int, BatchSavePromptsItem]]] = defaultdict(list)
+    for idx, item in enumerate(req.items):
+        by_project[item.project_id].append((idx, item))
+
+    # 并发处理各项目
+    gathered = await asyncio.gather(
+        *(_process_project(project_id, indexed_items) for project_id, indexed_items in by_project.items()),
+        return_exceptions=True
+    )
+    for result in gathered:
+        if isinstance(result, BaseException):
+            logger.error(f"❌ 保存提示词异常: {result}")
+
+    # 兜底：未写入结果的项视为失败（结果顺序与请求顺序一致）
+    results = [
+        result if result is not None else _item_result(item, "保存过程异常中断")
+        for item, result in zip(req.items, results)
+    ]
+
+    success_count = sum(1 for r in results if r["success"])
+    failed_count = len(results) - success_count
+
+    # 6. 可选：批量回写飞书（不阻断流程）
+    if pending_writebacks and conn_info is None:
+        logger.warning(f"⚠️ 未连接飞书表格，跳过回写（不影响流程）: table_id={req.table_id}")
+    elif pending_writebacks:
+        try:
+            # 更新飞书表格的 storyboard_json（每 500 条一次 batch_update 请求）
+            writeback_result = await conn_info["service"].batch_update_records(
+                conn_info["app_token"],
+                conn_info["table_id"],
+                [
+                    {"record_id": record_id, "fields": {"storyboard_json": jsonutil.dumps(storyboards)}}
+                    for record_id, storyboards in pending_writebacks.items()
+                ]
+            )
+            if writeback_result["failed_count"]:
+                logger.warning(f"⚠️ 回写飞书部分失败（不影响流程）: {writeback_result['errors']}")
+            else:
+                logger.debug(f"✅ 已回写飞书: {writeback_result['success_count']} 条记录")
+        except Exception as e:
+            logger.warning(f"⚠️ 回写飞书失败（不影响流程）: {e}")
+
     logger.info(f"[batch-save-prompts] 完成: 成功 {success_count}, 失败 {failed_count}")
     
     return {
@@ -2932,12 +3120,16 @@ async def sync_to_drive(req: SyncToDriveRequest):
     - folder_token: 飞书云空间文件夹 Token
     - date_prefix: 日期前缀（可选，默认 YYYYMMDD）
 
-    返回：
+    返回（流式 JSON，每个项目完成即输出，details 按完成顺序排列）：
+    - details: 详细结果
     - total: 总数
     - success: 成功数
     - failed: 失败数
-    - details: 详细结果
     """
+    # 空请求直接返回，不创建云空间服务、不查库
+    if not req.project_ids:
+        return {"total": 0, "success": 0, "failed": 0, "details": []}
+
     try:
         logger.info(f"[sync-to-drive] 开始同步 {len(req.project_ids)} 个项目到云空间")
 
@@ -2963,82 +3155,76 @@ async def sync_to_drive(req: SyncToDriveRequest):
             user_oauth_store=user_oauth_store,
         )
 
-        # V2 结构：从数据库获取每个项目的完整路径
-        from paretoai.services.project_path_service import get_project_path_service
-        from sqlmodel import select
-        from paretoai.models import BatchTask
-        from paretoai.db import engine
-
+        # V2 结构：从数据库获取每个项目的完整路径（一次查询）
         path_service = get_project_path_service()
+        project_paths = path_service.get_project_storage_paths(req.project_ids)
 
-        # 获取项目路径映射
-        project_paths = {}
-        with Session(engine) as session:
-            for project_id in req.project_ids:
-                storage_path = path_service.get_project_storage_path(project_id)
-                if storage_path:
-                    project_paths[project_id] = storage_path
-                else:
-                    logger.warning(f"项目 {project_id} 不存在于数据库中")
-
-        # 逐个同步项目（V2 结构：直接使用完整路径）
-        results = {
-            "total": len(req.project_ids),
-            "success": 0,
-            "failed": 0,
-            "details": []
-        }
+        # 并发同步项目（V2 结构：直接使用完整路径），限制并发数以免触发云空间限流
+        semaphore = asyncio.Semaphore(DRIVE_SYNC_CONCURRENCY)
 
-        for project_id in req.project_ids:
+        async def _sync_one(project_id: str) -> dict:
             if project_id not in project_paths:
-                results["failed"] += 1
-                results["details"].append({
+                return {
                     "project_id": project_id,
                     "success": False,
                     "error": "项目不存在于数据库中"
-                })
-                continue
+                }
 
             try:
                 publish_date = req.project_publish_dates.get(project_id) if req.project_publish_dates else None
                 project_path = project_paths[project_id]
 
-                result = await drive_service.sync_project_to_drive(
-                    parent_folder_token=req.folder_token,
-                    project_id=project_id,
-                    project_root_path=project_path,  # V2: 直接传递完整路径
-                    publish_date=publish_date,
-                    incremental=req.incremental
-                )
+                async with semaphore:
+                    result = await drive_service.sync_project_to_drive(
+                        parent_folder_token=req.folder_token,
+                        project_id=project_id,
+                        project_root_path=project_path,  # V2: 直接传递完整路径
+                        publish_date=publish_date,
+                        incremental=req.incremental
+                    )
 
                 if result.get("folder_token"):
-                    results["success"] += 1
-                    results["details"].append({
+                    return {
                         "project_id": project_id,
                         "success": True,
                         "folder_url": result.get("folder_url"),
                         "folder_token": result.get("folder_token")
-                    })
-                else:
-                    results["failed"] += 1
-                    results["details"].append({
-                        "project_id": project_id,
-                        "success": False,
-                        "error": "同步失败"
-                    })
+                    }
+                return {
+                    "project_id": project_id,
+                    "success": False,
+                    "error": "同步失败"
+                }
 
             except Exception as e:
-                results["failed"] += 1
-                results["details"].append({
+                logger.error(f"同步项目 {project_id} 失败: {e}")
+                return {
                     "project_id": project_id,
                     "success": False,
                     "error": str(e)
-                })
-                logger.error(f"同步项目 {project_id} 失败: {e}")
-
-        logger.info(f"[sync-to-drive] 同步完成: 成功 {results['success']}/{results['total']}, 失败 {results['failed']}")
+                }
 
-        return results
+        async def _stream_results():
+            """按完成顺序逐条输出 details，最后输出汇总字段"""
+            tasks = [asyncio.ensure_future(_sync_one(project_id)) for project_id in req.project_ids]
+            success = 0
+            try:
+                yield '{"details":['
+                for i, next_done in enumerate(asyncio.as_completed(tasks)):
+                    detail = await next_done
+                    if detail["success"]:
+                        success += 1
+                    yield ("," if i else "") + jsonutil.dumps(detail)
+
+                total = len(tasks)
+                logger.info(f"[sync-to-drive] 同步完成: 成功 {success}/{total}, 失败 {total - success}")
+                yield f'],"total":{total},"success":{success},"failed":{total - success}}}'
+            finally:
+                # 客户端提前断开时取消未完成的同步
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(_stream_results(), media_type="application/json")
 
     except HTTPException:
         raise
@@ -3049,6 +3235,246 @@ async def sync_to_drive(req: SyncToDriveRequest):
 
 # ========== 飞书云空间 OAuth 用户授权 ==========
 
+# OAuth 页面均为静态内容，模块加载时预先构建（错误页仅替换错误信息）
+_OAUTH_SUCCESS_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>授权成功</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background: #1a1a1a;
+            color: #fff;
+        }
+        .container {
+            text-align: center;
+            padding: 40px;
+        }
+        h1 { color: #10b981; }
+        p { color: #9ca3af; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>✅ 授权成功！</h1>
+        <p>云空间用户授权已完成，现在可以使用同步到云空间功能了。</p>
+        <p>您可以关闭此窗口返回批量处理工坊。</p>
+    </div>
+</body>
+</html>
+""".encode("utf-8")
+
+_OAUTH_ERROR_TEMPLATE = string.Template("""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>授权失败</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background: #1a1a1a;
+            color: #fff;
+        }
+        .container {
+            text-align: center;
+            padding: 40px;
+        }
+        h1 { color: #ef4444; }
+        p { color: #9ca3af; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>❌ 授权失败</h1>
+        <p>错误信息: $error</p>
+        <p>请关闭此窗口重试。</p>
+    </div>
+</body>
+</html>
+""")
+
+_OAUTH_SUBMIT_FORM_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>手动提交飞书授权码</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            min-height: 100vh;
+            margin: 0;
+            background: #1a1a1a;
+            color: #fff;
+        }
+        .container {
+            width: 100%;
+            max-width: 500px;
+            padding: 40px;
+            background: #2a2a2a;
+            border-radius: 12px;
+            box-shadow: 0 4px 20px rgba(0,0,0,0.3);
+        }
+        h1 {
+            color: #10b981;
+            margin-bottom: 10px;
+            font-size: 24px;
+        }
+        .subtitle {
+            color: #9ca3af;
+            margin-bottom: 30px;
+            font-size: 14px;
+        }
+        .form-group {
+            margin-bottom: 20px;
+        }
+        label {
+            display: block;
+            margin-bottom: 8px;
+            color: #d1d5db;
+            font-size: 14px;
+        }
+        input, textarea {
+            width: 100%;
+            padding: 12px;
+            background: #1a1a1a;
+            border: 1px solid #3a3a3a;
+            border-radius: 6px;
+            color: #fff;
+            font-size: 14px;
+            box-sizing: border-box;
+        }
+        input:focus, textarea:focus {
+            outline: none;
+            border-color: #10b981;
+        }
+        textarea {
+            min-height: 80px;
+            font-family: monospace;
+        }
+        button {
+            width: 100%;
+            padding: 12px;
+            background: #10b981;
+            color: #fff;
+            border: none;
+            border-radius: 6px;
+            font-size: 16px;
+            font-weight: 500;
+            cursor: pointer;
+            transition: background 0.2s;
+        }
+        button:hover {
+            background: #059669;
+        }
+        .result {
+            margin-top: 20px;
+            padding: 12px;
+            border-radius: 6px;
+            display: none;
+        }
+        .result.success {
+            background: #10b98120;
+            border: 1px solid #10b981;
+        }
+        .result.error {
+            background: #ef444420;
+            border: 1px solid #ef4444;
+        }
+        .hint {
+            font-size: 12px;
+            color: #6b7280;
+            margin-top: 6px;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>✍️ 手动提交飞书授权码</h1>
+        <p class="subtitle">从飞书授权页面复制 code 和 state 填入下方</p>
+
+        <form id="oauthForm">
+            <div class="form-group">
+                <label for="code">授权码 (code)</label>
+                <textarea id="code" name="code" placeholder="粘贴飞书页面显示的 code 值" required></textarea>
+                <p class="hint">从飞书授权页面复制</p>
+            </div>
+
+            <div class="form-group">
+                <label for="state">状态 (state)</label>
+                <input type="text" id="state" name="state" placeholder="tblnj7Q3VrwLauKb" required>
+                <p class="hint">通常是 table_id，例如: tblnj7Q3VrwLauKb</p>
+            </div>
+
+            <button type="submit">提交授权</button>
+        </form>
+
+        <div id="result" class="result"></div>
+    </div>
+
+    <script>
+        document.getElementById('oauthForm').addEventListener('submit', async (e) => {
+            e.preventDefault();
+
+            const code = document.getElementById('code').value.trim();
+            const state = document.getElementById('state').value.trim();
+            const resultDiv = document.getElementById('result');
+
+            if (!code || !state) {
+                resultDiv.className = 'result error';
+                resultDiv.style.display = 'block';
+                resultDiv.textContent = '❌ 请填写所有字段';
+                return;
+            }
+
+            try {
+                const response = await fetch('/api/batch/drive/oauth/submit-code', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({ code, state })
+                });
+
+                const data = await response.json();
+
+                if (data.success) {
+                    resultDiv.className = 'result success';
+                    resultDiv.style.display = 'block';
+                    resultDiv.innerHTML = `
+                        <strong>✅ 授权成功！</strong><br>
+                        表格ID: ${data.table_id}<br>
+                        权限范围: ${data.scope}<br>
+                        过期时间: ${new Date(data.expires_at * 1000).toLocaleString()}<br><br>
+                        <small>现在可以关闭此窗口，返回批量处理工坊使用"同步到云空间"功能了。</small>
+                    `;
+                } else {
+                    throw new Error(data.message || '授权失败');
+                }
+            } catch (error) {
+                resultDiv.className = 'result error';
+                resultDiv.style.display = 'block';
+                resultDiv.textContent = '❌ ' + error.message;
+            }
+        });
+    </script>
+</body>
+</html>
+""".encode("utf-8")
+
 @router.get("/drive/oauth/status")
 async def get_drive_oauth_status(table_id: str):
     """
@@ -3064,7 +3490,6 @@ async def get_drive_oauth_status(table_id: str):
             return {"authorized": False, "reason": "no_token"}
 
         # 检查 token 是否过期
-        import time
         now = time.time()
         if now >= token.expires_at:
             return {"authorized": False, "reason": "expired"}
@@ -3106,7 +3531,6 @@ async def start_drive_oauth(table_id: str):
         )
 
         # 直接重定向到飞书授权页面
-        from fastapi.responses import RedirectResponse
         logger.info(f"[drive/oauth/start] 重定向到飞书授权页面: table_id={table_id}")
         return RedirectResponse(url=auth_url, status_code=302)
 
@@ -3155,82 +3579,12 @@ async def handle_drive_oauth_callback(
         logger.info(f"[drive/oauth/callback] 用户授权成功: table_id={table_id}, scope={token.scope}")
 
         # 返回简单的 HTML 页面，提示用户授权成功
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>授权成功</title>
-            <style>
-                body {{
-                    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                    height: 100vh;
-                    margin: 0;
-                    background: #1a1a1a;
-                    color: #fff;
-                }}
-                .container {{
-                    text-align: center;
-                    padding: 40px;
-                }}
-                h1 {{ color: #10b981; }}
-                p {{ color: #9ca3af; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>✅ 授权成功！</h1>
-                <p>云空间用户授权已完成，现在可以使用同步到云空间功能了。</p>
-                <p>您可以关闭此窗口返回批量处理工坊。</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        from fastapi.responses import HTMLResponse
-        return HTMLResponse(content=html_content)
+        return HTMLResponse(content=_OAUTH_SUCCESS_HTML)
 
     except Exception as e:
         logger.error(f"[drive/oauth/callback] 处理回调失败: {e}", exc_info=True)
-        from fastapi.responses import HTMLResponse
-        error_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>授权失败</title>
-            <style>
-                body {{
-                    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                    height: 100vh;
-                    margin: 0;
-                    background: #1a1a1a;
-                    color: #fff;
-                }}
-                .container {{
-                    text-align: center;
-                    padding: 40px;
-                }}
-                h1 {{ color: #ef4444; }}
-                p {{ color: #9ca3af; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>❌ 授权失败</h1>
-                <p>错误信息: {str(e)}</p>
-                <p>请关闭此窗口重试。</p>
-            </div>
-        </body>
-        </html>
-        """
-        return HTMLResponse(content=error_html)
+        # 错误信息需转义后再嵌入页面，避免 XSS
+        return HTMLResponse(content=_OAUTH_ERROR_TEMPLATE.substitute(error=html.escape(str(e))))
 
 
 @router.post("/drive/oauth/submit-code")
@@ -3290,179 +3644,7 @@ async def drive_oauth_submit_form():
     """
     返回一个 HTML 表单页面，用于手动提交授权码
     """
-    from fastapi.responses import HTMLResponse
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>手动提交飞书授权码</title>
-        <style>
-            body {
-                font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                min-height: 100vh;
-                margin: 0;
-                background: #1a1a1a;
-                color: #fff;
-            }
-            .container {
-                width: 100%;
-                max-width: 500px;
-                padding: 40px;
-                background: #2a2a2a;
-                border-radius: 12px;
-                box-shadow: 0 4px 20px rgba(0,0,0,0.3);
-            }
-            h1 {
-                color: #10b981;
-                margin-bottom: 10px;
-                font-size: 24px;
-            }
-            .subtitle {
-                color: #9ca3af;
-                margin-bottom: 30px;
-                font-size: 14px;
-            }
-            .form-group {
-                margin-bottom: 20px;
-            }
-            label {
-                display: block;
-                margin-bottom: 8px;
-                color: #d1d5db;
-                font-size: 14px;
-            }
-            input, textarea {
-                width: 100%;
-                padding: 12px;
-                background: #1a1a1a;
-                border: 1px solid #3a3a3a;
-                border-radius: 6px;
-                color: #fff;
-                font-size: 14px;
-                box-sizing: border-box;
-            }
-            input:focus, textarea:focus {
-                outline: none;
-                border-color: #10b981;
-            }
-            textarea {
-                min-height: 80px;
-                font-family: monospace;
-            }
-            button {
-                width: 100%;
-                padding: 12px;
-                background: #10b981;
-                color: #fff;
-                border: none;
-                border-radius: 6px;
-                font-size: 16px;
-                font-weight: 500;
-                cursor: pointer;
-                transition: background 0.2s;
-            }
-            button:hover {
-                background: #059669;
-            }
-            .result {
-                margin-top: 20px;
-                padding: 12px;
-                border-radius: 6px;
-                display: none;
-            }
-            .result.success {
-                background: #10b98120;
-                border: 1px solid #10b981;
-            }
-            .result.error {
-                background: #ef444420;
-                border: 1px solid #ef4444;
-            }
-            .hint {
-                font-size: 12px;
-                color: #6b7280;
-                margin-top: 6px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>✍️ 手动提交飞书授权码</h1>
-            <p class="subtitle">从飞书授权页面复制 code 和 state 填入下方</p>
-
-            <form id="oauthForm">
-                <div class="form-group">
-                    <label for="code">授权码 (code)</label>
-                    <textarea id="code" name="code" placeholder="粘贴飞书页面显示的 code 值" required></textarea>
-                    <p class="hint">从飞书授权页面复制</p>
-                </div>
-
-                <div class="form-group">
-                    <label for="state">状态 (state)</label>
-                    <input type="text" id="state" name="state" placeholder="tblnj7Q3VrwLauKb" required>
-                    <p class="hint">通常是 table_id，例如: tblnj7Q3VrwLauKb</p>
-                </div>
-
-                <button type="submit">提交授权</button>
-            </form>
-
-            <div id="result" class="result"></div>
-        </div>
-
-        <script>
-            document.getElementById('oauthForm').addEventListener('submit', async (e) => {
-                e.preventDefault();
-
-                const code = document.getElementById('code').value.trim();
-                const state = document.getElementById('state').value.trim();
-                const resultDiv = document.getElementById('result');
-
-                if (!code || !state) {
-                    resultDiv.className = 'result error';
-                    resultDiv.style.display = 'block';
-                    resultDiv.textContent = '❌ 请填写所有字段';
-                    return;
-                }
-
-                try {
-                    const response = await fetch('/api/batch/drive/oauth/submit-code', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({ code, state })
-                    });
-
-                    const data = await response.json();
-
-                    if (data.success) {
-                        resultDiv.className = 'result success';
-                        resultDiv.style.display = 'block';
-                        resultDiv.innerHTML = `
-                            <strong>✅ 授权成功！</strong><br>
-                            表格ID: ${data.table_id}<br>
-                            权限范围: ${data.scope}<br>
-                            过期时间: ${new Date(data.expires_at * 1000).toLocaleString()}<br><br>
-                            <small>现在可以关闭此窗口，返回批量处理工坊使用"同步到云空间"功能了。</small>
-                        `;
-                    } else {
-                        throw new Error(data.message || '授权失败');
-                    }
-                } catch (error) {
-                    resultDiv.className = 'result error';
-                    resultDiv.style.display = 'block';
-                    resultDiv.textContent = '❌ ' + error.message;
-                }
-            });
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+    return HTMLResponse(content=_OAUTH_SUBMIT_FORM_HTML)
 
 
 # ============================================================================
@@ -3485,10 +3667,10 @@ async def get_segment_history(
         历史记录列表
     """
     try:
-        from paretoai.services.archive_service import get_archive_service
         archive_service = get_archive_service()
         
-        history = archive_service.get_segment_history(project_id, segment_index)
+        with session_scope() as session:
+            history = archive_service.get_segment_history(project_id, segment_index, session=session)
         
         return {
             "success": True,
@@ -3513,7 +3695,6 @@ async def list_archive_files(project_id: str):
         归档文件列表
     """
     try:
-        from paretoai.services.project_path_service import get_project_path_service
         path_service = get_project_path_service()
         project_storage_path = path_service.get_project_storage_path(project_id)
         
@@ -3523,10 +3704,10 @@ async def list_archive_files(project_id: str):
                 "message": "项目不存在或无存储路径"
             }
         
-        from pathlib import Path
         archive_dir = Path(project_storage_path) / "archive"
+        archives = await asyncio.to_thread(_scan_archive_dir, archive_dir)
         
-        if not archive_dir.exists():
+        if archives is None:
             return {
                 "success": True,
                 "project_id": project_id,
@@ -3534,22 +3715,6 @@ async def list_archive_files(project_id: str):
                 "message": "暂无归档文件"
             }
         
-        archives = []
-        for segment_dir in sorted(archive_dir.iterdir()):
-            if segment_dir.is_dir() and segment_dir.name.startswith("segment_"):
-                segment_archives = []
-                for timestamp_dir in sorted(segment_dir.iterdir(), reverse=True):
-                    if timestamp_dir.is_dir():
-                        files = [f.name for f in timestamp_dir.iterdir() if f.is_file()]
-                        segment_archives.append({
-                            "timestamp": timestamp_dir.name,
-                            "files": files
-                        })
-                archives.append({
-                    "segment": segment_dir.name,
-                    "versions": segment_archives
-                })
-        
         return {
             "success": True,
             "project_id": project_id,
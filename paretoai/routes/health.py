@@ -1,18 +1,28 @@
 """
 健康检查和性能监控路由
 """
-import re
+import time
+import asyncio
 from collections import Counter
+from typing import Dict, Tuple
 from fastapi import APIRouter
 from datetime import datetime
+from sqlalchemy import text
 from sqlmodel import select, func
 
 from ..db import session_scope
 from ..models import Note, Creator, TwinAnalysis
 from ..rate_limiter import get_rate_limiter
+from ..services.note_tag_service import TAG_RE
 
 router = APIRouter(tags=["health"])
 
+# Dashboard 统计缓存：top_tags_limit -> (缓存时间, 结果)，轮询场景下避免重复查库
+DASHBOARD_STATS_TTL = 15
+_DASHBOARD_STATS_CACHE_MAX = 16
+_stats_cache: Dict[int, Tuple[float, dict]] = {}
+_stats_lock = asyncio.Lock()
+
 
 @router.get("/health")
 def health_check():
@@ -27,49 +37,135 @@ def get_rate_limit_status():
     return limiter.get_status()
 
 
+# PostgreSQL：在数据库内用 regexp_matches 提取并聚合标签，只返回 top_tags_limit 行
+# （字符类已排除 "["，匹配结果天然不含 [话题] 后缀）
+_PG_TOP_TAGS_SQL = text("""
+    SELECT tag, COUNT(*) AS c
+    FROM (
+        SELECT unnest(regexp_matches(n.content, :pattern, 'g')) AS tag
+        FROM (
+            SELECT content FROM note
+            WHERE content IS NOT NULL AND content <> ''
+            ORDER BY likes DESC
+            LIMIT 500
+        ) n
+    ) t
+    GROUP BY tag
+    ORDER BY c DESC
+    LIMIT :k
+""")
+_PG_TAG_PATTERN = r'#[^\s#\[]+'
+
+
+def _scan_top_tags(session, top_tags_limit: int):
+    """从点赞最高的 500 条笔记正文中提取并聚合热门标签"""
+    if session.get_bind().dialect.name == "postgresql":
+        rows = session.execute(_PG_TOP_TAGS_SQL, {"pattern": _PG_TAG_PATTERN, "k": top_tags_limit}).all()
+        return [{"tag": tag, "count": count} for tag, count in rows]
+
+    # 其他数据库（SQLite）：在 Python 中提取；限制只处理最近的笔记以提高性能
+    # 分批流式读取（服务端游标），边接收边提取，不在内存中一次性物化 500 条正文
+    recent_notes = session.exec(
+        select(Note.content)
+        .where(Note.content != None)
+        .where(Note.content != "")
+        .order_by(Note.likes.desc())
+        .limit(500)  # 只取点赞最高的500条计算标签
+        .execution_options(yield_per=100)
+    )
+
+    tag_counts = Counter()
+    for content in recent_notes:
+        # 不含 "#" 的笔记直接跳过（str 包含判断为 C 实现的单遍扫描，远快于进入正则引擎）
+        if not isinstance(content, str) or "#" not in content:
+            continue
+        for raw in TAG_RE.findall(content):
+            tag = raw.replace('[话题]', '').strip()
+            if tag:
+                tag_counts[tag] += 1
+
+    return [
+        {"tag": tag, "count": count}
+        for tag, count in tag_counts.most_common(top_tags_limit)
+    ]
+
+
+# 行数估算值超过该阈值时直接使用估算值（Dashboard 展示无需精确计数）
+FAST_COUNT_MIN_ROWS = 100_000
+_PG_ESTIMATE_SQL = text("SELECT reltuples::BIGINT FROM pg_class WHERE relname = :t")
+
+
+def fast_count(session, model) -> int:
+    """
+    统计表行数：PostgreSQL 大表使用 pg_class.reltuples 估算值，避免 COUNT(*) 全表扫描；
+    小表、未 ANALYZE 的表及其他数据库仍使用精确 COUNT
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        estimate = session.execute(_PG_ESTIMATE_SQL, {"t": model.__tablename__}).scalar()
+        if estimate is not None and estimate >= FAST_COUNT_MIN_ROWS:
+            return int(estimate)
+    return session.exec(select(func.count()).select_from(model)).one()
+
+
+def _get_cached_stats(top_tags_limit: int):
+    """返回未过期的缓存结果，没有则返回 None"""
+    cached = _stats_cache.get(top_tags_limit)
+    if cached and time.monotonic() - cached[0] < DASHBOARD_STATS_TTL:
+        return cached[1]
+    return None
+
+
 @router.get("/dashboard/stats")
-def get_dashboard_stats(top_tags_limit: int = 30):
+async def get_dashboard_stats(top_tags_limit: int = 30):
     """
     获取首页 Dashboard 所需的汇总统计数据
-    优化：单次 API 调用返回所有首页需要的数据，避免多次请求
+    优化：单次 API 调用返回所有首页需要的数据，避免多次请求；
+    结果缓存 DASHBOARD_STATS_TTL 秒，并发请求只查询一次
     """
+    result = _get_cached_stats(top_tags_limit)
+    if result is not None:
+        return result
+
+    async with _stats_lock:
+        # 双重检查：等待锁期间可能已被其他请求刷新
+        result = _get_cached_stats(top_tags_limit)
+        if result is not None:
+            return result
+
+        result = await _query_dashboard_stats(top_tags_limit)
+        if len(_stats_cache) >= _DASHBOARD_STATS_CACHE_MAX:
+            _stats_cache.clear()
+        _stats_cache[top_tags_limit] = (time.monotonic(), result)
+        return result
+
+
+def _count_table(model) -> int:
+    """统计单表行数（独立会话，在线程池中执行）"""
     with session_scope() as session:
-        # 使用 COUNT 查询，避免全表扫描
-        creators_count = session.exec(select(func.count()).select_from(Creator)).one()
-        notes_count = session.exec(select(func.count()).select_from(Note)).one()
-        analyses_count = session.exec(select(func.count()).select_from(TwinAnalysis)).one()
-
-        # 获取热门标签（从笔记内容中提取并聚合）
-        # 限制只处理最近的笔记以提高性能
-        recent_notes = session.exec(
-            select(Note.content)
-            .where(Note.content != None)
-            .where(Note.content != "")
-            .order_by(Note.likes.desc())
-            .limit(500)  # 只取点赞最高的500条计算标签
-        ).all()
-
-        tag_counts = Counter()
-        tag_pattern = re.compile(r'#[^\s#\[]+(?:\[话题\])?')
-        for content in recent_notes:
-            if content:
-                matches = tag_pattern.findall(str(content))
-                for raw in matches:
-                    tag = raw.replace('[话题]', '').strip()
-                    if tag:
-                        tag_counts[tag] += 1
-
-        top_tags = [
-            {"tag": tag, "count": count}
-            for tag, count in tag_counts.most_common(top_tags_limit)
-        ]
-
-        return {
-            "stats": {
-                "creators": creators_count,
-                "notes": notes_count,
-                "analyses": analyses_count,
-            },
-            "top_tags": top_tags,
-            "timestamp": datetime.now().isoformat()
-        }
+        return fast_count(session, model)
+
+
+def _query_top_tags(top_tags_limit: int) -> list:
+    """查询热门标签（独立会话，在线程池中执行）"""
+    with session_scope() as session:
+        return _scan_top_tags(session, top_tags_limit)
+
+
+async def _query_dashboard_stats(top_tags_limit: int) -> dict:
+    """并发查询 Dashboard 统计数据：各查询使用独立连接，总耗时取决于最慢的一条"""
+    creators_count, notes_count, analyses_count, top_tags = await asyncio.gather(
+        asyncio.to_thread(_count_table, Creator),
+        asyncio.to_thread(_count_table, Note),
+        asyncio.to_thread(_count_table, TwinAnalysis),
+        asyncio.to_thread(_query_top_tags, top_tags_limit),
+    )
+
+    return {
+        "stats": {
+            "creators": creators_count,
+            "notes": notes_count,
+            "analyses": analyses_count,
+        },
+        "top_tags": top_tags,
+        "timestamp": datetime.now().isoformat()
+    }
@@ -7,13 +7,21 @@ Pareto AI API Server - 简化版
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import logging
 import os
+import time
+import uuid
 from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
 
-from fastapi import FastAPI
+import aiofiles
+import aiohttp
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
 # 简单的日志配置
 logging.basicConfig(
@@ -58,32 +66,138 @@ uploads_path = Path(os.getenv("LOCAL_STORAGE_PATH", "./data/uploads"))
 uploads_path.mkdir(parents=True, exist_ok=True)
 
 # ========== 飞书图片代理 ==========
-@app.get("/proxy/image")
-async def proxy_feishu_image(url: str):
+
+# 代理用 tenant_access_token 缓存：(token, 过期时刻 monotonic)
+# 服务层在 token 即将过期时改为后台刷新并继续返回旧 token（剩余有效期可能只有约 1 分钟），
+# 因此缓存时长取 PROXY_TOKEN_TTL 与 token 实际剩余有效期（扣除安全余量）中的较小值
+PROXY_TOKEN_TTL = 240
+
+# 代理转发图片的分块大小
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# 代理上游请求超时：只限制建连和单次读取间隔，不限制总时长（响应体按客户端速度转发，慢客户端下载大图会超过固定总时长）
+PROXY_UPSTREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=10)
+
+# 代理图片磁盘缓存：{uploads}/_proxy_cache/{hash[:2]}/{hash}（+ .meta 存 Content-Type），有效期 1 天
+PROXY_CACHE_TTL = 86400
+# 代理缓存总大小上限（超出时淘汰最旧的文件）与定期清理间隔
+PROXY_CACHE_MAX_BYTES = int(os.getenv("PROXY_CACHE_MAX_BYTES", str(1 << 30)))
+PROXY_CACHE_PRUNE_INTERVAL = 3600
+proxy_cache_dir = uploads_path / "_proxy_cache"
+
+
+def _proxy_cache_path(url: str) -> Path:
+    """按 URL 哈希计算缓存文件路径"""
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    return proxy_cache_dir / digest[:2] / digest
+
+
+def _proxy_cache_lookup(cache_path: Path) -> Optional[str]:
+    """缓存命中且未过期时返回缓存的 Content-Type，否则返回 None"""
+    try:
+        if time.time() - cache_path.stat().st_mtime > PROXY_CACHE_TTL:
+            return None
+        return cache_path.with_suffix(".meta").read_text(encoding="utf-8").strip() or "image/jpeg"
+    except OSError:
+        return None
+
+
+def _prune_proxy_cache() -> int:
     """
-    代理飞书图片请求
-    
-    飞书图片需要 tenant_access_token 才能访问，
-    前端无法直接访问，需要后端代理。
-    
-    Args:
-        url: 飞书图片的原始 URL (URL encoded)
+    清理代理缓存（启动时及每隔 PROXY_CACHE_PRUNE_INTERVAL 秒调用），返回删除的文件数
+
+    先删除过期文件，剩余总大小超过 PROXY_CACHE_MAX_BYTES 时再按修改时间从旧到新淘汰
     """
-    import aiohttp
-    from urllib.parse import unquote
-    
+    removed = 0
+    cutoff = time.time() - PROXY_CACHE_TTL
     try:
-        # 解码 URL
-        decoded_url = unquote(url)
-        logger.info(f"[Proxy] 代理飞书图片: {decoded_url[:100]}...")
-        
-        # 获取飞书服务实例以获取 token
+        with os.scandir(proxy_cache_dir) as buckets:
+            bucket_paths = [b.path for b in buckets if b.is_dir()]
+    except FileNotFoundError:
+        return 0
+    remaining = []  # (mtime, size, path)
+    total_size = 0
+    for bucket_path in bucket_paths:
+        with os.scandir(bucket_path) as entries:
+            for e in entries:
+                try:
+                    st = e.stat()
+                    if st.st_mtime < cutoff:
+                        os.unlink(e.path)
+                        removed += 1
+                    else:
+                        remaining.append((st.st_mtime, st.st_size, e.path))
+                        total_size += st.st_size
+                except OSError:
+                    continue
+    if total_size > PROXY_CACHE_MAX_BYTES:
+        remaining.sort()
+        for _, size, path in remaining:
+            if total_size <= PROXY_CACHE_MAX_BYTES:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+            total_size -= size
+    return removed
+
+
+async def _prune_proxy_cache_periodically() -> None:
+    """后台定期清理代理缓存（进程长期运行时缓存不会无限增长）"""
+    while True:
+        await asyncio.sleep(PROXY_CACHE_PRUNE_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(_prune_proxy_cache)
+            if removed:
+                logger.info(f"清理代理缓存: {removed} 个文件")
+        except Exception as e:
+            logger.warning(f"清理代理缓存失败: {e}")
+
+
+def _commit_proxy_cache(tmp_path: Path, cache_path: Path, content_type: str) -> None:
+    """先写 meta 再原子替换数据文件：数据文件存在即表示缓存完整"""
+    cache_path.with_suffix(".meta").write_text(content_type, encoding="utf-8")
+    os.replace(tmp_path, cache_path)
+
+
+_proxy_token_cache: Optional[Tuple[str, float]] = None
+_proxy_token_lock = asyncio.Lock()
+
+
+def _create_http_session() -> aiohttp.ClientSession:
+    """创建全局共享的 HTTP 会话（连接池 + DNS 缓存，复用 TCP/TLS 连接）"""
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=10),
+        connector=aiohttp.TCPConnector(limit=100, limit_per_host=30, ttl_dns_cache=300),
+    )
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """获取全局 HTTP 会话（正常由 startup 创建；未创建或已关闭时按需创建）"""
+    session = getattr(app.state, "http", None)
+    if session is None or session.closed:
+        session = app.state.http = _create_http_session()
+    return session
+
+
+async def _get_proxy_token() -> Optional[str]:
+    """获取代理请求使用的飞书 token（从任意已连接的服务获取，带缓存，并发请求只获取一次）"""
+    global _proxy_token_cache
+
+    cached = _proxy_token_cache
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
+
+    async with _proxy_token_lock:
+        cached = _proxy_token_cache
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+
         from .routes.batch import _feishu_services
-        
-        # 尝试从任意已连接的服务获取 token
-        token = None
+
         logger.info(f"[Proxy] 当前已连接的飞书服务: {list(_feishu_services.keys())}")
-        
         for table_id, conn_info in _feishu_services.items():
             try:
                 # _feishu_services 的值是字典，包含 "service" 键
@@ -92,11 +206,47 @@ async def proxy_feishu_image(url: str):
                     token = await service._get_tenant_access_token()
                     if token:
                         logger.info(f"[Proxy] 成功从 table_id={table_id} 获取 token")
-                        break
+                        now = time.monotonic()
+                        expires_at = min(now + PROXY_TOKEN_TTL, service.token_expires_at - service.TOKEN_EXPIRY_MARGIN)
+                        if expires_at > now:
+                            _proxy_token_cache = (token, expires_at)
+                        return token
             except Exception as e:
                 logger.warning(f"[Proxy] 从 table_id={table_id} 获取 token 失败: {e}")
                 continue
+        return None
+
+
+@app.get("/proxy/image")
+async def proxy_feishu_image(url: str):
+    """
+    代理飞书图片请求
+    
+    飞书图片需要 tenant_access_token 才能访问，
+    前端无法直接访问，需要后端代理。
+    
+    Args:
+        url: 飞书图片的原始 URL (URL encoded)
+    """
+    try:
+        # 解码 URL
+        decoded_url = unquote(url)
+        logger.info(f"[Proxy] 代理飞书图片: {decoded_url[:100]}...")
+        
+        # 命中磁盘缓存时直接返回本地文件，不再请求飞书
+        cache_path = _proxy_cache_path(decoded_url)
+        cached_type = await asyncio.to_thread(_proxy_cache_lookup, cache_path)
+        if cached_type:
+            return FileResponse(
+                cache_path,
+                media_type=cached_type,
+                headers={
+                    "Cache-Control": "public, max-age=3600",
+                    "Access-Control-Allow-Origin": "*"
+                }
+            )
         
+        token = await _get_proxy_token()
         if not token:
             logger.warning("[Proxy] 无法获取飞书 token，尝试无认证访问")
         
@@ -105,32 +255,65 @@ async def proxy_feishu_image(url: str):
         if token:
             headers["Authorization"] = f"Bearer {token}"
         
-        # 下载图片（减少超时到 10 秒，避免长时间阻塞）
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(decoded_url, headers=headers) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    content_type = response.headers.get("Content-Type", "image/jpeg")
-                    
-                    from fastapi.responses import Response
-                    return Response(
-                        content=content,
-                        media_type=content_type,
-                        headers={
-                            "Cache-Control": "public, max-age=3600",
-                            "Access-Control-Allow-Origin": "*"
-                        }
-                    )
-                else:
-                    logger.warning(f"[Proxy] 飞书图片请求失败: status={response.status}")
-                    return JSONResponse(
-                        status_code=response.status,
-                        content={"error": f"飞书图片请求失败: {response.status}"}
-                    )
+        # 下载图片（复用全局连接池；建连/读取各 10 秒超时，总时长不限，见 PROXY_UPSTREAM_TIMEOUT）
+        session = _get_http_session()
+        response = await session.get(decoded_url, headers=headers, timeout=PROXY_UPSTREAM_TIMEOUT)
+        if response.status != 200:
+            response.release()
+            logger.warning(f"[Proxy] 飞书图片请求失败: status={response.status}")
+            return JSONResponse(
+                status_code=response.status,
+                content={"error": f"飞书图片请求失败: {response.status}"}
+            )
+        
+        content_type = response.headers.get("Content-Type", "image/jpeg")
+        
+        async def _stream_body():
+            """逐块转发上游响应体并同时写入磁盘缓存，转发结束（或客户端断开）后释放连接"""
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex}.tmp")
+            cache_file = None
+            completed = False
+            try:
+                try:
+                    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+                    cache_file = await aiofiles.open(tmp_path, "wb")
+                except OSError as e:
+                    logger.warning(f"[Proxy] 无法写入缓存，仅转发: {e}")
+                
+                async for chunk in response.content.iter_chunked(PROXY_CHUNK_SIZE):
+                    if cache_file is not None:
+                        await cache_file.write(chunk)
+                    yield chunk
+                completed = True
+            finally:
+                response.release()
+                if cache_file is not None:
+                    await cache_file.close()
+                    try:
+                        if completed:
+                            await asyncio.to_thread(_commit_proxy_cache, tmp_path, cache_path, content_type)
+                        else:
+                            await asyncio.to_thread(os.unlink, tmp_path)
+                    except OSError as e:
+                        logger.warning(f"[Proxy] 写入缓存失败: {e}")
+        
+        async def _release_response():
+            """响应结束后释放上游连接（生成器未开始迭代时其 finally 不会执行，需在此兜底；release 可重复调用）"""
+            response.release()
+
+        # 边下载边转发：内存占用为单个分块大小，客户端无需等待整张图片下载完成
+        return StreamingResponse(
+            _stream_body(),
+            media_type=content_type,
+            headers={
+                "Cache-Control": "public, max-age=3600",
+                "Access-Control-Allow-Origin": "*"
+            },
+            background=BackgroundTask(_release_response),
+        )
     
     except asyncio.TimeoutError:
-        logger.warning(f"[Proxy] 飞书图片请求超时 (10s): {url[:80]}...")
+        logger.warning(f"[Proxy] 飞书图片请求超时: {url[:80]}...")
         return JSONResponse(
             status_code=504,
             content={"error": "飞书图片请求超时"}
@@ -149,8 +332,100 @@ async def proxy_feishu_image(url: str):
         )
 
 # ========== 静态文件服务 ==========
+
+# project_id -> 项目目录缓存（项目目录创建后不会移动，避免每次请求遍历 日期 × 模板 目录）
+_project_dir_cache: Dict[str, Path] = {}
+
+
+def _iter_template_dirs():
+    """遍历 data/uploads/projects/{date}/{template}/ 目录（os.scandir：DirEntry 自带类型信息，无需逐个 stat）"""
+    projects_base = uploads_path / "projects"
+    try:
+        with os.scandir(projects_base) as date_entries:
+            date_dirs = [e.path for e in date_entries if not e.name.startswith('.') and e.is_dir()]
+    except FileNotFoundError:
+        return
+    for date_dir in date_dirs:
+        with os.scandir(date_dir) as template_entries:
+            for e in template_entries:
+                if not e.name.startswith('.') and e.is_dir():
+                    yield e.path
+
+
+def build_project_index() -> int:
+    """启动时扫描所有项目目录，预建 project_id -> 目录 索引，返回项目数"""
+    index: Dict[str, Path] = {}
+    for template_dir in _iter_template_dirs():
+        with os.scandir(template_dir) as project_entries:
+            for e in project_entries:
+                if not e.name.startswith('.') and e.is_dir():
+                    index[e.name] = Path(e.path)
+    _project_dir_cache.update(index)
+    return len(index)
+
+
+def _scan_project_dir(project_id: str) -> Optional[Path]:
+    """在 data/uploads/projects/{date}/{template}/ 下搜索项目目录（索引未命中时的兜底）"""
+    for template_dir in _iter_template_dirs():
+        project_dir = Path(template_dir) / project_id
+        if project_dir.is_dir():
+            return project_dir
+    return None
+
+
+def _file_response(request: Request, path: Path) -> Response:
+    """
+    返回文件响应并支持协商缓存：ETag 由 inode/mtime/size 计算，If-None-Match 命中时返回 304
+
+    段视频重新生成时会原地覆盖同名文件，因此使用 no-cache（每次向服务器确认，未变化时只返回 304）
+    """
+    st = path.stat()
+    etag = '"%s"' % hashlib.blake2b(
+        f"{st.st_ino}-{st.st_mtime_ns}-{st.st_size}".encode(), digest_size=8
+    ).hexdigest()
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers=headers)
+
+    # 传入已获取的 stat 结果，避免 FileResponse 再次 stat；文件内容仍由 sendfile 零拷贝发送
+    return FileResponse(path, headers=headers, stat_result=st)
+
+
+def _find_project_dir(project_id: str) -> Optional[Path]:
+    """
+    查找项目目录：缓存 → 数据库（ProjectPathService）→ 文件系统扫描
+
+    缓存的目录已不存在时（如项目被删除）剔除并重新查找
+    """
+    cached = _project_dir_cache.get(project_id)
+    if cached is not None:
+        if cached.is_dir():
+            return cached
+        _project_dir_cache.pop(project_id, None)
+
+    project_dir = None
+    try:
+        from .services.project_path_service import get_project_path_service
+        storage_path = get_project_path_service().get_project_storage_path(project_id)
+        if storage_path and Path(storage_path).is_dir():
+            project_dir = Path(storage_path)
+    except Exception as e:
+        logger.warning(f"[Storage] 从数据库获取项目路径失败: {e}")
+
+    if project_dir is None:
+        project_dir = _scan_project_dir(project_id)
+
+    if project_dir is not None:
+        _project_dir_cache[project_id] = project_dir
+    return project_dir
+
+
 @app.get("/storage/{file_path:path}")
-async def serve_storage_file(file_path: str):
+async def serve_storage_file(file_path: str, request: Request):
     """
     提供存储文件访问
     支持两种路径格式：
@@ -165,7 +440,7 @@ async def serve_storage_file(file_path: str):
         logger.info(f"[Storage] 尝试直接路径: {full_path.absolute()}, exists={full_path.exists()}")
         if full_path.exists() and full_path.is_file():
             logger.info(f"[Storage] 直接路径命中: {full_path}")
-            return FileResponse(full_path)
+            return _file_response(request, full_path)
         
         # 如果是项目路径格式 projects/{projectId}/xxx.jpg
         if file_path.startswith("projects/"):
@@ -175,23 +450,14 @@ async def serve_storage_file(file_path: str):
                 project_id = parts[1]
                 file_name = "/".join(parts[2:])
                 
-                # 在 data/uploads/projects/ 下搜索项目目录
-                projects_base = uploads_path / "projects"
-                logger.info(f"[Storage] 搜索项目: project_id={project_id}, file_name={file_name}, base={projects_base.absolute()}, exists={projects_base.exists()}")
-                
-                if projects_base.exists():
-                    # 遍历日期目录和模板目录查找项目
-                    for date_dir in projects_base.iterdir():
-                        if date_dir.is_dir() and not date_dir.name.startswith('.'):
-                            for template_dir in date_dir.iterdir():
-                                if template_dir.is_dir() and not template_dir.name.startswith('.'):
-                                    project_dir = template_dir / project_id
-                                    if project_dir.exists():
-                                        target_file = project_dir / file_name
-                                        logger.info(f"[Storage] 检查: {target_file}, exists={target_file.exists()}")
-                                        if target_file.exists() and target_file.is_file():
-                                            logger.info(f"[Storage] ✅ 找到: {file_path} -> {target_file}")
-                                            return FileResponse(target_file)
+                # 查找涉及数据库查询与目录扫描，在线程池中执行，不阻塞事件循环
+                project_dir = await asyncio.to_thread(_find_project_dir, project_id)
+                if project_dir is not None:
+                    target_file = project_dir / file_name
+                    logger.info(f"[Storage] 检查: {target_file}, exists={target_file.exists()}")
+                    if target_file.is_file():
+                        logger.info(f"[Storage] ✅ 找到: {file_path} -> {target_file}")
+                        return _file_response(request, target_file)
         
         logger.warning(f"[Storage] ❌ 文件不存在: {file_path}")
         return JSONResponse(
@@ -212,6 +478,9 @@ async def startup():
     logger.info("PetForge Batch API 启动中...")
     logger.info("=" * 60)
     
+    # 创建全局 HTTP 会话（图片代理复用连接池）
+    app.state.http = _create_http_session()
+    
     # 初始化数据库
     try:
         from .db import init_db
@@ -220,6 +489,22 @@ async def startup():
     except Exception as e:
         logger.warning(f"✗ 数据库初始化失败: {e}")
     
+    # 清理过期的代理图片缓存
+    try:
+        removed = await asyncio.to_thread(_prune_proxy_cache)
+        if removed:
+            logger.info(f"✓ 清理过期代理缓存: {removed} 个文件")
+    except Exception as e:
+        logger.warning(f"✗ 清理代理缓存失败: {e}")
+    app.state.proxy_cache_pruner = asyncio.create_task(_prune_proxy_cache_periodically())
+    
+    # 预建项目目录索引（/storage/projects/{projectId}/... 查找）
+    try:
+        project_count = await asyncio.to_thread(build_project_index)
+        logger.info(f"✓ 项目目录索引完成: {project_count} 个项目")
+    except Exception as e:
+        logger.warning(f"✗ 项目目录索引失败: {e}")
+    
     # 恢复飞书连接
     try:
         from .routes.batch import _restore_feishu_connections
@@ -237,6 +522,32 @@ async def startup():
 async def shutdown():
     """关闭事件"""
     logger.info("服务器关闭中...")
+    
+    # 停止代理缓存定期清理
+    pruner = getattr(app.state, "proxy_cache_pruner", None)
+    if pruner is not None:
+        pruner.cancel()
+    
+    # 关闭全局 HTTP 会话
+    session = getattr(app.state, "http", None)
+    if session is not None and not session.closed:
+        await session.close()
+    
+    # 关闭各飞书服务复用的 HTTP 会话（并发关闭，单个失败不影响其余）
+    from .routes.batch import _feishu_services
+    services = [
+        (table_id, conn.get("service"))
+        for table_id, conn in list(_feishu_services.items())
+    ]
+    services = [(table_id, service) for table_id, service in services if service is not None]
+    table_ids = [table_id for table_id, _ in services]
+    results = await asyncio.gather(
+        *(service.aclose() for _, service in services),
+        return_exceptions=True,
+    )
+    for table_id, result in zip(table_ids, results):
+        if isinstance(result, Exception):
+            logger.warning(f"关闭飞书服务会话失败 (table_id={table_id}): {result}")
 
 # 全局异常处理
 @app.exception_handler(Exception)
@@ -7,10 +7,12 @@ API 任务队列（极简版）
 
 from __future__ import annotations
 
+from collections import defaultdict, deque
 from dataclasses import dataclass, asdict
 from datetime import datetime, timezone
 from threading import Lock
-from typing import Dict, List, Optional
+from itertools import islice
+from typing import Deque, Dict, List, Optional
 import uuid
 
 
@@ -36,11 +38,20 @@ class ApiJob:
         return asdict(self)
 
 
+# _jobs 的分片锁数量（需为 2 的幂）
+LOCK_SHARDS = 16
+
+
 class ApiJobStore:
     def __init__(self, max_items: int = 200):
-        self._lock = Lock()
+        # _order_lock 保护 _order / _by_table；_locks 按 job_id 分片保护单个任务的更新
+        # 加锁顺序固定为 _order_lock -> 分片锁，避免死锁
+        self._order_lock = Lock()
+        self._locks = [Lock() for _ in range(LOCK_SHARDS)]
         self._jobs: Dict[str, ApiJob] = {}
-        self._order: List[str] = []  # newest first
+        self._order: Deque[str] = deque(maxlen=max_items)  # newest first
+        # table_id -> job_id（newest first），list_jobs 只遍历对应表的任务
+        self._by_table: Dict[str, Deque[str]] = defaultdict(deque)
         self._max_items = max_items
 
     def create_job(
@@ -68,16 +79,32 @@ class ApiJobStore:
             message=message,
         )
 
-        with self._lock:
-            self._jobs[job_id] = job
-            self._order.insert(0, job_id)
-            # prune
-            if len(self._order) > self._max_items:
-                for old_id in self._order[self._max_items :]:
-                    self._jobs.pop(old_id, None)
-                self._order = self._order[: self._max_items]
+        with self._order_lock:
+            # prune：deque 满时 appendleft 会挤掉最旧的任务，先同步清理 _jobs 与表索引
+            if len(self._order) == self._max_items:
+                self._evict(self._order[-1])
+            with self._shard(job_id):
+                self._jobs[job_id] = job
+            self._order.appendleft(job_id)
+            self._by_table[table_id].appendleft(job_id)
         return job
 
+    def _shard(self, job_id: str) -> Lock:
+        return self._locks[hash(job_id) & (LOCK_SHARDS - 1)]
+
+    def _evict(self, job_id: str) -> None:
+        """移除最旧的任务（调用方需持有 _order_lock）"""
+        with self._shard(job_id):
+            old = self._jobs.pop(job_id, None)
+        if not old:
+            return
+        # 全局最旧的任务也是其所属表中最旧的任务，位于表索引的末尾
+        table_order = self._by_table.get(old.table_id)
+        if table_order and table_order[-1] == job_id:
+            table_order.pop()
+            if not table_order:
+                del self._by_table[old.table_id]
+
     def update_job(
         self,
         job_id: str,
@@ -86,7 +113,7 @@ class ApiJobStore:
         message: Optional[str] = None,
         error: Optional[str] = None,
     ) -> Optional[ApiJob]:
-        with self._lock:
+        with self._shard(job_id):
             job = self._jobs.get(job_id)
             if not job:
                 return None
@@ -100,16 +127,20 @@ class ApiJobStore:
             return job
 
     def list_jobs(self, *, table_id: str, limit: int = 50) -> List[Dict]:
-        with self._lock:
-            out: List[Dict] = []
-            for job_id in self._order:
-                job = self._jobs.get(job_id)
-                if not job or job.table_id != table_id:
-                    continue
-                out.append(job.to_dict())
-                if len(out) >= max(1, min(limit, 200)):
-                    break
-            return out
+        limit = max(1, min(limit, 200))
+        # 任务只会在持有 _order_lock 时被移除；update_job 只持分片锁，
+        # 因此逐个在分片锁内序列化，避免读到更新了一半的任务
+        with self._order_lock:
+            table_order = self._by_table.get(table_id)
+            if not table_order:
+                return []
+            result: List[Dict] = []
+            for job_id in islice(table_order, limit):
+                with self._shard(job_id):
+                    job = self._jobs.get(job_id)
+                    if job:
+                        result.append(job.to_dict())
+            return result
 
 
 _global_store: Optional[ApiJobStore] = None
@@ -8,21 +8,46 @@
 4. 清理过期归档（可选）
 """
 
-import json
+import os
 import shutil
 import logging
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List
 
+from sqlalchemy import delete, desc
 from sqlmodel import Session, select
 
-from paretoai.models import BatchTask
+from paretoai import jsonutil
+from paretoai.models import BatchTask, SegmentHistory
 from paretoai.db import engine
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def _use_session(session: Optional[Session]) -> Iterator[Session]:
+    """复用调用方传入的会话；未传入时新建一个并在结束后关闭"""
+    if session is not None:
+        yield session
+        return
+    with Session(engine) as own_session:
+        yield own_session
+
+
+def _history_entry(row: SegmentHistory) -> Dict[str, Any]:
+    """SegmentHistory 行转换为接口返回的历史记录条目"""
+    return {
+        "video_url": row.video_url,
+        "first_frame_url": row.first_frame_url,
+        "last_frame_url": row.last_frame_url,
+        "local_video_path": row.local_video_path,
+        "archived_at": row.archived_at.isoformat(),
+        "reason": row.reason,
+    }
+
+
 class ArchiveService:
     """视频归档服务"""
     
@@ -37,7 +62,8 @@ class ArchiveService:
         old_first_frame_url: Optional[str] = None,
         old_last_frame_url: Optional[str] = None,
         old_local_video_path: Optional[str] = None,
-        reason: str = "regenerate"
+        reason: str = "regenerate",
+        session: Optional[Session] = None
     ) -> bool:
         """
         归档指定段的旧数据
@@ -50,66 +76,115 @@ class ArchiveService:
             old_last_frame_url: 旧尾帧URL
             old_local_video_path: 旧本地视频路径
             reason: 归档原因 (regenerate, edit, delete)
+            session: 复用的数据库会话（可选，不传则新建）
         
         Returns:
             是否归档成功
         """
+        # 只有当有实际数据时才归档
+        if not (old_video_url or old_local_video_path):
+            logger.info(f"ℹ️ 段{segment_index} 无旧数据需要归档")
+            return True
+        
         try:
-            with Session(engine) as session:
-                task = session.exec(
-                    select(BatchTask).where(BatchTask.project_id == project_id)
-                ).first()
-                
-                if not task:
-                    logger.error(f"归档失败：任务不存在 project_id={project_id}")
-                    return False
-                
-                # 解析现有历史记录
-                segment_history = {}
-                if task.segment_history:
-                    try:
-                        segment_history = json.loads(task.segment_history)
-                    except:
-                        segment_history = {}
-                
-                # 创建历史记录条目
-                segment_key = f"segment_{segment_index}"
-                if segment_key not in segment_history:
-                    segment_history[segment_key] = []
+            with _use_session(session) as session:
+                self._migrate_legacy_history(session, project_id)
                 
-                history_entry = {
-                    "video_url": old_video_url,
-                    "first_frame_url": old_first_frame_url,
-                    "last_frame_url": old_last_frame_url,
-                    "local_video_path": old_local_video_path,
-                    "archived_at": datetime.utcnow().isoformat(),
-                    "reason": reason
-                }
+                # 追加一行即可，无需读出并重写整份历史 JSON
+                session.add(SegmentHistory(
+                    project_id=project_id,
+                    segment_index=segment_index,
+                    video_url=old_video_url,
+                    first_frame_url=old_first_frame_url,
+                    last_frame_url=old_last_frame_url,
+                    local_video_path=old_local_video_path,
+                    reason=reason,
+                ))
                 
-                # 只有当有实际数据时才添加
-                if old_video_url or old_local_video_path:
-                    segment_history[segment_key].insert(0, history_entry)
-                    
-                    # 限制历史记录数量
-                    if len(segment_history[segment_key]) > self.max_history_per_segment:
-                        segment_history[segment_key] = segment_history[segment_key][:self.max_history_per_segment]
-                    
-                    # 保存到数据库
-                    task.segment_history = json.dumps(segment_history, ensure_ascii=False)
-                    task.updated_at = datetime.utcnow()
-                    session.add(task)
-                    session.commit()
-                    
-                    logger.info(f"✅ 已归档 {project_id} 段{segment_index} 的历史记录")
-                else:
-                    logger.info(f"ℹ️ 段{segment_index} 无旧数据需要归档")
+                # 每次归档后清理本段超出上限的旧记录（按索引定位单个段，开销很小）
+                session.flush()
+                self._prune_segment_history(session, project_id, segment_index)
                 
-                return True
+                session.commit()
+            
+            logger.info(f"✅ 已归档 {project_id} 段{segment_index} 的历史记录")
+            return True
                 
         except Exception as e:
             logger.error(f"归档失败: {e}", exc_info=True)
             return False
     
+    def _migrate_legacy_history(self, session: Session, project_id: str) -> None:
+        """
+        将 BatchTask.segment_history 中的旧 JSON 历史迁移到 SegmentHistory 表并清空该列
+        
+        先做无锁的存在性检查，仅在确有旧数据时以 SELECT ... FOR UPDATE 锁定任务行，
+        避免并发归档重复迁移（SQLite 不支持 FOR UPDATE，由其库级写锁保证串行）
+        """
+        legacy_json = session.exec(
+            select(BatchTask.segment_history).where(BatchTask.project_id == project_id)
+        ).first()
+        if not legacy_json:
+            return
+        
+        task = session.exec(
+            select(BatchTask).where(BatchTask.project_id == project_id).with_for_update()
+        ).first()
+        if not task or not task.segment_history:
+            return
+        
+        try:
+            legacy_history = jsonutil.loads(task.segment_history)
+        except ValueError:
+            logger.warning(f"⚠️ 旧历史记录解析失败，已丢弃: project_id={project_id}")
+            legacy_history = {}
+        
+        for segment_key, entries in legacy_history.items():
+            try:
+                segment_index = int(segment_key.rsplit("_", 1)[-1])
+            except ValueError:
+                continue
+            for entry in entries:
+                try:
+                    archived_at = datetime.fromisoformat(entry["archived_at"])
+                except (KeyError, TypeError, ValueError):
+                    archived_at = datetime.utcnow()
+                session.add(SegmentHistory(
+                    project_id=project_id,
+                    segment_index=segment_index,
+                    video_url=entry.get("video_url"),
+                    first_frame_url=entry.get("first_frame_url"),
+                    last_frame_url=entry.get("last_frame_url"),
+                    local_video_path=entry.get("local_video_path"),
+                    archived_at=archived_at,
+                    reason=entry.get("reason") or "regenerate",
+                ))
+        
+        task.segment_history = None
+        task.updated_at = datetime.utcnow()
+        session.add(task)
+        logger.info(f"✅ 已迁移 {project_id} 的旧历史记录到 segment_history 表")
+    
+    def _prune_segment_history(self, session: Session, project_id: str, segment_index: int) -> None:
+        """删除指定段超出 max_history_per_segment 的旧记录"""
+        keep_ids = (
+            select(SegmentHistory.id)
+            .where(
+                SegmentHistory.project_id == project_id,
+                SegmentHistory.segment_index == segment_index,
+            )
+            .order_by(desc(SegmentHistory.archived_at), desc(SegmentHistory.id))
+            .limit(self.max_history_per_segment)
+            .scalar_subquery()
+        )
+        session.execute(
+            delete(SegmentHistory).where(
+                SegmentHistory.project_id == project_id,
+                SegmentHistory.segment_index == segment_index,
+                SegmentHistory.id.not_in(keep_ids),
+            )
+        )
+    
     def move_local_files_to_archive(
         self,
         project_id: str,
@@ -139,25 +214,24 @@ class ArchiveService:
             archive_subdir = archive_dir / timestamp
             archive_subdir.mkdir(parents=True, exist_ok=True)
             
-            # 移动视频文件
-            segments_dir = project_path / "segments"
-            if segments_dir.exists():
-                for video_file in segments_dir.glob(f"segment_{segment_index}*"):
-                    if video_file.is_file():
-                        dest = archive_subdir / video_file.name
-                        shutil.move(str(video_file), str(dest))
-                        moved_files[str(video_file)] = str(dest)
-                        logger.info(f"✅ 已移动视频文件: {video_file.name} -> archive/{timestamp}/")
-            
-            # 移动帧文件
-            frames_dir = project_path / "frames"
-            if frames_dir.exists():
-                for frame_file in frames_dir.glob(f"segment_{segment_index}*"):
-                    if frame_file.is_file():
-                        dest = archive_subdir / frame_file.name
-                        shutil.move(str(frame_file), str(dest))
-                        moved_files[str(frame_file)] = str(dest)
-                        logger.info(f"✅ 已移动帧文件: {frame_file.name} -> archive/{timestamp}/")
+            # 每个目录只扫描一次；同一文件系统内 os.rename 仅修改目录项
+            prefix = f"segment_{segment_index}"
+            for source_dir, label in ((project_path / "segments", "视频"), (project_path / "frames", "帧")):
+                try:
+                    with os.scandir(source_dir) as it:
+                        targets = [e for e in it if e.name.startswith(prefix) and e.is_file()]
+                except FileNotFoundError:
+                    continue
+                
+                for entry in targets:
+                    dest = archive_subdir / entry.name
+                    try:
+                        os.rename(entry.path, dest)
+                    except OSError:
+                        # 跨设备等情况 rename 失败时回退为复制+删除
+                        shutil.move(entry.path, str(dest))
+                    moved_files[entry.path] = str(dest)
+                    logger.info(f"✅ 已移动{label}文件: {entry.name} -> archive/{timestamp}/")
             
             if moved_files:
                 logger.info(f"✅ 已将 {len(moved_files)} 个文件归档到 archive/segment_{segment_index}/{timestamp}/")
@@ -172,7 +246,8 @@ class ArchiveService:
     def get_segment_history(
         self,
         project_id: str,
-        segment_index: Optional[int] = None
+        segment_index: Optional[int] = None,
+        session: Optional[Session] = None
     ) -> Dict[str, List[Dict]]:
         """
         获取段的历史记录
@@ -180,20 +255,38 @@ class ArchiveService:
         Args:
             project_id: 项目ID
             segment_index: 段索引（可选，不指定则返回所有段的历史）
+            session: 复用的数据库会话（可选，不传则新建）
         
         Returns:
             历史记录字典 {segment_0: [...], segment_1: [...]}
         """
         try:
-            with Session(engine) as session:
-                task = session.exec(
-                    select(BatchTask).where(BatchTask.project_id == project_id)
-                ).first()
+            with _use_session(session) as session:
+                statement = select(SegmentHistory).where(SegmentHistory.project_id == project_id)
+                if segment_index is not None:
+                    statement = statement.where(SegmentHistory.segment_index == segment_index)
+                rows = session.exec(
+                    statement.order_by(
+                        SegmentHistory.segment_index,
+                        desc(SegmentHistory.archived_at),
+                        desc(SegmentHistory.id),
+                    )
+                ).all()
                 
-                if not task or not task.segment_history:
-                    return {}
+                history: Dict[str, List[Dict]] = {}
+                for row in rows:
+                    entries = history.setdefault(f"segment_{row.segment_index}", [])
+                    if len(entries) < self.max_history_per_segment:
+                        entries.append(_history_entry(row))
                 
-                history = json.loads(task.segment_history)
+                # 兼容迁移前写入 BatchTask.segment_history 的旧记录（追加在新表记录之后）
+                legacy_json = session.exec(
+                    select(BatchTask.segment_history).where(BatchTask.project_id == project_id)
+                ).first()
+                if legacy_json:
+                    for segment_key, entries in jsonutil.loads(legacy_json).items():
+                        merged = history.setdefault(segment_key, [])
+                        merged.extend(entries[:self.max_history_per_segment - len(merged)])
                 
                 if segment_index is not None:
                     segment_key = f"segment_{segment_index}"
@@ -210,7 +303,9 @@ class ArchiveService:
         project_id: str,
         segment_index: int,
         project_storage_path: str,
-        current_segment_data: Dict[str, Any]
+        current_segment_data: Dict[str, Any],
+        move_files: bool = True,
+        session: Optional[Session] = None
     ) -> bool:
         """
         重新生成前的完整归档流程
@@ -220,28 +315,35 @@ class ArchiveService:
             segment_index: 段索引
             project_storage_path: 项目存储路径
             current_segment_data: 当前段数据（包含 video_url, first_frame_url, last_frame_url 等）
+            move_files: 是否移动本地文件（调用方已单独移动时传 False）
+            session: 复用的数据库会话（可选，不传则新建）
         
         Returns:
             是否成功
         """
         try:
             # 1. 归档数据库中的旧数据
-            self.archive_segment(
+            archived = self.archive_segment(
                 project_id=project_id,
                 segment_index=segment_index,
                 old_video_url=current_segment_data.get("video_url") or current_segment_data.get("videoUrl"),
                 old_first_frame_url=current_segment_data.get("first_frame_url") or current_segment_data.get("firstFrameUrl"),
                 old_last_frame_url=current_segment_data.get("last_frame_url") or current_segment_data.get("lastFrameUrl"),
                 old_local_video_path=current_segment_data.get("local_video_path"),
-                reason="regenerate"
+                reason="regenerate",
+                session=session
             )
             
             # 2. 移动本地文件到归档目录
-            self.move_local_files_to_archive(
-                project_id=project_id,
-                segment_index=segment_index,
-                project_storage_path=project_storage_path
-            )
+            if move_files:
+                self.move_local_files_to_archive(
+                    project_id=project_id,
+                    segment_index=segment_index,
+                    project_storage_path=project_storage_path
+                )
+            
+            if not archived:
+                return False
             
             logger.info(f"✅ 段{segment_index} 归档完成，准备重新生成")
             return True
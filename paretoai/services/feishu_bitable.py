@@ -3,18 +3,60 @@
 提供飞书 Bitable API 的封装，支持连接、读取、写入和批量操作
 """
 import os
-import json
+import re
+import time
+import uuid
+import random
 import asyncio
 import aiohttp
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+import aiofiles
+from typing import Optional, AsyncIterator, List, Dict, Any, Tuple
+from datetime import datetime, timezone
 from pathlib import Path
+from urllib.parse import urlparse, parse_qs, quote
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
 
+from sqlmodel import Session, select
+
+from paretoai import jsonutil
+from paretoai.db import engine
+from paretoai.models import BatchTask
 from paretoai.retry import retry_async, RetryConfigs
+from paretoai.services.project_path_service import get_project_path_service
 
 logger = logging.getLogger(__name__)
 
+# 飞书字段类型: 17 = 附件
+_FEISHU_ATTACHMENT_TYPE = 17
+
+# 上传附件时按扩展名确定 MIME 类型
+_MIME_TYPES: Dict[str, str] = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.mp4': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.avi': 'video/x-msvideo',
+}
+
+# 附件上传/下载可能是大视频文件，使用比普通 API 请求更长的超时
+FILE_TRANSFER_TIMEOUT = aiohttp.ClientTimeout(total=300, connect=10)
+
+
+class FeishuAPIError(Exception):
+    """飞书 API 返回的错误；retryable 表示是否值得重试（5xx / 429），retry_after 为服务端建议的等待秒数"""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
 
 def feishu_date_now_ms() -> int:
     """返回当前时间毫秒时间戳，用于飞书 日期 字段（格式 2026/01/30 14:00 的底层存储）"""
@@ -26,6 +68,25 @@ class FeishuBitableService:
 
     BASE_URL = "https://open.feishu.cn/open-apis"
 
+    # 表格字段定义缓存有效期（秒），字段结构很少变化
+    TABLE_FIELDS_CACHE_TTL = 300
+
+    # 进程内对飞书的最大并发请求数（所有实例共享），在 asyncio 层形成背压
+    MAX_CONCURRENCY = int(os.getenv("FEISHU_MAX_CONCURRENCY", "20"))
+    _semaphore: Optional[asyncio.Semaphore] = None
+
+    # 附件上传/下载单独限流：传输可能持续数分钟，不能占用普通 API 请求的并发名额
+    MAX_TRANSFER_CONCURRENCY = int(os.getenv("FEISHU_MAX_TRANSFER_CONCURRENCY", "4"))
+    _transfer_semaphore: Optional[asyncio.Semaphore] = None
+
+    # 重试退避：第 n 次重试等待 RETRY_BACKOFF_BASE * 2^n 秒（±50% 抖动），最多 RETRY_BACKOFF_MAX 秒
+    RETRY_BACKOFF_BASE = 0.5
+    RETRY_BACKOFF_MAX = 60
+
+    # token 剩余有效期不足 TOKEN_REFRESH_MARGIN 秒时后台刷新，不足 TOKEN_EXPIRY_MARGIN 秒时视为已过期
+    TOKEN_REFRESH_MARGIN = 300
+    TOKEN_EXPIRY_MARGIN = 60
+
     def __init__(self, app_id: str, app_secret: str, tenant_access_token: Optional[str] = None):
         self.app_id = app_id
         self.app_secret = app_secret
@@ -37,25 +98,111 @@ class FeishuBitableService:
                 tenant_access_token = f"t-{tenant_access_token}"
                 logger.info("检测到 tenant_access_token 缺少 't-' 前缀，已自动添加")
         self._tenant_access_token: Optional[str] = tenant_access_token  # 如果提供了，直接使用
+        # token 过期时间（time.monotonic() 时钟，不受系统时间调整影响）
         self._token_expires_at: float = 0
         if tenant_access_token:
             # 如果直接提供了 token，设置一个很长的过期时间（实际应该由调用方管理）
-            self._token_expires_at = datetime.now().timestamp() + 7200  # 2小时
+            self._token_expires_at = time.monotonic() + 7200  # 2小时
             logger.info(f"使用提供的 tenant_access_token: {tenant_access_token[:30]}... (长度: {len(tenant_access_token)})")
+        # 表格字段定义缓存: (app_token, table_id) -> (过期时间, 字段列表)
+        self._table_fields_cache: Dict[Tuple[str, str], Tuple[float, List[Dict]]] = {}
+        # 复用的 HTTP 会话（首次请求时创建），保持与飞书的 keep-alive 连接
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 认证请求头缓存: (token, JSON 请求头, 仅认证请求头)，token 变化时重建
+        self._auth_headers: Optional[Tuple[str, Dict[str, str], Dict[str, str]]] = None
+        # token 获取锁：合并并发的刷新请求；后台刷新任务（token 即将过期时创建）
+        self._token_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "FeishuBitableService":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取复用的 HTTP 会话（连接超时 10 秒，总超时 30 秒）
+
+        飞书 API 只有 open.feishu.cn 一个主机，limit_per_host 才是实际的连接上限；
+        keep-alive 连接在请求之间复用，后续请求免去 TCP/TLS 握手
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30, connect=10),
+                headers={"Connection": "keep-alive"},
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=32,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True,
+                ),
+            )
+        return self._session
+
+    @property
+    def token_expires_at(self) -> float:
+        """当前 token 的实际过期时刻（time.monotonic() 时钟）"""
+        return self._token_expires_at
+
+    def _get_auth_headers(self, token: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """返回 (JSON 请求头, 仅认证请求头)，按 token 缓存（调用方不得修改返回的 dict）"""
+        cached = self._auth_headers
+        if cached is None or cached[0] != token:
+            bare = {"Authorization": f"Bearer {token}"}
+            cached = (token, {**bare, "Content-Type": "application/json"}, bare)
+            self._auth_headers = cached
+        return cached[1], cached[2]
+
+    async def aclose(self) -> None:
+        """关闭 HTTP 会话及其连接池"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def _get_tenant_access_token(self) -> str:
-        """获取 tenant_access_token"""
-        # 如果已经提供了 token，检查是否过期
-        if self._tenant_access_token:
-            if datetime.now().timestamp() < self._token_expires_at:
-                logger.debug(f"使用缓存的 tenant_access_token: {self._tenant_access_token[:20]}...")
+        """
+        获取 tenant_access_token
+
+        token 即将过期时在后台刷新，本次请求继续使用仍然有效的缓存 token；
+        只有 token 不存在或已过期时才需要等待获取
+        """
+        token = self._tenant_access_token
+        if token:
+            remaining = self._token_expires_at - time.monotonic()
+            if remaining > self.TOKEN_REFRESH_MARGIN:
+                return token
+            if remaining > self.TOKEN_EXPIRY_MARGIN:
+                if self._refresh_task is None or self._refresh_task.done():
+                    self._refresh_task = asyncio.create_task(self._refresh_token_in_background())
+                return token
+            logger.warning("tenant_access_token 已过期，通过 App ID/Secret 获取新 token")
+
+        return await self._fetch_token_locked()
+
+    async def _refresh_token_in_background(self) -> None:
+        """后台刷新 token；失败时保留当前 token，由后续请求重试"""
+        try:
+            await self._fetch_token_locked()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"后台刷新 tenant_access_token 失败: {e}")
+
+    async def _fetch_token_locked(self) -> str:
+        """在锁内获取 token，并发调用只会触发一次获取"""
+        async with self._token_lock:
+            # 等待锁期间其他协程可能已完成刷新
+            if self._tenant_access_token and self._token_expires_at - time.monotonic() > self.TOKEN_REFRESH_MARGIN:
                 return self._tenant_access_token
-            else:
-                logger.warning(f"提供的 tenant_access_token 已过期，尝试通过 App ID/Secret 获取新 token")
-                # Token 过期，清除它，使用 App ID/Secret 获取新 token
-                self._tenant_access_token = None
-        
-        # 如果没有提供 token 或 token 过期，需要通过 App ID/Secret 获取
+            return await self._fetch_tenant_access_token()
+
+    async def _fetch_tenant_access_token(self) -> str:
+        """通过 App ID/Secret 获取新的 tenant_access_token"""
         logger.info("通过 App ID/Secret 获取 tenant_access_token...")
 
         url = f"{self.BASE_URL}/auth/v3/tenant_access_token/internal"
@@ -64,20 +211,46 @@ class FeishuBitableService:
             "app_secret": self.app_secret
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as resp:
-                data = await resp.json()
+        session = await self._get_session()
+        async with session.post(url, json=payload) as resp:
+            data = jsonutil.loads(await resp.read())
 
-                if data.get("code") != 0:
-                    raise Exception(f"获取 token 失败: {data.get('msg')}")
+        if data.get("code") != 0:
+            raise Exception(f"获取 token 失败: {data.get('msg')}")
 
-                self._tenant_access_token = data["tenant_access_token"]
-                # token 有效期 2 小时，提前 5 分钟刷新
-                self._token_expires_at = datetime.now().timestamp() + data["expire"] - 300
-                
-                logger.info(f"成功获取 tenant_access_token: {self._tenant_access_token[:20]}... (长度: {len(self._tenant_access_token)})")
+        self._tenant_access_token = data["tenant_access_token"]
+        # 记录实际过期时间（有效期 2 小时），刷新提前量由 TOKEN_REFRESH_MARGIN 控制
+        self._token_expires_at = time.monotonic() + data["expire"]
 
-                return self._tenant_access_token
+        logger.info(f"成功获取 tenant_access_token: {self._tenant_access_token[:20]}... (长度: {len(self._tenant_access_token)})")
+
+        return self._tenant_access_token
+
+    @classmethod
+    def _get_semaphore(cls) -> asyncio.Semaphore:
+        """获取全局并发信号量（需在事件循环中首次创建，不能在导入时创建）"""
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(cls.MAX_CONCURRENCY)
+        return cls._semaphore
+
+    @classmethod
+    def _get_transfer_semaphore(cls) -> asyncio.Semaphore:
+        """获取全局附件传输信号量（与 API 请求信号量相互独立）"""
+        if cls._transfer_semaphore is None:
+            cls._transfer_semaphore = asyncio.Semaphore(cls.MAX_TRANSFER_CONCURRENCY)
+        return cls._transfer_semaphore
+
+    async def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> None:
+        """重试前等待：优先遵循 Retry-After，否则指数退避加随机抖动，避免并发请求同步重试"""
+        delay = None
+        if retry_after:
+            try:
+                delay = min(float(retry_after), self.RETRY_BACKOFF_MAX)
+            except ValueError:
+                delay = None  # HTTP 日期格式的 Retry-After 不处理，走指数退避
+        if delay is None:
+            delay = min(self.RETRY_BACKOFF_MAX, self.RETRY_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        await asyncio.sleep(delay)
 
     async def _request(
         self,
@@ -88,92 +261,100 @@ class FeishuBitableService:
         retry: int = 3
     ) -> Dict:
         """发送 API 请求"""
-        token = await self._get_tenant_access_token()
         url = f"{self.BASE_URL}{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
 
         for attempt in range(retry):
             try:
-                logger.debug(f"飞书 API 请求: {method} {url}, attempt={attempt+1}/{retry}")
-                # 设置超时：连接超时 10 秒，总超时 30 秒
-                timeout = aiohttp.ClientTimeout(total=30, connect=10)
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.request(
-                        method,
-                        url,
-                        params=params,
-                        json=json_data,
-                        headers=headers
-                    ) as resp:
-                        # 检查响应状态码
-                        if resp.status >= 400:
-                            # 尝试解析错误响应
-                            content_type = resp.headers.get('Content-Type', '')
-                            if 'application/json' in content_type:
-                                try:
-                                    error_data = await resp.json()
-                                    error_msg = error_data.get('msg') or error_data.get('message') or error_data.get('error') or f"HTTP {resp.status}"
-                                    error_code = error_data.get('code')
-                                    # 打印完整的错误响应，帮助调试
-                                    logger.error(f"飞书 API 错误: code={error_code}, msg={error_msg}, url={url}")
-                                    logger.error(f"完整错误响应: {json.dumps(error_data, ensure_ascii=False, indent=2)}")
-                                except:
-                                    error_text = await resp.text()
-                                    error_msg = f"HTTP {resp.status}: {error_text[:200]}"
-                                    logger.error(f"飞书 API 错误（无法解析JSON）: {error_msg}, url={url}")
-                                    logger.error(f"完整错误文本: {error_text}")
-                            else:
-                                error_text = await resp.text()
-                                error_msg = f"HTTP {resp.status}: {error_text[:200]}"
-                                logger.error(f"飞书 API 错误（非JSON响应）: {error_msg}, url={url}")
-                            
-                            # 特殊处理 404 错误
-                            if resp.status == 404:
-                                raise Exception(f"资源不存在 (404): {error_msg}。请检查 app_token 和 table_id 是否正确，以及应用是否有访问权限")
-                            
-                            # 特殊处理 token 无效错误（99991663），尝试清除缓存的 token 并重新获取
-                            if resp.status == 400 and error_code == 99991663:
-                                if self._tenant_access_token and attempt == 0:
-                                    # 第一次尝试时，如果使用的是提供的 token，清除它并尝试通过 App ID/Secret 获取新 token
-                                    logger.warning(f"提供的 tenant_access_token 无效，清除缓存并尝试通过 App ID/Secret 获取新 token")
-                                    self._tenant_access_token = None
-                                    self._token_expires_at = 0
-                                    # 继续重试（会在下一次循环中重新获取 token）
-                                    continue
-                            
-                            raise Exception(f"API 请求失败 ({resp.status}): {error_msg}")
-                        
-                        # 解析 JSON 响应
-                        try:
-                            data = await resp.json()
-                        except Exception as e:
-                            error_text = await resp.text()
-                            raise Exception(f"响应解析失败: {str(e)}, 响应内容: {error_text[:200]}")
-
-                        # 检查限流
-                        if data.get("code") == 99991400:
-                            wait_time = 2 ** attempt
-                            logger.warning(f"飞书 API 限流，等待 {wait_time}s 后重试")
-                            await asyncio.sleep(wait_time)
+                # 每次尝试都重新取 token：token 无效被清除后，下一次尝试会获取新 token
+                token = await self._get_tenant_access_token()
+                headers = self._get_auth_headers(token)[0]
+                logger.debug("飞书 API 请求: %s %s, attempt=%d/%d", method, url, attempt + 1, retry)
+                session = await self._get_session()
+                # 仅在请求期间占用并发名额，退避等待时不占用
+                async with self._get_semaphore(), session.request(
+                    method,
+                    url,
+                    params=params,
+                    json=json_data,
+                    headers=headers
+                ) as resp:
+                    status = resp.status
+                    retry_after = resp.headers.get("Retry-After")
+                    # 响应体只读取一次，成功/错误分支共用
+                    raw = await resp.read()
+
+                try:
+                    data = jsonutil.loads(raw) if raw else None
+                except ValueError:
+                    data = None
+
+                # 检查响应状态码
+                if status >= 400:
+                    error_code = None
+                    if isinstance(data, dict):
+                        error_msg = data.get('msg') or data.get('message') or data.get('error') or f"HTTP {status}"
+                        error_code = data.get('code')
+                        # 打印完整的错误响应，帮助调试
+                        logger.error("飞书 API 错误: code=%s, msg=%s, url=%s", error_code, error_msg, url)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("完整错误响应: %s", jsonutil.dumps(data, indent=True))
+                    else:
+                        error_msg = f"HTTP {status}: {raw[:200].decode('utf-8', 'replace')}"
+                        logger.error("飞书 API 错误（非JSON响应）: %s, url=%s", error_msg, url)
+                    
+                    # 特殊处理 404 错误
+                    if status == 404:
+                        raise FeishuAPIError(f"资源不存在 (404): {error_msg}。请检查 app_token 和 table_id 是否正确，以及应用是否有访问权限")
+                    
+                    # 特殊处理 token 无效错误（99991663），尝试清除缓存的 token 并重新获取
+                    if status == 400 and error_code == 99991663:
+                        if self._tenant_access_token and attempt == 0:
+                            # 第一次尝试时，如果使用的是提供的 token，清除它并尝试通过 App ID/Secret 获取新 token
+                            logger.warning("提供的 tenant_access_token 无效，清除缓存并尝试通过 App ID/Secret 获取新 token")
+                            self._tenant_access_token = None
+                            self._token_expires_at = 0
+                            self._auth_headers = None
+                            # 继续重试（会在下一次循环中重新获取 token）
                             continue
+                    
+                    # 仅 5xx 与 429 可重试，其余 4xx 直接抛出
+                    raise FeishuAPIError(
+                        f"API 请求失败 ({status}): {error_msg}",
+                        retryable=status == 429 or status >= 500,
+                        retry_after=retry_after,
+                    )
+                
+                if not isinstance(data, dict):
+                    raise Exception(f"响应解析失败, 响应内容: {raw[:200].decode('utf-8', 'replace')}")
 
-                        if data.get("code") != 0:
-                            error_msg = data.get('msg') or data.get('message') or '未知错误'
-                            error_code = data.get('code')
-                            # 打印完整的错误响应，帮助调试
-                            logger.error(f"飞书 API 返回错误: code={error_code}, msg={error_msg}")
-                            logger.error(f"完整错误响应: {json.dumps(data, ensure_ascii=False, indent=2)}")
-                            raise Exception(f"API 请求失败: {error_msg}")
+                # 检查限流
+                if data.get("code") == 99991400:
+                    logger.warning("飞书 API 限流，退避后重试 (attempt=%d/%d)", attempt + 1, retry)
+                    await self._backoff(attempt, retry_after)
+                    continue
 
-                        return data.get("data", {})
+                if data.get("code") != 0:
+                    error_msg = data.get('msg') or data.get('message') or '未知错误'
+                    error_code = data.get('code')
+                    # 打印完整的错误响应，帮助调试
+                    logger.error("飞书 API 返回错误: code=%s, msg=%s", error_code, error_msg)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("完整错误响应: %s", jsonutil.dumps(data, indent=True))
+                    # 业务错误（参数/权限等）重试无意义，直接抛出
+                    raise FeishuAPIError(f"API 请求失败: {error_msg}")
+
+                return data.get("data", {})
+            except FeishuAPIError as e:
+                if not e.retryable or attempt == retry - 1:
+                    raise
+                logger.warning("请求失败，重试中: %s", e)
+                await self._backoff(attempt, e.retry_after)
             except Exception as e:
+                # 连接错误、超时、响应解析失败等
                 if attempt == retry - 1:
                     raise
-                logger.warning(f"请求失败，重试中: {e}")
-                await asyncio.sleep(1)
+                logger.warning("请求失败，重试中: %s", e)
+                await self._backoff(attempt)
 
         raise Exception("请求失败，已达最大重试次数")
 
@@ -191,22 +372,29 @@ class FeishuBitableService:
     
     @retry_async(RetryConfigs.NETWORK)
     async def get_table_fields(self, app_token: str, table_id: str) -> List[Dict]:
-        """获取表格的所有字段定义"""
+        """获取表格的所有字段定义（带 TTL 缓存）"""
+        cache_key = (app_token, table_id)
+        cached = self._table_fields_cache.get(cache_key)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+
         endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/fields"
-        logger.warning(f"获取表格字段定义: app_token={app_token}, table_id={table_id}")  # 使用 WARNING 级别确保输出
+        logger.warning("获取表格字段定义: app_token=%s, table_id=%s", app_token, table_id)  # 使用 WARNING 级别确保输出
         try:
             result = await self._request("GET", endpoint)
             # 飞书API返回格式可能是 result.data.items 或 result.items
             fields = result.get("data", {}).get("items", []) or result.get("items", [])
-            logger.warning(f"获取到 {len(fields)} 个字段定义")  # 使用 WARNING 级别确保输出
+            logger.warning("获取到 %s 个字段定义", len(fields))  # 使用 WARNING 级别确保输出
             if fields:
                 field_names = [f.get("field_name", f.get("name", "")) for f in fields]
-                logger.warning(f"字段名列表: {field_names}")  # 使用 WARNING 级别确保输出
+                logger.warning("字段名列表: %s", field_names)  # 使用 WARNING 级别确保输出
+                # 仅缓存非空结果，失败/空列表下次重新获取
+                self._table_fields_cache[cache_key] = (time.monotonic() + self.TABLE_FIELDS_CACHE_TTL, fields)
             else:
-                logger.warning(f"⚠️ 字段列表为空，API响应: {result}")  # 使用 WARNING 级别确保输出
+                logger.warning("⚠️ 字段列表为空，API响应: %s", result)  # 使用 WARNING 级别确保输出
             return fields
         except Exception as e:
-            logger.warning(f"获取表格字段定义失败: {e}")  # 使用 WARNING 级别确保输出
+            logger.warning("获取表格字段定义失败: %s", e)  # 使用 WARNING 级别确保输出
             # 不抛出异常，返回空列表，让调用方继续处理
             return []
 
@@ -220,8 +408,7 @@ class FeishuBitableService:
         for field in fields:
             field_name = field.get("field_name", "")
             field_type = field.get("type")
-            # 飞书附件字段类型是 17
-            if field_type == 17:
+            if field_type == _FEISHU_ATTACHMENT_TYPE:
                 attachment_fields.add(field_name)
                 logger.info(f"检测到附件字段: {field_name}")
         return attachment_fields
@@ -249,6 +436,56 @@ class FeishuBitableService:
 
         return await self._request("GET", endpoint, params=params)
 
+    @retry_async(RetryConfigs.NETWORK)
+    async def get_record(
+        self,
+        app_token: str,
+        table_id: str,
+        record_id: str
+    ) -> Optional[Dict]:
+        """获取单条记录（避免为查找一条记录拉取整表）"""
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
+        result = await self._request("GET", endpoint)
+        return result.get("record")
+
+    async def iter_records(
+        self,
+        app_token: str,
+        table_id: str,
+        filter_str: Optional[str] = None,
+        page_size: int = 500
+    ) -> AsyncIterator[Dict]:
+        """
+        逐条产出所有记录（自动分页）
+
+        收到一页后立即预取下一页，调用方处理当前页时下一页已在传输中
+        """
+        next_page: Optional[asyncio.Future] = asyncio.ensure_future(
+            self.list_records(app_token, table_id, page_size=page_size, filter_str=filter_str)
+        )
+        try:
+            while next_page is not None:
+                data = await next_page
+                next_page = None
+
+                page_token = data.get("page_token")
+                if data.get("has_more") and page_token:
+                    next_page = asyncio.ensure_future(
+                        self.list_records(
+                            app_token, table_id,
+                            page_size=page_size,
+                            page_token=page_token,
+                            filter_str=filter_str
+                        )
+                    )
+
+                for record in data.get("items") or []:
+                    yield record
+        finally:
+            # 调用方提前停止迭代时取消未完成的预取
+            if next_page is not None:
+                next_page.cancel()
+
     @retry_async(RetryConfigs.NETWORK)
     async def get_all_records(
         self,
@@ -257,26 +494,7 @@ class FeishuBitableService:
         filter_str: Optional[str] = None
     ) -> List[Dict]:
         """获取所有记录（自动分页）"""
-        all_records = []
-        page_token = None
-
-        while True:
-            data = await self.list_records(
-                app_token, table_id,
-                page_size=500,
-                page_token=page_token,
-                filter_str=filter_str
-            )
-
-            records = data.get("items", [])
-            all_records.extend(records)
-
-            if not data.get("has_more"):
-                break
-
-            page_token = data.get("page_token")
-
-        return all_records
+        return [record async for record in self.iter_records(app_token, table_id, filter_str=filter_str)]
 
     @retry_async(RetryConfigs.NETWORK)
     async def update_record(
@@ -288,22 +506,23 @@ class FeishuBitableService:
     ) -> Dict:
         """更新单条记录"""
         endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
-        logger.warning(f"=== 更新飞书记录 ===")  # 使用 WARNING 级别确保输出
-        logger.warning(f"record_id: {record_id}, 字段数: {len(fields)}")
-        logger.warning(f"更新字段: {list(fields.keys())}")
-        # 打印字段值（前100个字符）
-        for field_name, field_value in fields.items():
-            if isinstance(field_value, str) and len(field_value) > 100:
-                logger.warning(f"  {field_name}: {field_value[:100]}...")
-            else:
-                logger.warning(f"  {field_name}: {field_value}")
+        logger.warning("=== 更新飞书记录 ===")  # 使用 WARNING 级别确保输出
+        logger.warning("record_id: %s, 字段数: %s", record_id, len(fields))
+        logger.warning("更新字段: %s", list(fields.keys()))
+        # 打印字段值（前100个字符），仅 DEBUG 级别启用时遍历
+        if logger.isEnabledFor(logging.DEBUG):
+            for field_name, field_value in fields.items():
+                if isinstance(field_value, str) and len(field_value) > 100:
+                    logger.debug("  %s: %s...", field_name, field_value[:100])
+                else:
+                    logger.debug("  %s: %s", field_name, field_value)
         try:
             result = await self._request("PUT", endpoint, json_data={"fields": fields})
-            logger.warning(f"✅ 成功更新记录 {record_id}")
+            logger.warning("✅ 成功更新记录 %s", record_id)
             return result
         except Exception as e:
-            logger.error(f"❌ 更新记录 {record_id} 失败: {e}")
-            logger.error(f"   字段: {list(fields.keys())}")
+            logger.error("❌ 更新记录 %s 失败: %s", record_id, e)
+            logger.error("   字段: %s", list(fields.keys()))
             raise
 
     async def batch_update_records(
@@ -318,16 +537,19 @@ class FeishuBitableService:
 
         results = {"success_count": 0, "failed_count": 0, "errors": []}
 
-        # 分批处理
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            try:
-                await self._request("POST", endpoint, json_data={"records": batch})
-                results["success_count"] += len(batch)
-            except Exception as e:
+        # 分批并发提交，并发度由 _request 内的全局信号量限制
+        batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+        outcomes = await asyncio.gather(
+            *(self._request("POST", endpoint, json_data={"records": batch}) for batch in batches),
+            return_exceptions=True
+        )
+        for batch, outcome in zip(batches, outcomes):
+            if isinstance(outcome, BaseException):
                 results["failed_count"] += len(batch)
-                results["errors"].append(str(e))
-                logger.error(f"批量更新失败: {e}")
+                results["errors"].append(str(outcome))
+                logger.error(f"批量更新失败: {outcome}")
+            else:
+                results["success_count"] += len(batch)
 
         return results
 
@@ -351,49 +573,49 @@ class FeishuBitableService:
         # 方法1: 尝试使用 drive/v1/medias/{file_token}/download
         endpoint = f"/drive/v1/medias/{file_token}/download"
         url = f"{self.BASE_URL}{endpoint}"
-        headers = {"Authorization": f"Bearer {token}"}
+        headers = self._get_auth_headers(token)[1]
         
         # 如果提供了原始 URL，尝试提取查询参数
         params = None
         if original_url and "?" in original_url:
-            from urllib.parse import urlparse, parse_qs
             parsed = urlparse(original_url)
             query_params = parse_qs(parsed.query)
             # 将查询参数转换为字典（取第一个值）
             params = {k: v[0] if isinstance(v, list) and len(v) > 0 else v for k, v in query_params.items()}
             logger.debug(f"从原始 URL 提取参数: {params}")
 
-        async with aiohttp.ClientSession() as session:
+        session = await self._get_session()
+        async with self._get_transfer_semaphore():
             try:
-                async with session.get(url, headers=headers, params=params, allow_redirects=True) as resp:
+                async with session.get(url, headers=headers, params=params, allow_redirects=True, timeout=FILE_TRANSFER_TIMEOUT) as resp:
                     # 如果返回 302 重定向，跟随重定向
                     if resp.status == 302 or resp.status == 301:
                         redirect_url = resp.headers.get('Location')
                         logger.info(f"收到重定向: {redirect_url}")
                         if redirect_url:
                             # 跟随重定向下载（不需要认证）
-                            async with session.get(redirect_url) as redirect_resp:
+                            async with session.get(redirect_url, timeout=FILE_TRANSFER_TIMEOUT) as redirect_resp:
                                 if redirect_resp.status != 200:
                                     raise Exception(f"重定向下载失败: {redirect_resp.status}")
                                 await self._save_file(redirect_resp, save_path)
                                 return save_path
-                    
+                
                     if resp.status != 200:
                         # 尝试读取错误信息
                         error_text = await resp.text()
                         logger.error(f"下载附件失败 ({resp.status}): {error_text[:200]}")
                         raise Exception(f"下载附件失败: {resp.status}, {error_text[:200]}")
-                    
+                
                     await self._save_file(resp, save_path)
                     return save_path
-                    
+                
             except Exception as e:
                 # 如果方法1失败，尝试方法2: 直接使用原始 URL（如果提供）
                 if original_url:
                     logger.warning(f"方法1失败 ({str(e)}), 尝试使用原始 URL: {original_url[:100]}...")
                     try:
                         # 使用原始 URL，但添加认证头
-                        async with session.get(original_url, headers=headers, allow_redirects=True) as resp:
+                        async with session.get(original_url, headers=headers, allow_redirects=True, timeout=FILE_TRANSFER_TIMEOUT) as resp:
                             if resp.status != 200:
                                 raise Exception(f"使用原始 URL 下载失败: {resp.status}")
                             await self._save_file(resp, save_path)
@@ -406,15 +628,17 @@ class FeishuBitableService:
                     raise
     
     async def _save_file(self, resp: aiohttp.ClientResponse, save_path: str):
-        """保存文件内容"""
+        """保存文件内容（目录创建与写盘均不阻塞事件循环）"""
         # 确保目录存在
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(save_path), exist_ok=True)
 
-        with open(save_path, "wb") as f:
-            async for chunk in resp.content.iter_chunked(8192):
-                f.write(chunk)
+        size = 0
+        async with aiofiles.open(save_path, "wb") as f:
+            async for chunk in resp.content.iter_chunked(65536):
+                await f.write(chunk)
+                size += len(chunk)
 
-        logger.info(f"文件已保存到: {save_path}, 大小: {os.path.getsize(save_path)} bytes")
+        logger.info(f"文件已保存到: {save_path}, 大小: {size} bytes")
 
     @retry_async(RetryConfigs.NETWORK)
     async def upload_attachment_to_record(
@@ -446,93 +670,76 @@ class FeishuBitableService:
         """
         token = await self._get_tenant_access_token()
 
-        if not os.path.exists(file_path):
+        try:
+            file_size = await asyncio.to_thread(os.path.getsize, file_path)
+        except FileNotFoundError:
             raise FileNotFoundError(f"文件不存在: {file_path}")
 
         if file_name is None:
             file_name = os.path.basename(file_path)
 
-        file_size = os.path.getsize(file_path)
-
         # 根据文件扩展名确定 MIME 类型
         ext = os.path.splitext(file_name)[1].lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.mp4': 'video/mp4',
-            '.mov': 'video/quicktime',
-            '.avi': 'video/x-msvideo',
-        }
-        file_type = mime_types.get(ext, 'application/octet-stream')
+        file_type = _MIME_TYPES.get(ext, 'application/octet-stream')
 
-        logger.warning(f"=== 开始上传附件 ===")
-        logger.warning(f"文件: {file_name}, 大小: {file_size} bytes, 类型: {file_type}")
+        logger.warning("=== 开始上传附件 ===")
+        logger.warning("文件: %s, 大小: %s bytes, 类型: %s", file_name, file_size, file_type)
 
-        async with aiohttp.ClientSession() as session:
+        session = await self._get_session()
+        # 上传与回写记录期间占用一个传输名额（不占用普通 API 请求的并发名额）
+        async with self._get_transfer_semaphore():
             # 第1步：上传文件到飞书云文档
             # API: POST /open-apis/drive/v1/medias/upload_all
             # 使用 multipart/form-data 格式直接上传文件
             upload_url = f"{self.BASE_URL}/drive/v1/medias/upload_all"
 
-            logger.warning(f"第1步：上传文件到云文档")
-            logger.warning(f"  API: {upload_url}")
-            logger.warning(f"  参数: parent_type=bitable, parent_node={table_id}")
+            logger.warning("第1步：上传文件到云文档")
+            logger.warning("  API: %s", upload_url)
+            logger.warning("  参数: parent_type=bitable, parent_node=%s", table_id)
 
-            # 准备 multipart/form-data
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-
-            # 构建 multipart/form-data
-            # Feishu API 需要 file_name 字段
-            data = aiohttp.FormData()
-            data.add_field('file',
-                          file_content,
-                          filename=file_name,
-                          content_type=file_type)
-            data.add_field('file_name', file_name)
-            data.add_field('size', str(file_size))
-
-            headers = {
-                "Authorization": f"Bearer {token}",
-            }
+            # 构建 multipart/form-data（Feishu API 需要 file_name 字段）
+            # 传入文件对象而非整个文件内容：aiohttp 在线程池中按块读取并流式发送，
+            # 内存占用与分块大小相当，且按文件大小设置 Content-Length
+            update_headers, headers = self._get_auth_headers(token)
 
-            logger.warning(f"  发送请求: file={file_name}, size={file_size}, file_name={file_name}")
+            logger.warning("  发送请求: file=%s, size=%s, file_name=%s", file_name, file_size, file_name)
 
-            async with session.post(upload_url, headers=headers, data=data) as resp:
-                response_text = await resp.text()
+            with open(file_path, 'rb') as f:
+                data = aiohttp.FormData()
+                data.add_field('file',
+                              f,
+                              filename=file_name,
+                              content_type=file_type)
+                data.add_field('file_name', file_name)
+                data.add_field('size', str(file_size))
 
-                if resp.status != 200:
-                    logger.error(f"第1步失败 ({resp.status}): {response_text[:500]}")
-                    raise Exception(f"上传文件失败: {resp.status}, {response_text[:500]}")
+                async with session.post(upload_url, headers=headers, data=data, timeout=FILE_TRANSFER_TIMEOUT) as resp:
+                    response_text = await resp.text()
 
-                result = json.loads(response_text)
+            if resp.status != 200:
+                logger.error("第1步失败 (%s): %s", resp.status, response_text[:500])
+                raise Exception(f"上传文件失败: {resp.status}, {response_text[:500]}")
 
-                if result.get("code") != 0:
-                    logger.error(f"第1步失败: {result}")
-                    raise Exception(f"上传文件失败: {result.get('msg')}")
+            result = jsonutil.loads(response_text)
+
+            if result.get("code") != 0:
+                logger.error("第1步失败: %s", result)
+                raise Exception(f"上传文件失败: {result.get('msg')}")
 
-                # 获取 file_token
-                file_token = result.get("data", {}).get("file_token")
+            # 获取 file_token
+            file_token = result.get("data", {}).get("file_token")
 
-                if not file_token:
-                    raise Exception(f"未获取到 file_token: {response_text[:200]}")
+            if not file_token:
+                raise Exception(f"未获取到 file_token: {response_text[:200]}")
 
-                logger.warning(f"第1步完成：获取 file_token={file_token[:30]}...")
+            logger.warning("第1步完成：获取 file_token=%s...", file_token[:30])
 
-            logger.warning(f"第2步：更新记录字段 {field_id}")
+            logger.warning("第2步：更新记录字段 %s", field_id)
 
             # 第2步：更新记录字段，填入 file_token
             # 注意：附件字段值必须是数组格式 [{file_token: "..."}]
             update_url = f"{self.BASE_URL}/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
 
-            update_headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json",
-            }
-
             update_data = {
                 "fields": {
                     field_id: [  # 关键：附件字段必须是数组！
@@ -547,16 +754,16 @@ class FeishuBitableService:
                 response_text = await resp.text()
 
                 if resp.status != 200:
-                    logger.error(f"第2步失败 ({resp.status}): {response_text[:500]}")
+                    logger.error("第2步失败 (%s): %s", resp.status, response_text[:500])
                     raise Exception(f"更新记录失败: {resp.status}, {response_text[:500]}")
 
-                result = json.loads(response_text)
+                result = jsonutil.loads(response_text)
 
                 if result.get("code") != 0:
-                    logger.error(f"第2步失败: {result}")
+                    logger.error("第2步失败: %s", result)
                     raise Exception(f"更新记录失败: {result.get('msg')}")
 
-                logger.warning(f"✅ 附件上传完成: {field_id} -> {file_token[:30]}...")
+                logger.warning("✅ 附件上传完成: %s -> %s...", field_id, file_token[:30])
 
                 return {
                     "file_token": file_token,
@@ -565,24 +772,70 @@ class FeishuBitableService:
                 }
 
 
-def get_project_meta_path(project_id: str) -> Optional[Path]:
-    """获取项目 meta.json 的路径（V2 结构：从数据库获取路径）"""
-    if not project_id:
-        return None
+# 飞书附件/云文档 URL：按主机名判断，避免 query 参数中出现域名时误判
+_FEISHU_HOSTS = frozenset({"open.feishu.cn"})
+_FEISHU_DRIVE_PATH = "/open-apis/drive"
 
-    # 使用 ProjectPathService 获取项目路径
+
+def _is_feishu_attachment_url(url: str) -> bool:
+    """判断 URL 是否为需要经后端代理访问的飞书附件地址"""
     try:
-        from paretoai.services.project_path_service import get_project_path_service
-        path_service = get_project_path_service()
-        project_storage_path = path_service.get_project_storage_path(project_id)
+        parsed = urlparse(url)
+    except ValueError:
+        return False
+    host = parsed.hostname or ""
+    is_feishu_host = host == "feishu.cn" or host.endswith(".feishu.cn")
+    return host in _FEISHU_HOSTS or (is_feishu_host and parsed.path.startswith(_FEISHU_DRIVE_PATH))
 
-        if project_storage_path:
-            return Path(project_storage_path) / "meta.json"
 
-        # 回退到 V1 结构（兼容旧代码）
-        logger.warning(f"项目 {project_id} 不在数据库中，使用 V1 路径结构")
+def _resolve_project_storage_path(project_id: str, cache: Optional[Dict] = None) -> Optional[str]:
+    """
+    获取项目存储路径（V2 结构：从数据库获取路径），失败时返回 None
+
+    ProjectPathService 会缓存已注册项目的路径，并对未注册项目做短期否定缓存，
+    批量解析飞书记录时不会对同一项目重复查库；cache 为批量解析时共享的结果缓存
+    """
+    key = ("storage_path", project_id)
+    if cache is not None and key in cache:
+        return cache[key]
+    try:
+        path = get_project_path_service().get_project_storage_path(project_id)
     except Exception as e:
         logger.warning(f"从数据库获取项目路径失败: {e}")
+        path = None
+    if cache is not None:
+        cache[key] = path
+    return path
+
+
+def _local_final_video_url(project_storage_path: str, cache: Optional[Dict] = None) -> str:
+    """本地项目目录中存在 final_video.mp4 时返回其 /storage/ URL（V2 结构），否则返回空字符串"""
+    key = ("final_video_url", project_storage_path)
+    if cache is not None and key in cache:
+        return cache[key]
+    url = ""
+    try:
+        if (Path(project_storage_path) / "final_video.mp4").exists():
+            relative_path = Path(project_storage_path).relative_to(_UPLOADS_PATH)
+            url = f"/storage/{relative_path}/final_video.mp4"
+    except (OSError, ValueError) as e:
+        logger.warning(f"生成本地最终视频 URL 失败: {e}")
+    if cache is not None:
+        cache[key] = url
+    return url
+
+
+def get_project_meta_path(project_id: str) -> Optional[Path]:
+    """获取项目 meta.json 的路径（V2 结构：从数据库获取路径）"""
+    if not project_id:
+        return None
+
+    project_storage_path = _resolve_project_storage_path(project_id)
+    if project_storage_path:
+        return Path(project_storage_path) / "meta.json"
+
+    # 回退到 V1 结构（兼容旧代码）
+    logger.warning(f"项目 {project_id} 不在数据库中，使用 V1 路径结构")
 
     # V1 结构回退
     current_dir = Path(__file__).resolve().parent
@@ -597,17 +850,84 @@ def get_project_meta_path(project_id: str) -> Optional[Path]:
     return storage_path / "projects" / project_id / "meta.json"
 
 
+# meta.json 进程内缓存（project_id -> meta），所有写入都经过 write_project_meta，命中时无需读盘
+META_CACHE_MAX_SIZE = 1024
+_META_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_META_CACHE_LOCK = Lock()
+
+# meta.json 读-改-写锁（按 project_id 分片），保证同一项目的并发更新串行执行、缓存与磁盘一致
+META_WRITE_LOCK_SHARDS = 16
+_META_WRITE_LOCKS = tuple(Lock() for _ in range(META_WRITE_LOCK_SHARDS))
+
+
+def _meta_write_lock(project_id: str) -> Lock:
+    return _META_WRITE_LOCKS[hash(project_id) % META_WRITE_LOCK_SHARDS]
+
+
+def _cache_project_meta(project_id: str, meta: Dict[str, Any]) -> None:
+    """写入 meta 缓存，超过上限时淘汰最久未使用的项目"""
+    with _META_CACHE_LOCK:
+        _META_CACHE[project_id] = meta
+        _META_CACHE.move_to_end(project_id)
+        while len(_META_CACHE) > META_CACHE_MAX_SIZE:
+            _META_CACHE.popitem(last=False)
+
+
 def read_project_meta(project_id: str) -> Dict[str, Any]:
-    """读取项目的本地 meta.json（状态、错误信息、更新时间）"""
+    """读取项目的本地 meta.json（状态、错误信息、更新时间），优先走进程内缓存"""
+    with _META_CACHE_LOCK:
+        cached = _META_CACHE.get(project_id)
+        if cached is not None:
+            _META_CACHE.move_to_end(project_id)
+            return dict(cached)
+
     meta_path = get_project_meta_path(project_id)
     if not meta_path or not meta_path.exists():
         return {}
     try:
         with open(meta_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+            meta = jsonutil.loads(f.read())
     except Exception as e:
         logger.warning(f"读取项目 meta.json 失败 (project_id={project_id}): {e}")
         return {}
+    _cache_project_meta(project_id, meta)
+    return dict(meta)
+
+
+def _merge_project_meta(existing_meta: Dict[str, Any], status: Optional[str], error_message: Optional[str], updated_at: Optional[str], record_id: Optional[str]) -> Dict[str, Any]:
+    """在现有 meta 上合并传入的字段（只更新传入的参数）"""
+    new_meta = existing_meta.copy()
+
+    if status is not None:
+        new_meta["status"] = status
+    if error_message is not None:
+        new_meta["error_message"] = error_message
+    if updated_at is not None:
+        new_meta["updated_at"] = updated_at
+    else:
+        # 如果没有传入 updated_at，自动设为当前时间（ISO 格式）
+        new_meta["updated_at"] = datetime.now().isoformat()
+
+    # 更新 record_id（如果传入）；没传入时保留现有值
+    if record_id is not None:
+        new_meta["record_id"] = record_id
+
+    return new_meta
+
+
+def _meta_tmp_path(meta_path: Path) -> Path:
+    """meta.json 的临时文件路径（先写临时文件再原子替换，避免并发读取到写了一半的 meta.json）"""
+    return meta_path.with_name(f"{meta_path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+
+
+def _discard_meta_write(project_id: str, tmp_path: Path) -> None:
+    """写入失败时清理临时文件并使缓存失效"""
+    with _META_CACHE_LOCK:
+        _META_CACHE.pop(project_id, None)
+    try:
+        tmp_path.unlink()
+    except OSError:
+        pass
 
 
 def write_project_meta(project_id: str, status: Optional[str] = None, error_message: Optional[str] = None, updated_at: Optional[str] = None, record_id: Optional[str] = None) -> bool:
@@ -631,41 +951,181 @@ def write_project_meta(project_id: str, status: Optional[str] = None, error_mess
     # 确保项目目录存在
     meta_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # 读取现有 meta（如果有）
-    existing_meta = read_project_meta(project_id)
-    
-    # 构建新的 meta
-    new_meta = existing_meta.copy()
-    
-    # 更新字段（只更新传入的参数）
-    if status is not None:
-        new_meta["status"] = status
-    if error_message is not None:
-        new_meta["error_message"] = error_message
-    if updated_at is not None:
-        new_meta["updated_at"] = updated_at
-    else:
-        # 如果没有传入 updated_at，自动设为当前时间（ISO 格式）
-        new_meta["updated_at"] = datetime.now().isoformat()
-    
-    # 更新 record_id（如果传入）
-    if record_id is not None:
-        new_meta["record_id"] = record_id
-    # 如果没传入但现有 meta 有，保留它
-    elif "record_id" not in new_meta and existing_meta.get("record_id"):
-        new_meta["record_id"] = existing_meta["record_id"]
-    
+    # 读取、合并、写盘、更新缓存作为一个整体在锁内完成，避免并发更新相互覆盖
+    with _meta_write_lock(project_id):
+        new_meta = _merge_project_meta(read_project_meta(project_id), status, error_message, updated_at, record_id)
+
+        tmp_path = _meta_tmp_path(meta_path)
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(jsonutil.dumps_bytes(new_meta, indent=True))
+            os.replace(tmp_path, meta_path)
+        except Exception as e:
+            logger.error(f"写入项目 meta.json 失败 (project_id={project_id}): {e}")
+            _discard_meta_write(project_id, tmp_path)
+            return False
+        _cache_project_meta(project_id, new_meta)
+    return True
+
+
+async def aread_project_meta(project_id: str) -> Dict[str, Any]:
+    """read_project_meta 的异步版本，供事件循环中的调用方使用（缓存未命中时用 aiofiles 读盘）"""
+    with _META_CACHE_LOCK:
+        cached = _META_CACHE.get(project_id)
+        if cached is not None:
+            _META_CACHE.move_to_end(project_id)
+            return dict(cached)
+
+    meta_path = await asyncio.to_thread(get_project_meta_path, project_id)
+    if not meta_path or not await asyncio.to_thread(meta_path.exists):
+        return {}
     try:
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(new_meta, f, ensure_ascii=False, indent=2)
-        return True
+        async with aiofiles.open(meta_path, "rb") as f:
+            meta = jsonutil.loads(await f.read())
     except Exception as e:
-        logger.error(f"写入项目 meta.json 失败 (project_id={project_id}): {e}")
-        return False
+        logger.warning(f"读取项目 meta.json 失败 (project_id={project_id}): {e}")
+        return {}
+    _cache_project_meta(project_id, meta)
+    return dict(meta)
+
+
+async def awrite_project_meta(project_id: str, status: Optional[str] = None, error_message: Optional[str] = None, updated_at: Optional[str] = None, record_id: Optional[str] = None) -> bool:
+    """
+    write_project_meta 的异步版本，参数与返回值相同
+
+    整个读-改-写在一次线程池调用中完成（持有项目的 meta 写锁），不阻塞事件循环，
+    也不会在读取与写入之间让出事件循环导致并发更新丢失
+    """
+    return await asyncio.to_thread(write_project_meta, project_id, status, error_message, updated_at, record_id)
+
+
+# 批量解析时并发预读 meta.json 的线程池（模块级共享，避免每次请求创建/销毁线程）
+META_PREFETCH_WORKERS = 16
+_META_PREFETCH_POOL = ThreadPoolExecutor(max_workers=META_PREFETCH_WORKERS, thread_name_prefix="meta")
+
+# parse_feishu_record_to_task 的 db_task 参数默认值：表示调用方未预先查询，需自行查库
+_DB_TASK_UNSET: Any = object()
+
+
+def _load_batch_task(project_id: str) -> Optional[BatchTask]:
+    """查询单个项目的 BatchTask，失败返回 None"""
+    try:
+        with Session(engine) as session:
+            return session.exec(select(BatchTask).where(BatchTask.project_id == project_id)).first()
+    except Exception as e:
+        logger.warning(f"读取数据库失败: {e}")
+        return None
+
 
+# 本地存储根目录（绝对路径），用于把项目目录转换为 /storage/ 下的 URL
+_UPLOADS_PATH = Path(os.getenv("LOCAL_STORAGE_PATH", "./data/uploads")).resolve()
 
-def parse_feishu_record_to_task(record: Dict) -> Dict:
-    """将飞书记录转换为批量任务格式"""
+# generating_segment_<段索引> 状态
+_GEN_SEG_RE = re.compile(r"^generating_segment_(\d+)$")
+
+# 发布日期字符串中需要去掉的分隔符（YYYY-MM-DD / YYYY/MM/DD -> YYYYMMDD）
+_DATE_SEPARATORS = str.maketrans("", "", "-/")
+
+# V1 结构的最终视频 URL：/storage/projects/<project_id>/...
+_V1_URL_RE = re.compile(r'/storage/projects/([^/]+)/')
+
+# generating 状态“过期阈值”（秒）。超过阈值则不再展示为 generating，改为按数据推断，避免“假转圈”。
+try:
+    _GENERATING_STALE_SEC = int(os.getenv("BATCH_GENERATING_STALE_SEC", "900"))  # 默认 15 分钟
+except ValueError:
+    _GENERATING_STALE_SEC = 900
+
+# 批量任务的合法状态，不在其中的状态按数据推断
+_VALID_TASK_STATUSES = frozenset({
+    "pending", "storyboard_generating", "storyboard_ready",
+    "generating_segment_0", "generating_segment_1", "generating_segment_2",
+    "generating_segment_3", "generating_segment_4", "generating_segment_5",
+    "generating_segment_6", "generating_segment_7", "all_segments_ready",
+    "merging", "completed", "failed", "image_failed",
+})
+
+
+def _parse_updated_at_epoch_seconds(v: Any) -> Optional[float]:
+    """尽量将 updated_at 转为 epoch 秒；失败返回 None。"""
+    # 数值（秒或毫秒）
+    if isinstance(v, (int, float)):
+        vv = float(v)
+        return vv / 1000.0 if vv > 1e12 else vv
+    if not isinstance(v, str):
+        return None
+    return _parse_updated_at_str(v)
+
+
+@lru_cache(maxsize=4096)
+def _parse_updated_at_str(v: str) -> Optional[float]:
+    """解析字符串形式的 updated_at；批量解析时大量记录的时间戳相同，按原始字符串缓存结果"""
+    s = v.strip()
+    if not s:
+        return None
+    try:
+        # 纯数字字符串（秒或毫秒）；isdigit() 对 "²"、阿拉伯-印度数字等也为真，float() 会抛 ValueError
+        if s.isdigit():
+            vv = float(s)
+            return vv / 1000.0 if vv > 1e12 else vv
+        # ISO 8601（兼容 Z 后缀）
+        if s[-1] == "Z":
+            s = s[:-1] + "+00:00"
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_feishu_records_to_tasks(records: List[Dict]) -> List[Dict]:
+    """批量转换飞书记录：一次 IN 查询取出所有相关项目的 BatchTask，避免逐条开会话查库"""
+    project_ids = {record.get("fields", {}).get("project_id", "") for record in records}
+    project_ids.discard("")
+    
+    tasks_by_project: Dict[str, BatchTask] = {}
+    # 本批次共享的存储路径/本地文件探测结果
+    cache: Dict = {}
+    if project_ids:
+        try:
+            with Session(engine) as session:
+                statement = select(BatchTask).where(BatchTask.project_id.in_(project_ids))
+                tasks_by_project = {task.project_id: task for task in session.exec(statement).all()}
+        except Exception as e:
+            logger.warning(f"读取数据库失败: {e}")
+
+    # 并发预读各项目的 meta.json（缓存未命中时需读盘），避免逐条串行读文件
+    metas: Dict[str, Dict[str, Any]] = {}
+    if project_ids:
+        ordered_ids = list(project_ids)
+        metas = dict(zip(ordered_ids, _META_PREFETCH_POOL.map(read_project_meta, ordered_ids)))
+
+    # 整批记录使用同一个当前时间判断 generating 状态的新鲜度
+    now = time.time()
+    
+    return [
+        parse_feishu_record_to_task(
+            record,
+            db_task=tasks_by_project.get(record.get("fields", {}).get("project_id", "")),
+            cache=cache,
+            local_meta=metas.get(record.get("fields", {}).get("project_id", ""), {}),
+            now=now,
+        )
+        for record in records
+    ]
+
+
+def parse_feishu_record_to_task(record: Dict, db_task: Optional[BatchTask] = _DB_TASK_UNSET, cache: Optional[Dict] = None, local_meta: Optional[Dict[str, Any]] = None, now: Optional[float] = None) -> Dict:
+    """
+    将飞书记录转换为批量任务格式
+
+    db_task: 调用方已查询好的 BatchTask（None 表示数据库中不存在）；不传时按 project_id 查库
+    cache: 批量解析时共享的存储路径/本地文件探测缓存；不传时仅在本条记录内复用
+    local_meta: 调用方已预读的 meta.json 内容；不传时自行读取
+    now: 当前 epoch 秒（批量解析时由调用方统一传入）；不传时取 time.time()
+    """
+    if cache is None:
+        cache = {}
     fields = record.get("fields", {})
     record_id = record.get("record_id", "")
 
@@ -685,30 +1145,23 @@ def parse_feishu_record_to_task(record: Dict) -> Dict:
     # 解析 project_id（后续多处使用）
     project_id = fields.get("project_id", "")
 
+    # 项目存储路径（V2 结构：从数据库获取路径），每条记录只解析一次，后续多处复用
+    project_storage_path = _resolve_project_storage_path(project_id, cache) if project_id else None
+
     # ======== 数据源原则：优先本地，飞书只做索引/同步 ========
     # 1) 首帧：优先本地 opening_image.jpg（V2 结构：从数据库获取路径）
     opening_image = ""
-    if project_id:
-        from pathlib import Path
-        import os
-        # 使用 ProjectPathService 获取项目路径
+    if project_storage_path:
         try:
-            from paretoai.services.project_path_service import get_project_path_service
-            path_service = get_project_path_service()
-            project_storage_path = path_service.get_project_storage_path(project_id)
-
-            if project_storage_path:
-                local_opening = Path(project_storage_path) / "opening_image.jpg"
-                if local_opening.exists():
-                    # V2 结构：使用完整的相对路径生成 URL
-                    # project_storage_path = /Users/.../data/uploads/projects/2026-01-24/eating-template/13748642fd3a
-                    # 需要转换成 /storage/projects/2026-01-24/eating-template/13748642fd3a/opening_image.jpg
-                    uploads_path_str = os.getenv("LOCAL_STORAGE_PATH", "./data/uploads")
-                    uploads_path = Path(uploads_path_str).resolve()  # 转换为绝对路径
-                    relative_path = Path(project_storage_path).relative_to(uploads_path)
-                    opening_image = f"/storage/{relative_path}/opening_image.jpg"
+            local_opening = Path(project_storage_path) / "opening_image.jpg"
+            if local_opening.exists():
+                # V2 结构：使用完整的相对路径生成 URL
+                # project_storage_path = /Users/.../data/uploads/projects/2026-01-24/eating-template/13748642fd3a
+                # 需要转换成 /storage/projects/2026-01-24/eating-template/13748642fd3a/opening_image.jpg
+                relative_path = Path(project_storage_path).relative_to(_UPLOADS_PATH)
+                opening_image = f"/storage/{relative_path}/opening_image.jpg"
         except Exception as e:
-            logger.warning(f"从数据库获取项目路径失败: {e}")
+            logger.warning(f"生成本地首帧 URL 失败: {e}")
 
     # fallback：飞书字段（可能是附件或文本URL）
     if not opening_image:
@@ -719,8 +1172,7 @@ def parse_feishu_record_to_task(record: Dict) -> Dict:
             opening_image = opening_image.get("url", "")
 
         # 飞书附件URL -> 后端代理
-        if opening_image and ("open.feishu.cn" in opening_image or "feishu.cn/open-apis/drive" in opening_image):
-            from urllib.parse import quote
+        if opening_image and _is_feishu_attachment_url(opening_image):
             opening_image = f"/proxy/image?url={quote(opening_image)}"
 
     # 解析分段数
@@ -737,57 +1189,46 @@ def parse_feishu_record_to_task(record: Dict) -> Dict:
     
     storyboard_json = ""
     db_segment_urls = None
-    db_task = None
     
     if project_id:
-        try:
-            from sqlmodel import Session, select
-            from paretoai.models import BatchTask
-            from paretoai.db import engine
+        if db_task is _DB_TASK_UNSET:
+            db_task = _load_batch_task(project_id)
+        
+        if db_task:
+            # 【唯一数据源】从数据库获取 segment_urls
+            if db_task.segment_urls:
+                try:
+                    db_segment_urls = jsonutil.loads(db_task.segment_urls)
+                except ValueError as e:
+                    logger.warning(f"解析 segment_urls 失败: {e}")
+                    db_segment_urls = {}
             
-            with Session(engine) as session:
-                statement = select(BatchTask).where(BatchTask.project_id == project_id)
-                db_task = session.exec(statement).first()
-                
-                if db_task:
-                    # 【唯一数据源】从数据库获取 segment_urls
-                    if db_task.segment_urls:
-                        try:
-                            db_segment_urls = json.loads(db_task.segment_urls)
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"解析 segment_urls 失败: {e}")
-                            db_segment_urls = {}
-                    
-                    # 分镜脚本内容（用于显示 prompt 等）
-                    if db_task.storyboard_json:
-                        storyboard_json = db_task.storyboard_json
-                    
-                    logger.debug(f"从数据库读取任务数据: {project_id}")
-                else:
-                    logger.debug(f"数据库中未找到项目: {project_id}")
-                    
-        except Exception as e:
-            logger.warning(f"读取数据库失败: {e}")
+            # 分镜脚本内容（用于显示 prompt 等）
+            if db_task.storyboard_json:
+                storyboard_json = db_task.storyboard_json
+            
+            logger.debug(f"从数据库读取任务数据: {project_id}")
+        else:
+            logger.debug(f"数据库中未找到项目: {project_id}")
     
     # 如果数据库没有 storyboard_json，fallback 到飞书（仅用于初始导入）
     if not storyboard_json:
         storyboard_json = fields.get("storyboard_json", "")
         if isinstance(storyboard_json, dict):
-            storyboard_json = json.dumps(storyboard_json)
+            storyboard_json = jsonutil.dumps(storyboard_json)
 
     # ========================================================================
     # 【简化】segments 只从数据库 segment_urls 读取
+    # 状态与 URL 分别存放，状态判断只用 seg_statuses；返回前再组装为 segments 字典列表
     # ========================================================================
-    segments = []
+    seg_statuses: List[str] = []
+    seg_urls: List[Tuple[str, str, str]] = []
     
     if db_segment_urls:
         # 数据库有数据，直接使用
         for i in range(segment_count):
-            seg_key = f"segment_{i}"
-            db_seg = db_segment_urls.get(seg_key, {})
+            db_seg = db_segment_urls.get(f"segment_{i}", {})
             video_url = db_seg.get("video_url", "")
-            first_frame_url = db_seg.get("first_frame_url", "")
-            last_frame_url = db_seg.get("last_frame_url", "")
             seg_status = db_seg.get("status", "pending")
             
             # 状态校验：如果有视频URL但状态不是completed，修正状态
@@ -796,31 +1237,29 @@ def parse_feishu_record_to_task(record: Dict) -> Dict:
             elif not video_url and seg_status == "completed":
                 seg_status = "pending"
             
-            segments.append({
-                "videoUrl": video_url,
-                "firstFrameUrl": first_frame_url,
-                "lastFrameUrl": last_frame_url,
-                "status": seg_status
-            })
+            seg_statuses.append(seg_status)
+            seg_urls.append((video_url, db_seg.get("first_frame_url", ""), db_seg.get("last_frame_url", "")))
     else:
         # 数据库没有 segment_urls，初始化为 pending 状态
         # 注意：这种情况只应该出现在新项目或数据迁移时
-        for i in range(segment_count):
-            segments.append({
-                "videoUrl": "",
-                "firstFrameUrl": "",
-                "lastFrameUrl": "",
-                "status": "pending"
-            })
+        seg_count = max(segment_count, 0)
+        seg_statuses = ["pending"] * seg_count
+        seg_urls = [("", "", "")] * seg_count
         logger.debug(f"项目 {project_id} 无 segment_urls，初始化为 pending")
 
     # 计算进度
-    completed_segments = sum(1 for s in segments if s.get("status") == "completed")
+    num_segments = len(seg_statuses)
+    completed_segments = seg_statuses.count("completed")
+    # 以下状态判断复用计数结果，不再反复遍历段状态
+    # （后面只会把未完成的段重置为 pending，不影响已完成段数）
+    any_completed = completed_segments > 0
+    all_completed = num_segments > 0 and completed_segments == num_segments
     progress = f"{completed_segments}/{segment_count}段已完成"
 
     # 确定状态（注意：飞书的 generating_* 可能是历史遗留，需要做“新鲜度”判断）
     # ======== 优先读取本地 meta.json（数据源：本地优先） ========
-    local_meta = read_project_meta(project_id) if project_id else {}
+    if local_meta is None:
+        local_meta = read_project_meta(project_id) if project_id else {}
     
     # 确定状态：优先本地 meta.json，fallback 到飞书
     status = local_meta.get("status") or fields.get("status", "pending")
@@ -828,171 +1267,104 @@ def parse_feishu_record_to_task(record: Dict) -> Dict:
     # updated_at：优先本地 meta.json（ISO 格式），fallback 到飞书
     updated_at_raw = local_meta.get("updated_at") or fields.get("updated_at")
 
-    def _parse_updated_at_epoch_seconds(v):
-        """尽量将 updated_at 转为 epoch 秒；失败返回 None。"""
-        if v is None:
-            return None
-        try:
-            # 数值（秒或毫秒）
-            if isinstance(v, (int, float)):
-                vv = float(v)
-                return vv / 1000.0 if vv > 1e12 else vv
-            if isinstance(v, str):
-                s = v.strip()
-                if not s:
-                    return None
-                # 纯数字字符串（秒或毫秒）
-                if s.isdigit():
-                    vv = float(s)
-                    return vv / 1000.0 if vv > 1e12 else vv
-                # ISO 8601
-                from datetime import datetime, timezone
-                # 兼容 Z
-                if s.endswith("Z"):
-                    s = s[:-1] + "+00:00"
-                dt = datetime.fromisoformat(s)
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-                return dt.timestamp()
-        except Exception:
-            return None
-        return None
-
-    # generating 状态“过期阈值”（秒）。超过阈值则不再展示为 generating，改为按数据推断，避免“假转圈”。
-    try:
-        stale_sec = int(os.getenv("BATCH_GENERATING_STALE_SEC", "900"))  # 默认 15 分钟
-    except Exception:
-        stale_sec = 900
-    import time as _time
     updated_at_epoch = _parse_updated_at_epoch_seconds(updated_at_raw)
     generating_fresh = (
-        updated_at_epoch is not None and (_time.time() - updated_at_epoch) <= stale_sec
+        updated_at_epoch is not None and ((time.time() if now is None else now) - updated_at_epoch) <= _GENERATING_STALE_SEC
     )
 
     # 根据实际数据推断状态（覆盖飞书存储的可能过时的状态）
     # 优先级：completed > all_segments_ready > storyboard_ready > pending
-    def infer_status_from_data():
-        if fields.get("final_video_url"):
-            return "completed"
-        elif all(s.get("status") == "completed" for s in segments) and len(segments) > 0:
-            return "all_segments_ready"
-        elif storyboard_json:
-            # 有分镜就绪，可以生成下一段（不使用 generating_segment_X，那只在实际生成时由后端设置）
-            return "storyboard_ready"
-        else:
-            return "pending"
+    # 有分镜就绪时为 storyboard_ready，可以生成下一段（不使用 generating_segment_X，那只在实际生成时由后端设置）
+    # 推断依据（最终视频、已完成段数、分镜）在下面的状态修正中都不会改变，只需计算一次
+    has_final_video = bool(fields.get("final_video_url"))
+    if has_final_video:
+        inferred_status = "completed"
+    elif all_completed:
+        inferred_status = "all_segments_ready"
+    elif storyboard_json:
+        inferred_status = "storyboard_ready"
+    else:
+        inferred_status = "pending"
 
     # 防御性修复：如果飞书里写了 all_segments_ready，但实际段并未全部 completed，则按数据重新推断
     if status == "all_segments_ready":
-        if not (fields.get("final_video_url") or (len(segments) > 0 and all(s.get("status") == "completed" for s in segments))):
-            status = infer_status_from_data()
+        if not (has_final_video or all_completed):
+            status = inferred_status
 
     # 如果状态是 "failed" 但实际有视频数据，重新判断
     if status == "failed":
         has_video_data = (
-            fields.get("final_video_url") or
-            any(s.get("status") == "completed" for s in segments) or
+            has_final_video or
+            any_completed or
             any(fields.get(f"segment_{i}_video_url") for i in range(segment_count))
         )
         if has_video_data:
-            status = infer_status_from_data()
+            status = inferred_status
 
     # generating_segment_X / storyboard_generating / merging：
     # 只有当状态“足够新鲜”时才展示 generating；否则视为过期，按数据推断，避免误导。
-    if status.startswith("generating_segment_") and generating_fresh:
-        try:
-            seg_idx = int(status.split("_")[-1])
-        except Exception:
-            seg_idx = None
+    gen_seg_match = _GEN_SEG_RE.match(status)
+    if gen_seg_match and generating_fresh:
+        seg_idx = int(gen_seg_match.group(1))
 
         # 关键修复：不再提前标记段为 generating，先检查段是否有视频
 
         # 若该段已有视频或已合成，则认为生成不再“进行中”
         seg_has_video = (
-            seg_idx is not None and 0 <= seg_idx < len(segments) and bool(segments[seg_idx].get("videoUrl"))
+            0 <= seg_idx < num_segments and bool(seg_urls[seg_idx][0])
         )
         # 关键修复：即使 generating_fresh 为 true，如果该段没有视频，也应该推断状态
         # 避免"假转圈"：状态显示正在生成，但实际没有视频在生成
-        if fields.get("final_video_url") or seg_has_video:
+        if has_final_video or seg_has_video:
             # 该段已有视频或已合成，推断状态
-            status = infer_status_from_data()
-        elif seg_idx is not None and 0 <= seg_idx < len(segments):
+            status = inferred_status
+        elif 0 <= seg_idx < num_segments:
             # 该段没有视频，即使状态"新鲜"也应该推断（可能是之前生成失败或取消）
-            status = infer_status_from_data()
+            status = inferred_status
             # 同时将该段的状态重置为 pending（避免显示转圈图标）
-            if segments[seg_idx].get("status") != "completed":
-                segments[seg_idx]["status"] = "pending"
+            if seg_statuses[seg_idx] != "completed":
+                seg_statuses[seg_idx] = "pending"
         else:
-            # 无法确定段索引，推断状态
-            status = infer_status_from_data()
+            # 段索引超出范围，推断状态
+            status = inferred_status
 
     elif status in ("storyboard_generating", "merging") and generating_fresh:
         # 若已经有最终/所有段产出，则覆盖；否则保留“进行中”
-        if fields.get("final_video_url") or all(s.get("status") == "completed" for s in segments):
-            status = infer_status_from_data()
+        if has_final_video or completed_segments == num_segments:
+            status = inferred_status
     else:
         # generating 状态过期或无法判断新鲜度 → 统一按数据推断
-        if status.startswith("generating_segment_") or status in ("storyboard_generating", "merging"):
-            status = infer_status_from_data()
+        if gen_seg_match or status in ("storyboard_generating", "merging"):
+            status = inferred_status
 
     # 如果状态不在预定义列表中，根据数据推断
-    valid_statuses = [
-        "pending", "storyboard_generating", "storyboard_ready",
-        "generating_segment_0", "generating_segment_1", "generating_segment_2",
-        "generating_segment_3", "generating_segment_4", "generating_segment_5",
-        "generating_segment_6", "generating_segment_7", "all_segments_ready",
-        "merging", "completed", "failed", "image_failed"
-    ]
-    if status not in valid_statuses:
-        status = infer_status_from_data()
+    if status not in _VALID_TASK_STATUSES:
+        status = inferred_status
 
     # 最终视频 URL：优先飞书字段，其次本地项目目录（V2 结构：从数据库获取路径）
+    # 飞书已有 URL 时不探测本地文件；本地生成的 URL 已是 V2 格式，无需再做 V1 兼容
     final_video_url = fields.get("final_video_url", "") or ""
-    if not final_video_url and project_id:
-        try:
-            from pathlib import Path
-            import os
-            # 使用 ProjectPathService 获取项目路径
-            from paretoai.services.project_path_service import get_project_path_service
-            path_service = get_project_path_service()
-            project_storage_path = path_service.get_project_storage_path(project_id)
-
-            if project_storage_path:
-                local_final = Path(project_storage_path) / "final_video.mp4"
-                if local_final.exists():
-                    # V2 结构：使用完整的相对路径生成 URL
-                    uploads_path = Path(os.getenv("LOCAL_STORAGE_PATH", "./data/uploads")).resolve()
-                    relative_path = Path(project_storage_path).relative_to(uploads_path)
-                    final_video_url = f"/storage/{relative_path}/final_video.mp4"
-        except Exception:
-            pass
-
-    # 修复 final_video_url 中的 project_id（如果存在）
-    # 向后兼容：处理飞书中存储的 V1 格式 URL
-    if final_video_url and project_id and "/storage/projects/" in final_video_url:
-        import re
-        match = re.search(r'/storage/projects/([^/]+)/', final_video_url)
-        if match:
-            url_project_id = match.group(1)
-            if url_project_id != project_id:
-                logger.warning(f"检测到 V1 格式 URL，尝试重新生成 V2 格式: project_id={url_project_id} -> {project_id} (record_id={record_id})")
-                # 尝试从本地项目重新生成 V2 格式 URL
-                try:
-                    from pathlib import Path
-                    import os
-                    from paretoai.services.project_path_service import get_project_path_service
-                    path_service = get_project_path_service()
-                    project_storage_path = path_service.get_project_storage_path(project_id)
-
-                    if project_storage_path:
-                        local_final = Path(project_storage_path) / "final_video.mp4"
-                        if local_final.exists():
-                            uploads_path = Path(os.getenv("LOCAL_STORAGE_PATH", "./data/uploads")).resolve()
-                            relative_path = Path(project_storage_path).relative_to(uploads_path)
-                            final_video_url = f"/storage/{relative_path}/final_video.mp4"
+    if final_video_url:
+        # 修复 final_video_url 中的 project_id（如果存在）
+        # 向后兼容：处理飞书中存储的 V1 格式 URL；project_id 一致（常见情况）时跳过正则匹配
+        if (
+            project_id
+            and "/storage/projects/" in final_video_url
+            and f"/storage/projects/{project_id}/" not in final_video_url
+        ):
+            match = _V1_URL_RE.search(final_video_url)
+            if match:
+                url_project_id = match.group(1)
+                if url_project_id != project_id:
+                    # 尝试从本地项目重新生成 V2 格式 URL
+                    local_url = _local_final_video_url(project_storage_path, cache) if project_storage_path else ""
+                    if local_url != final_video_url:
+                        logger.warning(f"检测到 V1 格式 URL，尝试重新生成 V2 格式: project_id={url_project_id} -> {project_id} (record_id={record_id})")
+                        if local_url:
+                            final_video_url = local_url
                             logger.info(f"✅ 已重新生成 V2 格式 URL: {final_video_url}")
-                except Exception as e:
-                    logger.warning(f"重新生成 V2 URL 失败，保留原 URL: {e}")
+    elif project_storage_path:
+        final_video_url = _local_final_video_url(project_storage_path, cache)
 
     # 关键：只要最终视频存在，就视为已完成（避免飞书 status 仍停留在 all_segments_ready）
     if final_video_url:
@@ -1013,14 +1385,23 @@ def parse_feishu_record_to_task(record: Dict) -> Dict:
         if isinstance(publish_date, (int, float)):
             # 数字格式，转换为日期字符串 YYYYMMDD
             try:
-                from datetime import datetime
                 dt = datetime.fromtimestamp(publish_date / 1000 if publish_date > 1e12 else publish_date)
-                publish_date = dt.strftime("%Y%m%d")
-            except Exception:
+                publish_date = f"{dt.year:04d}{dt.month:02d}{dt.day:02d}"
+            except (OverflowError, OSError, ValueError):
                 publish_date = ""
         elif isinstance(publish_date, str):
-            # 字符串格式，直接使用或清理
-            publish_date = publish_date.strip().replace("-", "").replace("/", "")
+            # 字符串格式，直接使用或清理（去掉 - 和 /）
+            publish_date = publish_date.strip().translate(_DATE_SEPARATORS)
+
+    segments = [
+        {
+            "videoUrl": video_url,
+            "firstFrameUrl": first_frame_url,
+            "lastFrameUrl": last_frame_url,
+            "status": seg_status,
+        }
+        for (video_url, first_frame_url, last_frame_url), seg_status in zip(seg_urls, seg_statuses)
+    ]
 
     return {
         "id": record_id,
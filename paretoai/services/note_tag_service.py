@@ -0,0 +1,20 @@
+"""
+笔记标签工具
+
+提取小红书笔记正文中的 #话题 标签
+"""
+import re
+from typing import List, Optional
+
+# 小红书话题标签：#标签 或 #标签[话题]
+TAG_RE = re.compile(r'#[^\s#\[]+(?:\[话题\])?')
+
+
+def extract_note_tags(content: Optional[str]) -> List[str]:
+    """从笔记正文中提取去重后的标签（保持出现顺序，去掉 [话题] 后缀）"""
+    if not content or "#" not in content:
+        return []
+    tags = dict.fromkeys(
+        tag for tag in (raw.replace('[话题]', '').strip() for raw in TAG_RE.findall(content)) if tag
+    )
+    return list(tags)
@@ -6,6 +6,8 @@
 2. 如果项目已被锁定，返回失败
 3. 操作完成后释放锁
 4. 支持锁超时自动释放（防止死锁）
+5. 支持细粒度资源锁（如 segment_3），不同段的操作可并行；
+   项目级锁与该项目的任意资源锁互斥
 
 使用方式：
     lock_service = get_project_lock_service()
@@ -22,12 +24,17 @@
             pass
         finally:
             lock_service.release_lock(project_id)
+
+    # 方式3：段级锁（只锁定单个段，其他段的操作不受影响）
+    async with lock_service.acquire_lock(project_id, "edit_regenerate", resource="segment_3"):
+        pass
 """
 import asyncio
 import logging
 import time
+import weakref
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 
@@ -42,6 +49,7 @@ class LockInfo:
     locked_at: datetime
     expires_at: datetime
     holder_id: str  # 持有者标识（用于调试）
+    resource: Optional[str] = None  # 锁定的资源（None 表示整个项目）
 
 
 class ProjectLockService:
@@ -65,8 +73,52 @@ class ProjectLockService:
     }
     
     def __init__(self):
-        self._locks: Dict[str, LockInfo] = {}
+        self._locks: Dict[str, LockInfo] = {}  # key: project_id 或 "project_id:resource"
         self._lock = asyncio.Lock()  # 保护 _locks 字典的并发访问
+        # 项目数据（storyboard 等）短临界区锁；弱引用字典：无协程持有或等待时自动移除，不随项目数增长
+        self._data_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    @staticmethod
+    def _lock_key(project_id: str, resource: Optional[str] = None) -> str:
+        """生成锁键：项目级锁使用 project_id，资源锁使用 project_id:resource"""
+        return project_id if resource is None else f"{project_id}:{resource}"
+    
+    def _find_conflict(self, project_id: str, resource: Optional[str] = None) -> Optional[LockInfo]:
+        """
+        查找与请求冲突的未过期锁
+        
+        - 项目级请求（resource=None）：与该项目的任意锁冲突
+        - 资源级请求：与项目级锁或同一资源的锁冲突
+        """
+        project_lock = self._locks.get(project_id)
+        if project_lock and not self._is_lock_expired(project_lock):
+            return project_lock
+        
+        if resource is None:
+            prefix = f"{project_id}:"
+            for key, lock_info in self._locks.items():
+                if key.startswith(prefix) and not self._is_lock_expired(lock_info):
+                    return lock_info
+            return None
+        
+        resource_lock = self._locks.get(self._lock_key(project_id, resource))
+        if resource_lock and not self._is_lock_expired(resource_lock):
+            return resource_lock
+        return None
+    
+    def _purge_expired(self, project_id: str) -> None:
+        """清理指定项目已过期的锁（需在 self._lock 内调用）"""
+        prefix = f"{project_id}:"
+        expired = [
+            key for key, lock_info in self._locks.items()
+            if (key == project_id or key.startswith(prefix)) and self._is_lock_expired(lock_info)
+        ]
+        for key in expired:
+            lock_info = self._locks.pop(key)
+            logger.warning(
+                f"项目 {project_id} 的锁已过期，自动释放 "
+                f"(资源: {lock_info.resource or '整个项目'}, 原操作: {lock_info.operation}, 锁定于: {lock_info.locked_at})"
+            )
     
     def _get_timeout(self, operation: str) -> int:
         """获取操作的超时时间"""
@@ -86,6 +138,7 @@ class ProjectLockService:
         project_id: str,
         operation: str = "unknown",
         timeout: Optional[int] = None,
+        resource: Optional[str] = None,
     ) -> tuple[bool, Optional[str]]:
         """
         尝试获取项目锁
@@ -94,26 +147,40 @@ class ProjectLockService:
             project_id: 项目ID
             operation: 操作类型
             timeout: 锁超时时间（秒），None 则使用默认值
+            resource: 锁定的资源（如 "segment_3"），None 表示锁定整个项目
         
         Returns:
             (success, error_message)
             - success: 是否成功获取锁
             - error_message: 失败时的错误信息
         """
+        return await self.try_lock_many(project_id, [resource], operation, timeout)
+    
+    async def try_lock_many(
+        self,
+        project_id: str,
+        resources: List[Optional[str]],
+        operation: str = "unknown",
+        timeout: Optional[int] = None,
+    ) -> tuple[bool, Optional[str]]:
+        """
+        原子地获取同一项目的多个资源锁（全部成功或全部失败）
+        
+        Args:
+            project_id: 项目ID
+            resources: 资源列表（如 ["segment_2", "segment_3"]），None 表示整个项目
+            operation: 操作类型
+            timeout: 锁超时时间（秒），None 则使用默认值
+        
+        Returns:
+            (success, error_message)
+        """
         async with self._lock:
-            # 检查是否已有锁
-            existing_lock = self._locks.get(project_id)
+            self._purge_expired(project_id)
             
-            if existing_lock:
-                # 检查锁是否过期
-                if self._is_lock_expired(existing_lock):
-                    logger.warning(
-                        f"项目 {project_id} 的锁已过期，自动释放 "
-                        f"(原操作: {existing_lock.operation}, 锁定于: {existing_lock.locked_at})"
-                    )
-                    del self._locks[project_id]
-                else:
-                    # 锁未过期，返回失败
+            for resource in resources:
+                existing_lock = self._find_conflict(project_id, resource)
+                if existing_lock:
                     error_msg = (
                         f"项目正在处理中，请稍后再试。"
                         f"当前操作: {existing_lock.operation}，"
@@ -121,7 +188,7 @@ class ProjectLockService:
                     )
                     logger.warning(
                         f"项目 {project_id} 锁定失败: {error_msg} "
-                        f"(请求操作: {operation})"
+                        f"(请求操作: {operation}, 请求资源: {resource or '整个项目'})"
                     )
                     return False, error_msg
             
@@ -130,80 +197,123 @@ class ProjectLockService:
             now = datetime.utcnow()
             holder_id = self._generate_holder_id()
             
-            self._locks[project_id] = LockInfo(
-                project_id=project_id,
-                operation=operation,
-                locked_at=now,
-                expires_at=now + timedelta(seconds=lock_timeout),
-                holder_id=holder_id,
-            )
+            for resource in resources:
+                self._locks[self._lock_key(project_id, resource)] = LockInfo(
+                    project_id=project_id,
+                    operation=operation,
+                    locked_at=now,
+                    expires_at=now + timedelta(seconds=lock_timeout),
+                    holder_id=holder_id,
+                    resource=resource,
+                )
             
             logger.info(
                 f"项目 {project_id} 已锁定 "
-                f"(操作: {operation}, 超时: {lock_timeout}s, holder: {holder_id})"
+                f"(资源: {', '.join(r or '整个项目' for r in resources)}, "
+                f"操作: {operation}, 超时: {lock_timeout}s, holder: {holder_id})"
             )
             return True, None
     
-    async def release_lock(self, project_id: str, holder_id: Optional[str] = None) -> bool:
+    async def release_lock(
+        self,
+        project_id: str,
+        holder_id: Optional[str] = None,
+        resource: Optional[str] = None,
+    ) -> bool:
         """
         释放项目锁
         
         Args:
             project_id: 项目ID
             holder_id: 持有者ID（可选，用于验证）
+            resource: 锁定的资源（None 表示项目级锁）
         
         Returns:
             是否成功释放
         """
+        return await self.release_locks(project_id, [resource], holder_id)
+    
+    async def release_locks(
+        self,
+        project_id: str,
+        resources: List[Optional[str]],
+        holder_id: Optional[str] = None,
+    ) -> bool:
+        """
+        释放同一项目的多个资源锁
+        
+        Args:
+            project_id: 项目ID
+            resources: 资源列表（None 表示项目级锁）
+            holder_id: 持有者ID（可选，用于验证）
+        
+        Returns:
+            是否全部成功释放
+        """
+        released_all = True
         async with self._lock:
-            existing_lock = self._locks.get(project_id)
-            
-            if not existing_lock:
-                logger.debug(f"项目 {project_id} 没有锁，无需释放")
-                return True
-            
-            # 可选：验证持有者
-            if holder_id and existing_lock.holder_id != holder_id:
-                logger.warning(
-                    f"项目 {project_id} 锁释放失败: holder_id 不匹配 "
-                    f"(期望: {existing_lock.holder_id}, 实际: {holder_id})"
+            for resource in resources:
+                key = self._lock_key(project_id, resource)
+                existing_lock = self._locks.get(key)
+                
+                if not existing_lock:
+                    logger.debug(f"项目 {project_id} 没有锁 (资源: {resource or '整个项目'})，无需释放")
+                    continue
+                
+                # 可选：验证持有者
+                if holder_id and existing_lock.holder_id != holder_id:
+                    logger.warning(
+                        f"项目 {project_id} 锁释放失败: holder_id 不匹配 "
+                        f"(期望: {existing_lock.holder_id}, 实际: {holder_id})"
+                    )
+                    released_all = False
+                    continue
+                
+                del self._locks[key]
+                logger.info(
+                    f"项目 {project_id} 锁已释放 "
+                    f"(资源: {resource or '整个项目'}, 操作: {existing_lock.operation})"
                 )
-                return False
-            
-            del self._locks[project_id]
-            logger.info(f"项目 {project_id} 锁已释放 (操作: {existing_lock.operation})")
-            return True
+        return released_all
+    
+    def get_data_lock(self, project_id: str) -> asyncio.Lock:
+        """
+        获取项目数据锁（用于 storyboard 读-改-写等短临界区）
+        
+        段级锁允许不同段并行处理，但它们共享同一个 storyboard 文件，
+        读-改-写整份数据时需要用此锁串行化，避免相互覆盖。
+        调用方应直接 `async with get_data_lock(...)` 使用，不要长期保存返回的锁对象。
+        """
+        lock = self._data_locks.get(project_id)
+        if lock is None:
+            lock = self._data_locks[project_id] = asyncio.Lock()
+        return lock
     
-    def is_locked(self, project_id: str) -> bool:
+    def is_locked(self, project_id: str, resource: Optional[str] = None) -> bool:
         """
-        检查项目是否被锁定
+        检查项目（或项目内的资源）是否被锁定
         
         Args:
             project_id: 项目ID
+            resource: 资源（None 表示检查项目内任意锁）
         
         Returns:
             是否被锁定（不包括已过期的锁）
         """
-        lock_info = self._locks.get(project_id)
-        if not lock_info:
-            return False
-        
-        if self._is_lock_expired(lock_info):
-            return False
-        
-        return True
+        return self._find_conflict(project_id, resource) is not None
     
-    def get_lock_info(self, project_id: str) -> Optional[Dict[str, Any]]:
+    def get_lock_info(self, project_id: str, resource: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         获取项目锁信息
         
         Args:
             project_id: 项目ID
+            resource: 资源（None 表示项目级锁）
         
         Returns:
             锁信息字典，或 None
         """
-        lock_info = self._locks.get(project_id)
+        lock_info = self._locks.get(self._lock_key(project_id, resource))
         if not lock_info:
             return None
         
@@ -212,6 +322,7 @@ class ProjectLockService:
         
         return {
             "project_id": lock_info.project_id,
+            "resource": lock_info.resource,
             "operation": lock_info.operation,
             "locked_at": lock_info.locked_at.isoformat(),
             "expires_at": lock_info.expires_at.isoformat(),
@@ -224,6 +335,7 @@ class ProjectLockService:
         project_id: str,
         operation: str = "unknown",
         timeout: Optional[int] = None,
+        resource: Optional[str] = None,
     ):
         """
         上下文管理器：获取锁并在完成后自动释放
@@ -236,7 +348,7 @@ class ProjectLockService:
         Raises:
             ProjectLockError: 如果无法获取锁
         """
-        success, error_msg = await self.try_lock(project_id, operation, timeout)
+        success, error_msg = await self.try_lock(project_id, operation, timeout, resource=resource)
         
         if not success:
             raise ProjectLockError(project_id, error_msg)
@@ -244,14 +356,16 @@ class ProjectLockService:
         try:
             yield
         finally:
-            await self.release_lock(project_id)
+            await self.release_lock(project_id, resource=resource)
     
     def get_all_locks(self) -> Dict[str, Dict[str, Any]]:
         """获取所有活跃的锁（用于调试/监控）"""
         result = {}
-        for project_id, lock_info in self._locks.items():
+        for lock_key, lock_info in self._locks.items():
             if not self._is_lock_expired(lock_info):
-                result[project_id] = {
+                result[lock_key] = {
+                    "project_id": lock_info.project_id,
+                    "resource": lock_info.resource,
                     "operation": lock_info.operation,
                     "locked_at": lock_info.locked_at.isoformat(),
                     "expires_at": lock_info.expires_at.isoformat(),
@@ -262,13 +376,13 @@ class ProjectLockService:
         """清理过期的锁（可定期调用）"""
         async with self._lock:
             expired = []
-            for project_id, lock_info in self._locks.items():
+            for lock_key, lock_info in self._locks.items():
                 if self._is_lock_expired(lock_info):
-                    expired.append(project_id)
+                    expired.append(lock_key)
             
-            for project_id in expired:
-                del self._locks[project_id]
-                logger.info(f"清理过期锁: {project_id}")
+            for lock_key in expired:
+                del self._locks[lock_key]
+                logger.info(f"清理过期锁: {lock_key}")
             
             return len(expired)
 
@@ -10,6 +10,7 @@
 3. 文件系统为人服务：目录结构对开发/运维友好
 """
 import os
+import time
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -33,6 +34,42 @@ class ProjectPathService:
         "adventure": "adventure",
     }
 
+    # 项目存储路径缓存（路径写入数据库后基本不变，避免每次请求都查库）
+    STORAGE_PATH_CACHE_MAX = 1024
+    _storage_path_cache: Dict[str, str] = {}
+    # 未注册项目的短期否定缓存: project_id -> 过期时间（monotonic），避免同一批请求反复查库
+    MISSING_PATH_CACHE_TTL = 30
+    _missing_path_cache: Dict[str, float] = {}
+
+    @classmethod
+    def _cache_storage_path(cls, project_id: str, storage_path: str) -> None:
+        """写入路径缓存（超出容量时淘汰最早写入的条目）"""
+        cache = cls._storage_path_cache
+        cache.pop(project_id, None)
+        if len(cache) >= cls.STORAGE_PATH_CACHE_MAX:
+            cache.pop(next(iter(cache)))
+        cache[project_id] = storage_path
+        cls._missing_path_cache.pop(project_id, None)
+
+    @classmethod
+    def _cache_missing_path(cls, project_id: str) -> None:
+        """记录未在数据库中找到的项目（TTL 内不再查库，其他进程创建的项目最多延迟 TTL 秒可见）"""
+        cache = cls._missing_path_cache
+        cache.pop(project_id, None)
+        if len(cache) >= cls.STORAGE_PATH_CACHE_MAX:
+            cache.pop(next(iter(cache)))
+        cache[project_id] = time.monotonic() + cls.MISSING_PATH_CACHE_TTL
+
+    @classmethod
+    def invalidate_storage_path_cache(cls, project_id: Optional[str] = None) -> None:
+        """使路径缓存失效（project_id 为空时清空全部）"""
+        if project_id is None:
+            cls._storage_path_cache.clear()
+            cls._missing_path_cache.clear()
+        else:
+            cls._storage_path_cache.pop(project_id, None)
+            cls._missing_path_cache.pop(project_id, None)
+
     @classmethod
     def get_storage_root(cls) -> Path:
         """获取存储根目录"""
@@ -141,6 +178,13 @@ class ProjectPathService:
         Returns:
             项目存储路径，如果不存在则返回 None
         """
+        cached = cls._storage_path_cache.get(project_id)
+        if cached:
+            return cached
+        missing_until = cls._missing_path_cache.get(project_id)
+        if missing_until is not None and time.monotonic() < missing_until:
+            return None
+
         with Session(engine) as session:
             statement = select(BatchTask.storage_path).where(
                 BatchTask.project_id == project_id
@@ -148,11 +192,50 @@ class ProjectPathService:
             result = session.exec(statement).first()
 
             if result:
+                cls._cache_storage_path(project_id, result)
                 return result
             else:
+                # 未注册的项目稍后可能被创建，只做短期否定缓存
+                cls._cache_missing_path(project_id)
                 logger.warning(f"Project {project_id} not found in database")
                 return None
 
+    @classmethod
+    def get_project_storage_paths(cls, project_ids: List[str]) -> Dict[str, str]:
+        """
+        批量获取项目存储路径（未命中缓存的项目用一次 IN 查询获取）
+
+        Args:
+            project_ids: 项目ID列表
+
+        Returns:
+            project_id -> 存储路径 的映射（不存在的项目不包含在结果中）
+        """
+        paths: Dict[str, str] = {}
+        missing: List[str] = []
+        for project_id in dict.fromkeys(project_ids):
+            cached = cls._storage_path_cache.get(project_id)
+            if cached:
+                paths[project_id] = cached
+            else:
+                missing.append(project_id)
+
+        if missing:
+            with Session(engine) as session:
+                statement = select(BatchTask.project_id, BatchTask.storage_path).where(
+                    BatchTask.project_id.in_(missing)
+                )
+                for project_id, storage_path in session.exec(statement):
+                    if storage_path and project_id not in paths:
+                        cls._cache_storage_path(project_id, storage_path)
+                        paths[project_id] = storage_path
+
+            not_found = [pid for pid in missing if pid not in paths]
+            if not_found:
+                logger.warning(f"Projects not found in database: {not_found}")
+
+        return paths
+
     @classmethod
     def get_or_create_storage_path(
         cls,
@@ -203,6 +286,7 @@ class ProjectPathService:
                 )
                 session.add(task)
                 session.commit()
+                cls._cache_storage_path(project_id, storage_path)
                 logger.info(f"Registered new project {project_id} in database with feishu association: table={feishu_table_id}, record={feishu_record_id}")
         except Exception as e:
             logger.error(f"Failed to register project {project_id} in database: {e}")
@@ -315,6 +399,7 @@ class ProjectPathService:
                     task.storage_path = storage_path
                     session.add(task)
                     session.commit()
+                    cls.invalidate_storage_path_cache(project_id)
                     logger.info(f"Updated storage_path for project {project_id}: {storage_path}")
                     return True
                 else:
@@ -366,6 +451,7 @@ class ProjectPathService:
                 )
                 session.add(task)
                 session.commit()
+                cls._cache_storage_path(project_id, storage_path)
                 logger.info(f"Registered new project {project_id} in database")
         except Exception as e:
             logger.error(f"Failed to register project {project_id}: {e}")